@@ -0,0 +1,93 @@
+"""Benchmark of reads with the block index against full reads, for analyses of growing date ranges, see block_index.
+Generated customers and orders files are sorted by date, like append only exports, then read for 1, 2, 4...
+intervals of 7 days up to the generated range: fully, and only the blocks of the date range. The index is built
+by the first read of each file, its build time is reported apart.
+
+    python -m benchmarks.bench_block_index --customers 1000000 --window-days 728
+"""
+
+import datetime
+import os
+import tempfile
+import time
+from benchmarks import generate_cohort_data as gcd
+from customer_order_cohort import block_index as bi
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+
+
+def sort_csv_file_by_date(path_csv_file: str, date_index: int):
+    """Sort the entries of a csv file by their date column, in place"""
+
+    with open(path_csv_file) as csv_file:
+        header, *lines = csv_file.readlines()
+    lines.sort(key=lambda line: line.split(',')[date_index])
+    with open(path_csv_file, mode='w') as csv_file:
+        csv_file.write(header)
+        csv_file.writelines(lines)
+
+
+def read_analysis(path_customers_csv_file: str, path_orders_csv_file: str, number_of_intervals: int,
+                  block_index: bool) -> otsa.OrderTimeSpanAggregation:
+    customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+        recent_date=gcd.RECENT_DATE - datetime.timedelta(days=1), days_interval_length=7,
+        number_of_intervals=number_of_intervals)
+    customers_cohorts.read_customers_csv_file(path_customers_csv_file, block_index=block_index)
+    orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+    orders_by_time_slot.read_orders_csv_file(path_orders_csv_file, block_index=block_index)
+    return orders_by_time_slot
+
+
+def time_read(read) -> (float, otsa.OrderTimeSpanAggregation):
+    """:returns seconds of a read function, and its result"""
+
+    start = time.perf_counter()
+    result = read()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = gcd.build_argument_parser()
+    parser.description = __doc__
+    parser.add_argument('--block-bytes', type=int, default=bi.BLOCK_BYTES, help='bytes of csv entries per block')
+    arguments = parser.parse_args()
+    bi.BLOCK_BYTES = arguments.block_bytes
+    generator = gcd.CohortDataGenerator(
+        customers=arguments.customers, window_days=arguments.window_days, orders_skew=arguments.orders_skew,
+        orders_scale=arguments.orders_scale, out_of_window_fraction=arguments.out_of_window_fraction,
+        malformed_fraction=arguments.malformed_fraction, shuffle_block=arguments.shuffle_block, seed=arguments.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path_customers = os.path.join(directory, 'customers.csv')
+        path_orders = os.path.join(directory, 'orders.csv')
+        generator.write_csv_files(path_customers, path_orders)
+        sort_csv_file_by_date(path_customers, 1)
+        sort_csv_file_by_date(path_orders, 3)
+        input_bytes = os.path.getsize(path_customers) + os.path.getsize(path_orders)
+        parse_date = ctsc.CustomerTimeSpanCohorts.parse_date_to_cacheable_seconds
+        index_seconds, _ = time_read(lambda: (bi.read_block_index(path_customers, (1, parse_date)),
+                                              bi.read_block_index(path_orders, (3, parse_date))))
+        print(f'{input_bytes / 2 ** 20:.1f} MiB sorted by date, {arguments.block_bytes} bytes per block,'
+              f' index built in {index_seconds:.3f}s')
+        print(f'{"intervals":>9} {"full s":>8} {"indexed s":>10} {"speedup":>8} {"read %":>7}')
+        number_of_intervals = 1
+        while True:
+            full_seconds, expected = time_read(
+                lambda: read_analysis(path_customers, path_orders, number_of_intervals, False))
+            indexed_seconds, result = time_read(
+                lambda: read_analysis(path_customers, path_orders, number_of_intervals, True))
+            if result.customer_group_to_order_accumulated.keys() != expected.customer_group_to_order_accumulated.keys() \
+                    or any(result.get_counts_for_cohort(cohort_key) != expected.get_counts_for_cohort(cohort_key)
+                           for cohort_key in expected.customer_group_to_order_accumulated):
+                raise AssertionError(f'indexed read differs from full read for {number_of_intervals} intervals')
+            window = result.customer_cohorts.get_utc_seconds_range()
+            read_bytes = sum(end - start for path, date_index in ((path_customers, 1), (path_orders, 3))
+                             for start, end in bi.select_byte_ranges(
+                                 bi.read_block_index(path, (date_index, parse_date)), *window)[0])
+            print(f'{number_of_intervals:9} {full_seconds:8.3f} {indexed_seconds:10.3f}'
+                  f' {full_seconds / indexed_seconds:8.2f} {100 * read_bytes / input_bytes:7.1f}')
+            if number_of_intervals * 7 >= generator.window_days:
+                break
+            number_of_intervals = min(2 * number_of_intervals, -(-generator.window_days // 7))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark of compressed csv input against today's uncompressed input, see csv_input.
+Generated customers and orders files are compressed with gzip, bzip2 and xz, then fully read:
+from the uncompressed files, from each compressed file decompressed in a background thread or inline,
+and after decompressing to disk first, the former way.
+
+    python -m benchmarks.bench_compressed_input --customers 1000000
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from benchmarks import bench_stages, generate_cohort_data as gcd
+from customer_order_cohort import csv_input
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+
+# compression name to the extension of its files
+EXTENSIONS = {'gzip': '.gz', 'bzip2': '.bz2', 'xz': '.xz'}
+
+
+def compress_file(path_file: str, compression: str) -> str:
+    """:returns path of a compressed copy of a file, next to it"""
+
+    path_compressed_file = path_file + EXTENSIONS[compression]
+    with open(path_file, mode='rb') as input_file, \
+            csv_input.COMPRESSIONS[compression][2](path_compressed_file, mode='wb') as output_file:
+        shutil.copyfileobj(input_file, output_file, csv_input.CHUNK_SIZE)
+    return path_compressed_file
+
+
+def decompress_file(path_compressed_file: str, path_file: str) -> str:
+    """:returns path_file, written with the content of a compressed file"""
+
+    with csv_input.open_csv_input(path_compressed_file) as input_file, open(path_file, mode='w') as output_file:
+        shutil.copyfileobj(input_file, output_file, csv_input.CHUNK_SIZE)
+    return path_file
+
+
+def read_analysis(path_customers_csv_file: str, path_orders_csv_file: str, window_days: int,
+                  background: bool = True) -> otsa.OrderTimeSpanAggregation:
+    """Read both csv files, as generated, with background decompression or not"""
+
+    customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+        recent_date=gcd.RECENT_DATE - datetime.timedelta(days=1), days_interval_length=7,
+        number_of_intervals=max(1, window_days // 7))
+    with csv_input.open_csv_input(path_customers_csv_file, background) as csv_file:
+        customers_cohorts.read_customers_csv_file(csv_file)
+    orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+    with csv_input.open_csv_input(path_orders_csv_file, background) as csv_file:
+        orders_by_time_slot.read_orders_csv_file(csv_file)
+    return orders_by_time_slot
+
+
+def time_read(read, measure_memory: bool) -> (float, float, int, otsa.OrderTimeSpanAggregation):
+    """:returns seconds and CPU seconds of a read function, its peak traced memory if measure_memory, its result"""
+
+    start, start_cpu = time.perf_counter(), time.process_time()
+    result = read()
+    seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - start_cpu
+    peak_memory_bytes = None
+    if measure_memory:
+        tracemalloc.start()
+        read()
+        peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, cpu_seconds, peak_memory_bytes, result
+
+
+def main():
+    parser = gcd.build_argument_parser()
+    parser.description = __doc__
+    parser.add_argument('--compression', nargs='+', choices=sorted(EXTENSIONS), default=sorted(EXTENSIONS),
+                        help='compressions to time')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory, twice faster')
+    arguments = parser.parse_args()
+    generator = gcd.CohortDataGenerator(
+        customers=arguments.customers, window_days=arguments.window_days, orders_skew=arguments.orders_skew,
+        orders_scale=arguments.orders_scale, out_of_window_fraction=arguments.out_of_window_fraction,
+        malformed_fraction=arguments.malformed_fraction, shuffle_block=arguments.shuffle_block, seed=arguments.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path_customers = os.path.join(directory, 'customers.csv')
+        path_orders = os.path.join(directory, 'orders.csv')
+        generator.write_csv_files(path_customers, path_orders)
+        rows = bench_stages.count_lines(path_customers) + bench_stages.count_lines(path_orders) - 2
+        input_bytes = os.path.getsize(path_customers) + os.path.getsize(path_orders)
+        reads = [('uncompressed', input_bytes, lambda: read_analysis(path_customers, path_orders, generator.window_days))]
+        for compression in arguments.compression:
+            paths = (compress_file(path_customers, compression), compress_file(path_orders, compression))
+            compressed_bytes = sum(os.path.getsize(path) for path in paths)
+            reads.append((f'{compression} thread', compressed_bytes,
+                          lambda paths=paths: read_analysis(paths[0], paths[1], generator.window_days)))
+            reads.append((f'{compression} inline', compressed_bytes,
+                          lambda paths=paths: read_analysis(paths[0], paths[1], generator.window_days, False)))
+            reads.append((f'{compression} to disk', compressed_bytes, lambda paths=paths: read_analysis(
+                decompress_file(paths[0], os.path.join(directory, 'customers-copy.csv')),
+                decompress_file(paths[1], os.path.join(directory, 'orders-copy.csv')), generator.window_days)))
+        print(f'{rows} rows, {input_bytes / 2 ** 20:.1f} MiB uncompressed, {os.cpu_count()} cores')
+        print(f'{"input":<15} {"MiB":>7} {"seconds":>9} {"cpu":>9} {"rows/s":>11} {"vs plain":>9} {"peak MiB":>9}')
+        expected = None
+        plain_seconds = None
+        for name, size, read in reads:
+            seconds, cpu_seconds, peak_memory_bytes, result = time_read(read, not arguments.no_memory)
+            counts = {cohort_key: result.get_counts_for_cohort(cohort_key)
+                      for cohort_key in result.customer_group_to_order_accumulated}
+            expected = expected or counts
+            if counts != expected:
+                raise AssertionError(f'{name} result differs from uncompressed result')
+            plain_seconds = plain_seconds or seconds
+            peak = '-' if peak_memory_bytes is None else f'{peak_memory_bytes / 2 ** 20:.1f}'
+            print(f'{name:<15} {size / 2 ** 20:7.1f} {seconds:9.3f} {cpu_seconds:9.3f} {rows / seconds:11.0f}'
+                  f' {plain_seconds / seconds:9.2f} {peak:>9}')
+
+
+if __name__ == '__main__':
+    main()
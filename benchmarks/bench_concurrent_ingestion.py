@@ -0,0 +1,85 @@
+"""Benchmark of the concurrent read of the customers and orders csv files against the sequential read,
+see concurrent_ingestion. Generated files are read plain and gzip compressed, one after the other and at the same
+time, the orders parsed by worker processes. Wall time of the concurrent read is compared to the time of each file
+read alone. The scans only overlap with more cores than worker processes.
+
+    python -m benchmarks.bench_concurrent_ingestion --customers 1000000 --workers 2
+"""
+
+import datetime
+import os
+import tempfile
+from benchmarks import bench_compressed_input, bench_stages, generate_cohort_data as gcd
+from customer_order_cohort import concurrent_ingestion as cin
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+
+
+def build_aggregation(window_days: int) -> otsa.OrderTimeSpanAggregation:
+    """:returns empty aggregation on the window of the generated files"""
+
+    return otsa.OrderTimeSpanAggregation(customer_cohorts=ctsc.CustomerTimeSpanCohorts(
+        recent_date=gcd.RECENT_DATE - datetime.timedelta(days=1), days_interval_length=7,
+        number_of_intervals=max(1, window_days // 7)))
+
+
+def read_sequentially(path_customers_csv_file: str, path_orders_csv_file: str,
+                      window_days: int) -> otsa.OrderTimeSpanAggregation:
+    orders_by_time_slot = build_aggregation(window_days)
+    orders_by_time_slot.customer_cohorts.read_customers_csv_file(path_customers_csv_file)
+    orders_by_time_slot.read_orders_csv_file(path_orders_csv_file)
+    return orders_by_time_slot
+
+
+def read_concurrently(path_customers_csv_file: str, path_orders_csv_file: str, window_days: int,
+                      workers: int = 2) -> otsa.OrderTimeSpanAggregation:
+    orders_by_time_slot = build_aggregation(window_days)
+    ingestion = cin.ConcurrentIngestion(orders_by_time_slot, workers)
+    ingestion.read_csv_files(path_customers_csv_file, path_orders_csv_file)
+    print(f'  {ingestion}')
+    return orders_by_time_slot
+
+
+def main():
+    parser = gcd.build_argument_parser()
+    parser.description = __doc__
+    parser.add_argument('--workers', type=int, default=2, help='processes parsing the orders csv file')
+    parser.add_argument('--no-gzip', action='store_true', help='do not time the gzip compressed files')
+    arguments = parser.parse_args()
+    generator = gcd.CohortDataGenerator(
+        customers=arguments.customers, window_days=arguments.window_days, orders_skew=arguments.orders_skew,
+        orders_scale=arguments.orders_scale, out_of_window_fraction=arguments.out_of_window_fraction,
+        malformed_fraction=arguments.malformed_fraction, shuffle_block=arguments.shuffle_block, seed=arguments.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path_customers = os.path.join(directory, 'customers.csv')
+        path_orders = os.path.join(directory, 'orders.csv')
+        generator.write_csv_files(path_customers, path_orders)
+        rows = bench_stages.count_lines(path_customers) + bench_stages.count_lines(path_orders) - 2
+        inputs = [('plain', path_customers, path_orders)]
+        if not arguments.no_gzip:
+            inputs.append(('gzip', bench_compressed_input.compress_file(path_customers, 'gzip'),
+                           bench_compressed_input.compress_file(path_orders, 'gzip')))
+        print(f'{rows} rows, {os.cpu_count()} cores')
+        print(f'{"input":<6} {"read":<12} {"seconds":>9} {"cpu":>9} {"rows/s":>11} {"vs sequential":>14}')
+        for input_name, path_customers_csv_file, path_orders_csv_file in inputs:
+            expected = None
+            sequential_seconds = None
+            for read_name, read in (
+                    ('sequential', lambda: read_sequentially(
+                        path_customers_csv_file, path_orders_csv_file, generator.window_days)),
+                    ('concurrent', lambda: read_concurrently(
+                        path_customers_csv_file, path_orders_csv_file, generator.window_days, arguments.workers))):
+                seconds, cpu_seconds, _, result = bench_compressed_input.time_read(read, False)
+                if expected is None:
+                    expected = result.snapshot_state()
+                    sequential_seconds = seconds
+                    stages = result.metrics.stages
+                    print(f'{input_name:<6} {"customers":<12} {stages["customer_read"].wall_seconds:9.3f}')
+                    print(f'{input_name:<6} {"orders":<12} {stages["order_read"].wall_seconds:9.3f}')
+                elif result.snapshot_state() != expected:
+                    raise AssertionError(f'{input_name} {read_name} result differs from sequential result')
+                print(f'{input_name:<6} {read_name:<12} {seconds:9.3f} {cpu_seconds:9.3f} {rows / seconds:11.0f}'
+                      f' {sequential_seconds / seconds:14.2f}')
+
+
+if __name__ == '__main__':
+    main()
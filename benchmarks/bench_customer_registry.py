@@ -0,0 +1,99 @@
+"""Benchmark of the memory and lookup time of CustomerRegistry against a dict, see customer_registry.
+The registry is filled customer by customer, or compacted at once from a dict, see CustomerRegistry.from_mapping.
+Customer IDs are the shuffled decimal IDs of generate_cohort_data, values the packed cohort index of each customer.
+Memory is traced with tracemalloc for the registry, or dict, and everything it refers to.
+Lookups are timed for customers found and not found, like track_order for known and unknown customers.
+
+    python -m benchmarks.bench_customer_registry --customers 1000000 5000000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from customer_order_cohort.customer_registry import CustomerRegistry
+
+# number of intervals used to pack the cohort index, as CustomerTimeSpanCohorts does by default
+NUMBER_OF_INTERVALS = 8
+
+
+def build_registry(registry, customer_ids: [str]):
+    """Fill a registry, or a dict, as add_customer does. :returns the registry"""
+
+    cohort_cardinality = [0] * NUMBER_OF_INTERVALS
+    for position, customer_id in enumerate(customer_ids):
+        cohort_index = position % NUMBER_OF_INTERVALS
+        registry[customer_id] = cohort_index + NUMBER_OF_INTERVALS * cohort_cardinality[cohort_index]
+        cohort_cardinality[cohort_index] += 1
+    return registry
+
+
+def compact_registry(customer_ids: [str]) -> CustomerRegistry:
+    """Fill a dict, then compact it, as CustomerTimeSpanCohorts.compact_customer_index does. :returns the registry"""
+
+    return CustomerRegistry.from_mapping(build_registry({}, customer_ids))
+
+
+# name and function building a registry, or a dict, from customer IDs
+BUILDERS = (('dict', lambda customer_ids: build_registry({}, customer_ids)),
+            ('compact', lambda customer_ids: build_registry(CustomerRegistry(), customer_ids)),
+            ('compacted', compact_registry))
+
+
+def measure_memory(build, customers: int) -> (int, float):
+    """:returns traced bytes held by a registry built from customer IDs, and the seconds to build it"""
+
+    tracemalloc.start()
+    customer_ids = get_customer_ids(customers)  # traced: the dict keeps these strings, the registry does not
+    start = time.perf_counter()
+    registry = build(customer_ids)
+    seconds = time.perf_counter() - start
+    del customer_ids  # the IDs read from csv are not kept either
+    memory_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del registry
+    return memory_bytes, seconds
+
+
+def time_lookups(registry, customer_ids: [str]) -> float:
+    """:returns nanoseconds per lookup"""
+
+    get = registry.get
+    start = time.perf_counter()
+    for customer_id in customer_ids:
+        get(customer_id)
+    return (time.perf_counter() - start) * 1e9 / len(customer_ids)
+
+
+def get_customer_ids(customers: int, seed: int = 0) -> [str]:
+    """:returns decimal customer IDs 1 to customers, shuffled, as new strings like the ones read from csv"""
+
+    customer_ids = [str(customer_id) for customer_id in range(1, customers + 1)]
+    random.Random(seed).shuffle(customer_ids)
+    return customer_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, nargs='+', default=[100000, 1000000], help='numbers of customers')
+    parser.add_argument('--lookups', type=int, default=1000000, help='number of timed lookups')
+    arguments = parser.parse_args()
+
+    print(f'{"customers":>10} {"registry":>10} {"MiB":>8} {"B/customer":>11} {"build s":>8}'
+          f' {"found ns":>9} {"missing ns":>11}')
+    for customers in arguments.customers:
+        # other string objects than the registry keys, as read from the orders csv file
+        found_ids = random.Random(1).choices(get_customer_ids(customers), k=arguments.lookups)
+        missing_ids = [str(customer_id) for customer_id in range(customers + 1, customers + 1 + arguments.lookups)]
+        for name, build in BUILDERS:
+            memory_bytes, build_seconds = measure_memory(build, customers)
+            registry = build(get_customer_ids(customers))
+            found_ns = time_lookups(registry, found_ids)
+            missing_ns = time_lookups(registry, missing_ids)
+            print(f'{customers:10} {name:>10} {memory_bytes / 2 ** 20:8.1f} {memory_bytes / customers:11.1f}'
+                  f' {build_seconds:8.2f} {found_ns:9.0f} {missing_ns:11.0f}')
+            del registry
+
+
+if __name__ == '__main__':
+    main()
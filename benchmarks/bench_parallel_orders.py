@@ -0,0 +1,63 @@
+"""Benchmark of OrderTimeSpanAggregation.read_orders_csv_file by number of worker processes.
+The bundled orders file is repeated to get a large enough input, customers are read once.
+
+    python -m benchmarks.bench_parallel_orders --repeat 40 --workers 1 2 4 8
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+
+
+def write_repeated_orders(path_orders: str, repeat: int, output_file) -> int:
+    """Write the header and repeat all entries of the orders csv file. :returns number of entries written"""
+
+    with open(path_orders, mode='r') as orders_file:
+        header = orders_file.readline()
+        entries = orders_file.read()
+    output_file.write(header)
+    for _ in range(repeat):
+        output_file.write(entries)
+    return entries.count('\n') * repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', default='./data/customers.csv')
+    parser.add_argument('--orders', default='./data/orders.csv')
+    parser.add_argument('--repeat', type=int, default=20, help='number of copies of the orders entries')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker counts to time')
+    arguments = parser.parse_args()
+
+    customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=datetime.datetime(2015, 7, 7, 23, 00, 00))
+    customers_cohorts.read_customers_csv_file(arguments.customers)
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as orders_file:
+        entry_count = write_repeated_orders(arguments.orders, arguments.repeat, orders_file)
+    try:
+        start = time.perf_counter()
+        sequential = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        sequential.read_orders_csv_file(orders_file.name)
+        sequential_seconds = time.perf_counter() - start
+        expected = {cohort_key: sequential.get_counts_for_cohort(cohort_key)
+                    for cohort_key in sequential.customer_group_to_order_accumulated}
+        print(f'{entry_count} orders, {os.cpu_count()} cores')
+        print(f'{"workers":>8} {"seconds":>9} {"orders/s":>11} {"speedup":>8}')
+        print(f'{"-":>8} {sequential_seconds:9.3f} {entry_count / sequential_seconds:11.0f} {1:8.2f}')
+        for workers in arguments.workers:
+            start = time.perf_counter()
+            parallel = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+            parallel.read_orders_csv_file(orders_file.name, workers=workers)
+            seconds = time.perf_counter() - start
+            if {cohort_key: parallel.get_counts_for_cohort(cohort_key)
+                    for cohort_key in parallel.customer_group_to_order_accumulated} != expected:
+                raise AssertionError(f'parallel result with {workers} workers differs from sequential result')
+            print(f'{workers:8} {seconds:9.3f} {entry_count / seconds:11.0f} {sequential_seconds / seconds:8.2f}')
+    finally:
+        os.remove(orders_file.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark of SQLite input against csv input of the same entries, see sqlite_input.
+Generated customers and orders files are imported in a SQLite database, then the analysis is read:
+from the csv files, and from the database with the date range and the join queried in SQL.
+
+    python -m benchmarks.bench_sqlite_input --customers 1000000
+"""
+
+import datetime
+import os
+import tempfile
+import time
+from benchmarks import bench_stages, generate_cohort_data as gcd
+from customer_order_cohort import sqlite_input as si
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+
+
+def read_analysis(path_customers_csv_file: str, path_orders_csv_file: str, path_database: str,
+                  window_days: int) -> otsa.OrderTimeSpanAggregation:
+    """Read the csv files, or the database when path_database is set"""
+
+    customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+        recent_date=gcd.RECENT_DATE - datetime.timedelta(days=1), days_interval_length=7,
+        number_of_intervals=max(1, window_days // 7))
+    orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+    if path_database is None:
+        customers_cohorts.read_customers_csv_file(path_customers_csv_file)
+        orders_by_time_slot.read_orders_csv_file(path_orders_csv_file)
+    else:
+        customers_cohorts.read_customers_database(path_database)
+        orders_by_time_slot.read_orders_database(path_database)
+    return orders_by_time_slot
+
+
+def main():
+    parser = gcd.build_argument_parser()
+    parser.description = __doc__
+    parser.add_argument('--batch-size', type=int, default=si.BATCH_SIZE, help='rows fetched at once')
+    arguments = parser.parse_args()
+    si.BATCH_SIZE = arguments.batch_size
+    generator = gcd.CohortDataGenerator(
+        customers=arguments.customers, window_days=arguments.window_days, orders_skew=arguments.orders_skew,
+        orders_scale=arguments.orders_scale, out_of_window_fraction=arguments.out_of_window_fraction,
+        malformed_fraction=arguments.malformed_fraction, shuffle_block=arguments.shuffle_block, seed=arguments.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path_customers = os.path.join(directory, 'customers.csv')
+        path_orders = os.path.join(directory, 'orders.csv')
+        path_database = os.path.join(directory, 'cohorts.sqlite')
+        generator.write_csv_files(path_customers, path_orders)
+        rows = bench_stages.count_lines(path_customers) + bench_stages.count_lines(path_orders) - 2
+        start = time.perf_counter()
+        si.import_csv_files(path_database, path_customers, path_orders)
+        import_seconds = time.perf_counter() - start
+        input_bytes = os.path.getsize(path_customers) + os.path.getsize(path_orders)
+        print(f'{rows} rows, {input_bytes / 2 ** 20:.1f} MiB csv, {os.path.getsize(path_database) / 2 ** 20:.1f} MiB'
+              f' database with indexes, imported in {import_seconds:.3f}s')
+        print(f'{"input":<8} {"seconds":>9} {"cpu":>9} {"fetched":>10} {"rows/s":>11} {"vs csv":>7}')
+        expected = None
+        csv_seconds = None
+        for name, database in (('csv', None), ('sqlite', path_database)):
+            start, start_cpu = time.perf_counter(), time.process_time()
+            result = read_analysis(path_customers, path_orders, database, generator.window_days)
+            seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - start_cpu
+            counts = {cohort_key: result.get_counts_for_cohort(cohort_key)
+                      for cohort_key in result.customer_group_to_order_accumulated}
+            expected = expected or counts
+            if counts != expected:
+                raise AssertionError(f'{name} result differs from csv result')
+            csv_seconds = csv_seconds or seconds
+            fetched = result.metrics.stages['customer_read'].rows + result.metrics.stages['order_read'].rows
+            print(f'{name:<8} {seconds:9.3f} {cpu_seconds:9.3f} {fetched:10} {rows / seconds:11.0f}'
+                  f' {csv_seconds / seconds:7.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Benchmark suite of the cohort analysis stages on generated data, see generate_cohort_data.
+Each stage is timed separately: customers read, orders read, csv write, with its throughput and peak memory.
+Results can be stored as a baseline, and checked against it to fail on a regression.
+Throughputs are compared as ratios to the speed of the host, measured on a fixed workload by measure_host_speed,
+so that a baseline from one machine can be checked on another one, within --tolerance.
+
+    python -m benchmarks.bench_stages --customers 1000000 --engine rows batched
+    python -m benchmarks.bench_stages --update-baseline
+    python -m benchmarks.bench_stages --check
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks import generate_cohort_data as gcd
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+STAGES = ('customer_read', 'order_read', 'csv_write')
+
+
+# engines to compare, from today's row by row readers to the optional faster readers
+ENGINES = ('rows', 'batched', 'parallel', 'columnar-cache')
+
+
+def run_stage(engine: str, stage: str, previous, path: str, window_days: int):
+    """
+    Run one stage of the analysis with an engine
+    :param engine: one of ENGINES
+    :param stage: one of STAGES
+    :param previous: result of the previous stage, None for the first one
+    :param path: csv file to read for read stages, to write for the write stage
+    :param window_days: analysis window, as generated
+    :returns the stage result, customer cohorts or order aggregation"""
+
+    if stage == 'customer_read':
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=gcd.RECENT_DATE - datetime.timedelta(days=1), days_interval_length=7,
+            number_of_intervals=max(1, window_days // 7))
+        customers_cohorts.read_customers_csv_file(
+            path, batch_size=ctsc.CustomerTimeSpanCohorts.BATCH_SIZE if engine == 'batched' else None,
+            columnar_cache=engine == 'columnar-cache')
+        return customers_cohorts
+    if stage == 'order_read':
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=previous)
+        orders_by_time_slot.read_orders_csv_file(path, workers=os.cpu_count() if engine == 'parallel' else None,
+                                                 columnar_cache=engine == 'columnar-cache')
+        return orders_by_time_slot
+    previous.write_orders_count_by_cohorts_csv_file(path)
+    return previous
+
+
+def count_lines(path_file: str) -> int:
+    """:returns number of new lines in a file"""
+
+    with open(path_file, mode='rb') as counted_file:
+        return sum(block.count(b'\n') for block in iter(lambda: counted_file.read(1 << 20), b''))
+
+
+def measure_host_speed(rows: int = 100000, repeat: int = 3) -> float:
+    """
+    Time a fixed pure python workload like the read stages: csv parsing, date slicing and dict inserts
+    :returns its best rows per second, stage throughputs divided by it are comparable between hosts"""
+
+    text = ''.join(f'{index:08x},2015-07-{index % 28 + 1:02d} 10:00:00\n' for index in range(rows))
+    best_seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        customers = {}
+        for customer_id, created in csv.reader(io.StringIO(text)):
+            customers[customer_id] = created[0:10]
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    return rows / best_seconds
+
+
+def run_stages(engine: str, paths: dict, window_days: int, measure_memory: bool, host_speed: float = None) -> dict:
+    """
+    Run all stages of an engine once, timed, and once more traced for peak memory if measure_memory
+    :param host_speed: rows per second of measure_host_speed, None to not compute relative speeds
+    :returns stage name to seconds, cpu seconds, rows, rows per second, rows per second relative to host_speed
+    and peak memory bytes"""
+
+    results = {}
+    previous = None
+    for stage in STAGES:
+        start, start_cpu = time.perf_counter(), time.process_time()
+        current = run_stage(engine, stage, previous, paths[stage], window_days)
+        seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - start_cpu
+        rows = count_lines(paths[stage]) - 1
+        rows_per_second = rows / seconds if seconds > 0 else None
+        results[stage] = {'seconds': seconds, 'cpu_seconds': cpu_seconds, 'rows': rows, 'rows_per_second': rows_per_second,
+                          'relative_speed': None if rows_per_second is None or host_speed is None
+                          else rows_per_second / host_speed, 'peak_memory_bytes': None}
+        if measure_memory:
+            tracemalloc.start()
+            run_stage(engine, stage, previous, paths[stage], window_days)
+            results[stage]['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        previous = current
+    return results
+
+
+def check_against_baseline(results: dict, baseline: dict, tolerance: float, min_seconds: float) -> [str]:
+    """
+    :returns one message per stage slower, or using more memory, than the baseline beyond tolerance.
+    Speeds are relative to the host speed of each run, see measure_host_speed.
+    Stages faster than min_seconds in the baseline are only checked for memory, their time is noise"""
+
+    regressions = []
+    for engine, stages in results.items():
+        for stage, measures in stages.items():
+            expected = baseline.get(engine, {}).get(stage)
+            if expected is None:
+                continue
+            if expected['seconds'] >= min_seconds \
+                    and measures['relative_speed'] < expected['relative_speed'] * (1 - tolerance):
+                regressions.append(f'{engine} {stage}: {measures["relative_speed"]:.3f} rows per host row, '
+                                   f'baseline {expected["relative_speed"]:.3f}')
+            if measures['peak_memory_bytes'] is not None and expected['peak_memory_bytes'] is not None \
+                    and measures['peak_memory_bytes'] > expected['peak_memory_bytes'] * (1 + tolerance):
+                regressions.append(f'{engine} {stage}: {measures["peak_memory_bytes"]} bytes peak memory, '
+                                   f'baseline {expected["peak_memory_bytes"]} bytes')
+    return regressions
+
+
+def check_report(report: dict, path_baseline_file: str, tolerance: float, min_seconds: float) -> int:
+    """
+    Print the regressions of a report against a baseline file, see check_against_baseline
+    :returns exit status, 1 on a regression or a baseline for other generator parameters"""
+
+    with open(path_baseline_file, mode='r') as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline['parameters'] != report['parameters']:
+        print(f'baseline is for other generator parameters: {baseline["parameters"]}', file=sys.stderr)
+        return 1
+    regressions = check_against_baseline(report['results'], baseline['results'], tolerance, min_seconds)
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = gcd.build_argument_parser()
+    parser.description = __doc__
+    parser.add_argument('--engine', nargs='+', choices=ENGINES, default=['rows'], help='engines to run')
+    parser.add_argument('--data-directory', help='reuse customers.csv and orders.csv of this directory')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory, twice faster')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline json file')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--check', action='store_true', help='exit with 1 on a regression against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='relative regression allowed by --check. Speeds relative to the host still vary '
+                             'with the CPU: raise it to check a baseline stored on another host')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='shortest stage checked for time')
+    parser.add_argument('--output', help='write the results as json to this file')
+    return parser
+
+
+def main() -> int:
+    arguments = build_argument_parser().parse_args()
+    generator = gcd.CohortDataGenerator(
+        customers=arguments.customers, window_days=arguments.window_days, orders_skew=arguments.orders_skew,
+        orders_scale=arguments.orders_scale, out_of_window_fraction=arguments.out_of_window_fraction,
+        malformed_fraction=arguments.malformed_fraction, shuffle_block=arguments.shuffle_block, seed=arguments.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        data_directory = arguments.data_directory or directory
+        paths = {'customer_read': os.path.join(data_directory, 'customers.csv'),
+                 'order_read': os.path.join(data_directory, 'orders.csv'),
+                 'csv_write': os.path.join(directory, 'ordercounts.csv')}
+        if arguments.data_directory is None:
+            generator.write_csv_files(paths['customer_read'], paths['order_read'])
+        host_speed = measure_host_speed()
+        results = {}
+        for engine in arguments.engine:
+            if engine == 'columnar-cache':  # time reads of the cached columns, not the first parse
+                run_stages(engine, paths, arguments.window_days, False)
+            results[engine] = run_stages(engine, paths, arguments.window_days, not arguments.no_memory, host_speed)
+    print(f'{"engine":<15} {"stage":<14} {"rows":>10} {"seconds":>9} {"cpu":>9} {"rows/s":>11} {"peak MiB":>9}')
+    for engine, stages in results.items():
+        for stage, measures in stages.items():
+            peak = '-' if measures['peak_memory_bytes'] is None else f'{measures["peak_memory_bytes"] / 2 ** 20:.1f}'
+            print(f'{engine:<15} {stage:<14} {measures["rows"]:>10} {measures["seconds"]:9.3f} '
+                  f'{measures["cpu_seconds"]:9.3f} {measures["rows_per_second"] or 0:11.0f} {peak:>9}')
+    report = {'parameters': generator.parameters(), 'host_rows_per_second': host_speed, 'results': results}
+    if arguments.output:
+        with open(arguments.output, mode='w') as output_file:
+            json.dump(report, output_file, indent=2)
+    if arguments.update_baseline:
+        with open(arguments.baseline, mode='w') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+            baseline_file.write('\n')
+    if arguments.check:
+        return check_report(report, arguments.baseline, arguments.tolerance, arguments.min_seconds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
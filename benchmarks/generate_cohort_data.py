@@ -0,0 +1,133 @@
+"""Deterministic generator of customers and orders csv files, same layout as ./data, at any scale.
+Order counts per customer are skewed (Pareto), a fraction of dates is out of the analysis window or malformed,
+and entries are shuffled by blocks so that files are not sorted.
+
+    python -m benchmarks.generate_cohort_data --customers 1000000 --output-directory /tmp/cohort-data
+"""
+
+import argparse
+import datetime
+import os
+import random
+
+# recent date of the generated data, the analysis window ends the day before
+RECENT_DATE = datetime.datetime(2015, 7, 8)
+
+# invalid values for the created column
+MALFORMED_DATES = ['', 'not a date', '2015-13-01 10:00:00', '2015-02-30 10:00:00', '2015/07/01 10:00:00',
+                   '2015-07-01 25:00:00', '2015-07-01T10:00:00']
+
+
+class CohortDataGenerator:
+    """
+    Generate customers and orders entries from a seed, the same seed and parameters give the same files
+    """
+
+    def __init__(self, customers: int = 100000, window_days: int = 56, orders_skew: float = 1.5,
+                 orders_scale: float = 2.0, max_orders_per_customer: int = 1000, out_of_window_fraction: float = 0.2,
+                 malformed_fraction: float = 0.01, shuffle_block: int = 1 << 16, seed: int = 42):
+        if customers is None or not isinstance(customers, int) or customers < 0:
+            raise ValueError(f'value for customers must be a positive integer: {customers}')
+        if orders_skew <= 1:
+            raise ValueError(f'value for orders_skew must be greater than 1: {orders_skew}')
+        if not 0 <= out_of_window_fraction <= 1 or not 0 <= malformed_fraction <= 1:
+            raise ValueError(f'fractions must be between 0 and 1: {out_of_window_fraction}, {malformed_fraction}')
+        self.customers = customers
+        self.window_days = window_days
+        self.orders_skew = orders_skew
+        self.orders_scale = orders_scale
+        self.max_orders_per_customer = max_orders_per_customer
+        self.out_of_window_fraction = out_of_window_fraction
+        self.malformed_fraction = malformed_fraction
+        self.shuffle_block = shuffle_block
+        self.seed = seed
+
+    def parameters(self) -> dict:
+        """:returns generator parameters, to tell which files a benchmark result is about"""
+
+        return dict(vars(self))
+
+    def random_seconds(self, rng: random.Random, oldest_seconds: float) -> float:
+        """:returns seconds before RECENT_DATE, after oldest_seconds or out of the window"""
+
+        if rng.random() < self.out_of_window_fraction:
+            if rng.random() < 0.8:  # mostly history before the window
+                return rng.uniform(self.window_days * 86400, (self.window_days + 730) * 86400)
+            return -rng.uniform(0, 30 * 86400)  # in the future
+        return rng.uniform(0, oldest_seconds)
+
+    def format_date(self, rng: random.Random, seconds_before_recent: float) -> str:
+        """:returns created column value, malformed for a fraction of the values"""
+
+        if rng.random() < self.malformed_fraction:
+            return rng.choice(MALFORMED_DATES)
+        return (RECENT_DATE - datetime.timedelta(seconds=int(seconds_before_recent))).strftime('%Y-%m-%d %H:%M:%S')
+
+    def write_csv_files(self, path_customers_csv_file: str, path_orders_csv_file: str) -> (int, int):
+        """
+        Write both csv files.
+        Will raise IOError if a file cannot be written
+        :param path_customers_csv_file: path of the customers file, id and created columns
+        :param path_orders_csv_file: path of the orders file, id, order_number, user_id and created columns
+        :returns number of customers and number of orders written"""
+
+        rng = random.Random(self.seed)
+        order_count = 0
+        customer_ids = list(range(1, self.customers + 1))
+        rng.shuffle(customer_ids)
+        with open(path_customers_csv_file, mode='w') as customers_file, \
+                open(path_orders_csv_file, mode='w') as orders_file:
+            customers_file.write('id,created\n')
+            orders_file.write('id,order_number,user_id,created\n')
+            order_lines = []
+            for block_start in range(0, self.customers, self.shuffle_block):
+                customer_lines = []
+                for customer_id in customer_ids[block_start:block_start + self.shuffle_block]:
+                    created = self.random_seconds(rng, self.window_days * 86400)
+                    customer_lines.append(f'{customer_id},{self.format_date(rng, created)}\n')
+                    orders = min(self.max_orders_per_customer,
+                                 int((rng.paretovariate(self.orders_skew) - 1) * self.orders_scale))
+                    # order dates after the customer creation, in order sequence
+                    order_seconds = sorted((max(0.0, created) * rng.random() for _ in range(orders)), reverse=True)
+                    for order_number, seconds in enumerate(order_seconds, start=1):
+                        order_count += 1
+                        order_lines.append(f'{order_count},{order_number},{customer_id},'
+                                           f'{self.format_date(rng, seconds)}\n')
+                rng.shuffle(customer_lines)
+                customers_file.writelines(customer_lines)
+                if len(order_lines) >= self.shuffle_block:
+                    rng.shuffle(order_lines)
+                    orders_file.writelines(order_lines)
+                    order_lines = []
+            rng.shuffle(order_lines)
+            orders_file.writelines(order_lines)
+        return self.customers, order_count
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=100000, help='number of customers')
+    parser.add_argument('--window-days', type=int, default=56, help='days of the analysis window before 2015-07-08')
+    parser.add_argument('--orders-skew', type=float, default=1.5, help='Pareto shape of orders per customer, > 1')
+    parser.add_argument('--orders-scale', type=float, default=2.0, help='scale of orders per customer')
+    parser.add_argument('--out-of-window-fraction', type=float, default=0.2, help='fraction of dates out of window')
+    parser.add_argument('--malformed-fraction', type=float, default=0.01, help='fraction of malformed dates')
+    parser.add_argument('--shuffle-block', type=int, default=1 << 16, help='entries shuffled together')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-directory', default='.', help='where to write customers.csv and orders.csv')
+    return parser
+
+
+def main():
+    arguments = build_argument_parser().parse_args()
+    generator = CohortDataGenerator(
+        customers=arguments.customers, window_days=arguments.window_days, orders_skew=arguments.orders_skew,
+        orders_scale=arguments.orders_scale, out_of_window_fraction=arguments.out_of_window_fraction,
+        malformed_fraction=arguments.malformed_fraction, shuffle_block=arguments.shuffle_block, seed=arguments.seed)
+    customers, orders = generator.write_csv_files(os.path.join(arguments.output_directory, 'customers.csv'),
+                                                  os.path.join(arguments.output_directory, 'orders.csv'))
+    print(f'{customers} customers and {orders} orders written to {arguments.output_directory}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Concurrent load test of the cohort query service, see cohort_query_service.
+Each client connection sends its queries one after the other on a kept alive connection,
+all connections run concurrently. Without --address, a service over ./data is started in this process,
+on a temporary Unix socket. With --reload-every, the analysis is also reloaded during the test.
+
+    python main.py --serve 127.0.0.1:8765 &
+    python -m benchmarks.load_test_query_service --address 127.0.0.1:8765 --connections 64 --requests 500
+    python -m benchmarks.load_test_query_service --reload-every 1000
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import time
+from urllib.parse import quote
+from customer_order_cohort import cohort_query_service as cqs
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+
+
+async def get_query_targets(address: str) -> [str]:
+    """:returns one query of each kind: table, all cohorts, each cohort and each period"""
+
+    reader, writer = await cqs.open_service_connection(address)
+    try:
+        status, body = await cqs.query_service(reader, writer, '/cohorts')
+    finally:
+        writer.close()
+    if status != 200:
+        raise ConnectionError(f'service answered {status} to /cohorts: {body}')
+    cohorts = json.loads(body.decode())
+    return ['/table', '/cohorts'] + [f'/cohort?id={quote(cohort["cohort"], safe="")}' for cohort in cohorts] + \
+        [f'/period/{period}' for period in range(max((len(cohort['orders']) for cohort in cohorts), default=0))]
+
+
+async def run_client(address: str, targets: [str], requests: int, first_target: int, latencies: [float],
+                     reload_every: int = None) -> int:
+    """
+    Send queries on one connection, cycling over targets, and record their latency in seconds
+    :param reload_every: when set, POST /reload instead of every reload_every-th query
+    :returns number of errors: answers other than 200, or 202 for a reload
+    """
+
+    errors = 0
+    reader, writer = await cqs.open_service_connection(address)
+    try:
+        for request in range(requests):
+            reload = reload_every is not None and (first_target + request) % reload_every == 0
+            start = time.perf_counter()
+            status, _ = await cqs.query_service(
+                reader, writer, '/reload' if reload else targets[(first_target + request) % len(targets)],
+                'POST' if reload else 'GET')
+            latencies.append(time.perf_counter() - start)
+            errors += status != (202 if reload else 200)
+    finally:
+        writer.close()
+    return errors
+
+
+async def run_load_test(address: str, connections: int, requests: int, reload_every: int = None) -> dict:
+    """
+    Run concurrent clients against the service
+    :param connections: number of concurrent connections
+    :param requests: number of queries per connection
+    :returns count of queries and errors, queries per second, and latency percentiles in milliseconds
+    """
+
+    targets = await get_query_targets(address)
+    latencies = []
+    start = time.perf_counter()
+    errors = await asyncio.gather(*[
+        run_client(address, targets, requests, connection * requests, latencies, reload_every)
+        for connection in range(connections)])
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    result = {'queries': len(latencies), 'errors': sum(errors), 'seconds': seconds,
+              'queries_per_second': len(latencies) / seconds}
+    for percentile in (50, 90, 99, 100):
+        result[f'p{percentile}_ms'] = latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)] * 1000
+    return result
+
+
+def load_bundled_analysis() -> otsa.OrderTimeSpanAggregation:
+    """:returns the analysis of main.py over ./data"""
+
+    customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=datetime.datetime(2015, 7, 7, 23, 00, 00))
+    customers_cohorts.read_customers_csv_file('./data/customers.csv')
+    orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+    orders_by_time_slot.read_orders_csv_file('./data/orders.csv')
+    return orders_by_time_slot
+
+
+async def run_with_local_service(connections: int, requests: int, reload_every: int) -> dict:
+    """Start a service over ./data on a temporary Unix socket, and run the load test against it"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        service = cqs.CohortQueryService(load_bundled_analysis)
+        await service.start(os.path.join(directory, 'cohorts.sock'))
+        try:
+            return await run_load_test(service.get_address(), connections, requests, reload_every)
+        finally:
+            await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', help='HOST:PORT or Unix socket path of a running service')
+    parser.add_argument('--connections', type=int, default=32, help='number of concurrent connections')
+    parser.add_argument('--requests', type=int, default=200, help='number of queries per connection')
+    parser.add_argument('--reload-every', type=int, metavar='N', help='reload the analysis every N queries')
+    arguments = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        if arguments.address is None:
+            result = loop.run_until_complete(run_with_local_service(
+                arguments.connections, arguments.requests, arguments.reload_every))
+        else:
+            result = loop.run_until_complete(run_load_test(
+                arguments.address, arguments.connections, arguments.requests, arguments.reload_every))
+    finally:
+        loop.close()
+    print(f'{result["queries"]} queries on {arguments.connections} connections in {result["seconds"]:.3f}s,'
+          f' {result["queries_per_second"]:.0f} queries/s, {result["errors"]} errors')
+    print(f'latency ms: p50 {result["p50_ms"]:.3f}, p90 {result["p90_ms"]:.3f},'
+          f' p99 {result["p99_ms"]:.3f}, max {result["p100_ms"]:.3f}')
+
+
+if __name__ == '__main__':
+    main()
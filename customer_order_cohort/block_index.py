@@ -0,0 +1,130 @@
+"""Sidecar index of the date range of each block of a csv file, to read only the blocks overlapping an analysis.
+The csv file is split in blocks of about BLOCK_BYTES, starting and ending on new lines. For each block, the
+index keeps its byte offsets, its number of rows and of rows with an invalid date, and its oldest and most
+recent valid dates. The index is built on the first read, in the same sidecar layout as columnar_cache, and
+rebuilt when the csv file fingerprint changes. Quoted values of the csv file must not contain new lines.
+"""
+
+import csv
+import io
+from array import array
+from customer_order_cohort import columnar_cache as cc
+
+# name and version of the index columns
+LAYOUT = 'blocks-1'
+
+# one column of integers per block field
+COLUMNS = ('start', 'end', 'rows', 'invalid_rows', 'min_seconds', 'max_seconds')
+
+# bytes of csv entries per block, smaller blocks skip more precisely but are more seeks
+BLOCK_BYTES = 1 << 20
+
+
+def build_block_index(path_csv_file: str, date_column: (int, callable), block_bytes: int = BLOCK_BYTES) -> [array]:
+    """
+    Parse the dates of a csv file, block by block
+    :param path_csv_file: path to an uncompressed csv file, with a header line
+    :param date_column: index of the date in a csv entry, with its converter to integer seconds, negative if invalid
+    :param block_bytes: bytes of csv entries per block, the last line of a block is completed
+    :return: one array of integers per COLUMNS, one item per block
+    """
+
+    date_index, converter = date_column
+    columns = [array(cc.ITEM_FORMAT) for _ in COLUMNS]
+    with open(path_csv_file, mode='rb') as csv_file:
+        csv_file.readline()  # skip header
+        start = csv_file.tell()
+        block = csv_file.read(block_bytes)
+        while block:
+            block += csv_file.readline()  # complete last line
+            rows = invalid_rows = 0
+            min_seconds, max_seconds = -1, -1
+            for entry in csv.reader(io.StringIO(block.decode(), newline='')):
+                rows += 1
+                seconds = converter(entry[date_index]) if len(entry) > date_index else -1
+                if seconds < 0:
+                    invalid_rows += 1
+                elif min_seconds < 0:
+                    min_seconds = max_seconds = seconds
+                elif seconds < min_seconds:
+                    min_seconds = seconds
+                elif seconds > max_seconds:
+                    max_seconds = seconds
+            for column, value in zip(columns, (start, start + len(block), rows, invalid_rows, min_seconds, max_seconds)):
+                column.append(value)
+            start += len(block)
+            block = csv_file.read(block_bytes)
+    return columns
+
+
+def read_block_index(path_csv_file: str, date_column: (int, callable), block_bytes: int = None,
+                     path_index_file: str = None) -> [memoryview]:
+    """
+    Get the block index of a csv file from its sidecar file when still valid,
+    else build it and write the sidecar file for next reads.
+    Will raise IOError if path_csv_file is not valid
+    :param path_csv_file: path to an uncompressed csv file, with a header line
+    :param date_column: index of the date in a csv entry, with its converter, see build_block_index
+    :param block_bytes: bytes of csv entries per block, default BLOCK_BYTES, a sidecar with other blocks is stale
+    :param path_index_file: path to the sidecar file, default is path_csv_file with '.blocks' suffix
+    :return: one read only memoryview or array of integers per COLUMNS
+    """
+
+    if block_bytes is None:
+        block_bytes = BLOCK_BYTES
+    if path_index_file is None:
+        path_index_file = path_csv_file + '.blocks'
+    header_fields = {'fingerprint': cc.get_csv_file_fingerprint(path_csv_file), 'layout': LAYOUT,
+                     'columns': list(COLUMNS), 'date_index': date_column[0], 'block_bytes': block_bytes}
+    mapped_columns = cc.map_cache_file(path_index_file, header_fields)
+    if mapped_columns is not None:
+        return mapped_columns
+    columns = build_block_index(path_csv_file, date_column, block_bytes)
+    # the csv file may have changed while parsed, the sidecar would not match it
+    if cc.get_csv_file_fingerprint(path_csv_file) == header_fields['fingerprint']:
+        cc.write_cache_file(path_index_file, header_fields, columns)
+    return columns
+
+
+def select_byte_ranges(index_columns: [memoryview], min_seconds: int, max_seconds: int) -> ([(int, int)], int, int):
+    """
+    :param index_columns: block index, see read_block_index
+    :param min_seconds: oldest date of the analysis, in the same seconds as the index
+    :param max_seconds: most recent date of the analysis, included
+    :return: byte ranges of the blocks with a valid date in [min_seconds, max_seconds], adjacent blocks merged,
+    then the number of rows of the other blocks, and how many of them have an invalid date
+    """
+
+    byte_ranges = []
+    skipped_rows = skipped_invalid_rows = 0
+    for start, end, rows, invalid_rows, block_min_seconds, block_max_seconds in zip(*index_columns):
+        if rows > invalid_rows and block_min_seconds <= max_seconds and block_max_seconds >= min_seconds:
+            if byte_ranges and byte_ranges[-1][1] == start:
+                byte_ranges[-1] = (byte_ranges[-1][0], end)
+            else:
+                byte_ranges.append((start, end))
+        else:
+            skipped_rows += rows
+            skipped_invalid_rows += invalid_rows
+    return byte_ranges, skipped_rows, skipped_invalid_rows
+
+
+def iterate_byte_range_entries(path_csv_file: str, byte_ranges: [(int, int)], block_bytes: int = BLOCK_BYTES) -> iter:
+    """
+    :param path_csv_file: path to an uncompressed csv file
+    :param byte_ranges: (start, end) byte offsets of new line aligned entries, end excluded
+    :param block_bytes: bytes read at once, completed to the end of their last line
+    :return: iterator on the csv entries of the byte ranges
+    """
+
+    with open(path_csv_file, mode='rb') as csv_file:
+        for start, end in byte_ranges:
+            csv_file.seek(start)
+            while start < end:
+                chunk = csv_file.read(min(block_bytes, end - start))
+                if start + len(chunk) < end:
+                    chunk += csv_file.readline(end - start - len(chunk))
+                start += len(chunk)
+                if not chunk:
+                    break  # file truncated since indexed
+                yield from csv.reader(io.StringIO(chunk.decode(), newline=''))
@@ -0,0 +1,355 @@
+"""Long-lived query service over a warm cohort analysis, for dashboards refreshing often.
+The analysis is built once and kept in memory as a CohortCube of encoded answers,
+served over HTTP/1.1 with keep-alive on a local TCP port or a Unix socket, with asyncio.
+Input csv files are watched, and the analysis is rebuilt in a thread when they change:
+queries are answered from the previous cube until the new one replaces it.
+
+    GET /table                              csv table, as written by write_orders_count_by_cohorts_csv_file
+    GET /cohorts                            JSON counts of all cohorts with orders, most recent cohort first
+    GET /cohort?id=2015/07/01-2015/07/07    JSON counts of one cohort, one count per period, earliest first
+    GET /period/0                           JSON counts of all cohorts for one period, 0 is their first days
+    GET /status                             JSON generation and load time of the cube, pipeline metrics
+    POST /reload                            rebuild the analysis now, in the background
+"""
+
+import asyncio
+import io
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+from customer_order_cohort import cohort_writers as cw, columnar_cache as cc
+from customer_order_cohort import order_time_span_aggregation as otsa
+
+# reason phrase of the HTTP status codes answered
+HTTP_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                431: 'Request Header Fields Too Large', 503: 'Service Unavailable'}
+
+JSON_CONTENT_TYPE = 'application/json'
+
+
+def encode_json(value) -> bytes:
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+class CohortCube:
+    """
+    Read-only answers of one analysis, encoded once so that a query is a dictionary lookup
+    """
+
+    def __init__(self, orders_by_time_slot: otsa.OrderTimeSpanAggregation, generation: int,
+                 fingerprints: dict = None):
+        """
+        :param orders_by_time_slot: analysis to answer from, not used after the cube is built
+        :param generation: number of the analysis build, 1 for the first one
+        :param fingerprints: csv file path to its fingerprint when the analysis was read, see watched_paths
+        """
+
+        self.generation: int = generation
+        self.loaded_at: float = time.time()
+        self.fingerprints: dict = fingerprints or {}
+        self.metrics: dict = orders_by_time_slot.metrics.as_dict()
+        table = io.StringIO()
+        cw.write_human(orders_by_time_slot, table)
+        self.table: bytes = table.getvalue().encode('utf8')
+        cohorts = []
+        periods = [[] for _ in range(orders_by_time_slot.customer_cohorts.number_of_intervals)]
+        for _, cohort_key, customers, orders, first_orders in cw.iterate_cohort_counts(orders_by_time_slot):
+            cohorts.append({'cohort': cohort_key, 'customers': customers, 'orders': orders, 'first_orders': first_orders})
+            for period, (order_count, first_order_count) in enumerate(zip(orders, first_orders)):
+                periods[period].append({'cohort': cohort_key, 'customers': customers,
+                                        'orders': order_count, 'first_orders': first_order_count})
+        self.cohorts: bytes = encode_json(cohorts)
+        self.cohort_answers: dict = {cohort['cohort']: encode_json(cohort) for cohort in cohorts}
+        self.period_answers: [bytes] = [encode_json(period) for period in periods]
+
+
+class CohortQueryService:
+    """
+    Asyncio server answering cohort queries from the current CohortCube, rebuilt when its input changes
+    """
+
+    def __init__(self, load_analysis, watched_paths: [str] = (), reload_interval_seconds: float = 5.0):
+        """
+        :param load_analysis: function without argument returning a new OrderTimeSpanAggregation,
+        called in a thread of the event loop executor
+        :param watched_paths: csv files read by load_analysis, the analysis is rebuilt when their fingerprint changes
+        :param reload_interval_seconds: delay between checks of the watched files
+        """
+
+        if load_analysis is None or not callable(load_analysis):
+            raise TypeError(f'load_analysis must be callable: {load_analysis}')
+        if reload_interval_seconds is None or not isinstance(reload_interval_seconds, (int, float)):
+            raise TypeError(f'reload_interval_seconds must be a number: {reload_interval_seconds}')
+        if reload_interval_seconds <= 0:
+            raise ValueError(f'value for reload_interval_seconds must be positive: {reload_interval_seconds}')
+        self.load_analysis = load_analysis
+        self.watched_paths: [str] = list(watched_paths)
+        self.reload_interval_seconds: float = reload_interval_seconds
+        # replaced as a whole by reload, never modified: readers need no lock
+        self.cube: CohortCube = None
+        self.last_reload_error: str = None
+        self.reload_task: asyncio.Future = None
+        self.watch_task: asyncio.Future = None
+        self.server = None
+        # path to its HTTP method and its function of the current cube and the split request target,
+        # '/period/' for all paths starting with it. See answer
+        self.routes: dict = {'/table': ('GET', self.answer_table), '/cohorts': ('GET', self.answer_cohorts),
+                             '/cohort': ('GET', self.answer_cohort), '/period/': ('GET', self.answer_period),
+                             '/status': ('GET', self.answer_status), '/reload': ('POST', self.answer_reload)}
+
+    def get_fingerprints(self) -> dict:
+        """:returns watched path to its csv file fingerprint, None for a missing file"""
+
+        fingerprints = {}
+        for path in self.watched_paths:
+            try:
+                fingerprints[path] = cc.get_csv_file_fingerprint(path)
+            except FileNotFoundError:
+                fingerprints[path] = None
+        return fingerprints
+
+    def build_cube(self, generation: int) -> CohortCube:
+        """Read the analysis and encode its answers, in an executor thread. :returns the new cube"""
+
+        # taken before reading: a file changed during the read is read again on the next check
+        fingerprints = self.get_fingerprints()
+        return CohortCube(self.load_analysis(), generation, fingerprints)
+
+    async def reload(self) -> CohortCube:
+        """
+        Rebuild the cube in a thread, queries are answered from the current one meanwhile.
+        A failed reload keeps the current cube, see last_reload_error, and raises only if there is none.
+        :returns the current cube after the reload
+        """
+
+        generation = 1 if self.cube is None else self.cube.generation + 1
+        try:
+            cube = await asyncio.get_event_loop().run_in_executor(None, self.build_cube, generation)
+        except Exception as e:
+            self.last_reload_error = f'{type(e).__name__}: {e}'
+            if self.cube is None:
+                raise
+            return self.cube
+        self.cube = cube
+        self.last_reload_error = None
+        return cube
+
+    def request_reload(self) -> asyncio.Future:
+        """:returns the reload in progress, or a new one"""
+
+        if self.reload_task is None or self.reload_task.done():
+            self.reload_task = asyncio.ensure_future(self.reload())
+        return self.reload_task
+
+    async def watch_inputs(self):
+        """Reload the cube whenever a watched file fingerprint differs from the one of the current cube"""
+
+        while True:
+            await asyncio.sleep(self.reload_interval_seconds)
+            if self.cube is not None and self.get_fingerprints() != self.cube.fingerprints:
+                await self.request_reload()
+
+    async def start(self, address: str):
+        """
+        Build the first cube, then listen and watch the input files
+        :param address: 'HOST:PORT' for TCP, port 0 for any free port, or the path of a Unix socket
+        :returns the asyncio server
+        """
+
+        await self.request_reload()
+        host, port, path = parse_address(address)
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        if self.watched_paths:
+            self.watch_task = asyncio.ensure_future(self.watch_inputs())
+        return self.server
+
+    def get_address(self) -> str:
+        """:returns the address the server listens on, in the format of start"""
+
+        socket_name = self.server.sockets[0].getsockname()
+        return socket_name if isinstance(socket_name, str) else f'{socket_name[0]}:{socket_name[1]}'
+
+    async def close(self):
+        """Stop listening and watching, wait for a reload in progress"""
+
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.reload_task is not None:
+            await asyncio.wait([self.reload_task])
+
+    def answer_table(self, cube: CohortCube, url) -> (int, str, bytes):
+        return 200, 'text/csv; charset=utf-8', cube.table
+
+    def answer_cohorts(self, cube: CohortCube, url) -> (int, str, bytes):
+        return 200, JSON_CONTENT_TYPE, cube.cohorts
+
+    def answer_cohort(self, cube: CohortCube, url) -> (int, str, bytes):
+        cohort_key = parse_qs(url.query).get('id', [None])[0]
+        if cohort_key in cube.cohort_answers:
+            return 200, JSON_CONTENT_TYPE, cube.cohort_answers[cohort_key]
+        return 404, JSON_CONTENT_TYPE, encode_json({'error': f'no orders for cohort: {cohort_key}'})
+
+    def answer_period(self, cube: CohortCube, url) -> (int, str, bytes):
+        period = url.path[len('/period/'):]
+        if period.isdigit() and int(period) < len(cube.period_answers):
+            return 200, JSON_CONTENT_TYPE, cube.period_answers[int(period)]
+        return 404, JSON_CONTENT_TYPE, encode_json({'error': f'no period: {period}'})
+
+    def answer_status(self, cube: CohortCube, url) -> (int, str, bytes):
+        return 200, JSON_CONTENT_TYPE, encode_json({
+            'generation': cube.generation, 'loaded_at': cube.loaded_at,
+            'reloading': self.reload_task is not None and not self.reload_task.done(),
+            'last_reload_error': self.last_reload_error, 'metrics': cube.metrics})
+
+    def answer_reload(self, cube: CohortCube, url) -> (int, str, bytes):
+        self.request_reload()
+        return 202, JSON_CONTENT_TYPE, encode_json({'generation': cube.generation})
+
+    def answer(self, method: str, target: str) -> (int, str, bytes):
+        """
+        Answer one query from the current cube, without waiting, see routes
+        :param method: HTTP method
+        :param target: HTTP request target, path and query
+        :returns HTTP status, content type and body
+        """
+
+        cube = self.cube
+        if cube is None:
+            return 503, JSON_CONTENT_TYPE, encode_json({'error': 'analysis not loaded yet'})
+        url = urlsplit(target)
+        route = self.routes.get('/period/' if url.path.startswith('/period/') else url.path)
+        if route is None:
+            if method != 'GET':
+                return 405, JSON_CONTENT_TYPE, encode_json({'error': f'method not allowed: {method}'})
+            return 404, JSON_CONTENT_TYPE, encode_json({'error': f'unknown path: {url.path}'})
+        route_method, answer_route = route
+        if method != route_method:
+            return 405, JSON_CONTENT_TYPE, encode_json({'error': f'use {route_method} for {url.path}'})
+        return answer_route(cube, url)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answer the requests of one connection, kept alive until the client closes it.
+        A request or header line longer than the reader limit is answered with 400 or 431, and closes the connection
+        """
+
+        try:
+            keep_alive = True
+            while keep_alive:
+                request_line = None
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    headers = await read_request_headers(reader)
+                except (ValueError, asyncio.LimitOverrunError):  # readline raises LimitOverrunError as ValueError
+                    status = 400 if request_line is None else 431
+                    await write_answer(writer, status, JSON_CONTENT_TYPE, encode_json(
+                        {'error': f'{"request" if request_line is None else "header"} line too long'}), False)
+                    break
+                request = request_line.decode('latin-1').split()
+                if len(request) == 3:
+                    status, content_type, body = self.answer(request[0], request[1])
+                    keep_alive = request[2] == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                else:
+                    status, content_type, body = 400, JSON_CONTENT_TYPE, encode_json({'error': 'bad request line'})
+                    keep_alive = False
+                await write_answer(writer, status, content_type, body, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client gone
+        finally:
+            writer.close()
+
+
+async def read_request_headers(reader: asyncio.StreamReader) -> dict:
+    """
+    Read the headers of a request after its request line, and skip its body: no request has one
+    :returns lower case header name to its value
+    """
+
+    headers = {}
+    header_line = await reader.readline()
+    while header_line not in (b'\r\n', b'\n', b''):
+        name, _, value = header_line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+        header_line = await reader.readline()
+    content_length = headers.get('content-length', '0')
+    if content_length.isdigit() and int(content_length) > 0:
+        await reader.readexactly(int(content_length))
+    return headers
+
+
+async def write_answer(writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes, keep_alive: bool):
+    """Write one HTTP/1.1 response, see HTTP_REASONS"""
+
+    writer.write(f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: {content_type}\r\n'
+                 f'Content-Length: {len(body)}\r\n'
+                 f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+
+
+def parse_address(address: str) -> (str, int, str):
+    """
+    :param address: 'HOST:PORT' for TCP, or the path of a Unix socket
+    :returns host, port, and None, or None, None, and the Unix socket path
+    """
+
+    if address is None or not isinstance(address, str):
+        raise TypeError(f'address must be a string: {address}')
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit() and '/' not in address:
+        return host, int(port), None
+    return None, None, address
+
+
+async def open_service_connection(address: str) -> (asyncio.StreamReader, asyncio.StreamWriter):
+    """:returns reader and writer of a connection to a service listening on address, see parse_address"""
+
+    host, port, path = parse_address(address)
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def query_service(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, target: str,
+                        method: str = 'GET') -> (int, bytes):
+    """
+    Send one query on a kept alive connection to the service and read its answer
+    :param target: path and query, like '/period/0'
+    :returns HTTP status and body
+    """
+
+    writer.write(f'{method} {target} HTTP/1.1\r\nHost: cohorts\r\n\r\n'.encode('latin-1'))
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed by the service')
+    content_length = 0
+    header_line = await reader.readline()
+    while header_line not in (b'\r\n', b'\n', b''):
+        name, _, value = header_line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value)
+        header_line = await reader.readline()
+    return int(status_line.split()[1]), await reader.readexactly(content_length)
+
+
+def serve_forever(service: CohortQueryService, address: str):
+    """Run the service on a new event loop until interrupted, see CohortQueryService.start"""
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(service.start(address))
+        print(f'Serving cohort queries on {service.get_address()}, generation {service.cube.generation}')
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(service.close())
+        loop.close()
@@ -0,0 +1,60 @@
+"""Snapshot on disk of a cohort analysis, to ingest only entries appended to the csv files since the last run.
+Save customer cohorts (customer to cohort, cohort cardinality), order aggregation (distinct customers per cell)
+and the byte offsets already read in each csv file.
+"""
+
+import os
+import pickle
+from customer_order_cohort import order_time_span_aggregation as otsa
+
+# increment when the saved state changes
+SNAPSHOT_VERSION = 3
+
+# readable from python 3.6
+PICKLE_PROTOCOL = 4
+
+
+class BuiltinsUnpickler(pickle.Unpickler):
+    """Unpickler restricted to built-in types, a snapshot never refers to a class or function"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f'snapshot should only contain built-in types: {module}.{name}')
+
+
+def save_snapshot(path_snapshot_file: str, orders_by_time_slot: otsa.OrderTimeSpanAggregation,
+                  csv_file_offsets: dict) -> int:
+    """
+    Write the state of an analysis, replacing any previous snapshot at the same path once fully written.
+    Will raise IOError if the file cannot be written
+    :param path_snapshot_file: path to write the snapshot
+    :param orders_by_time_slot: the analysis, with its customer cohorts
+    :param csv_file_offsets: csv file name to the byte offset where to start its next read
+    :return: size of the snapshot in bytes
+    """
+
+    if orders_by_time_slot is None or not isinstance(orders_by_time_slot, otsa.OrderTimeSpanAggregation):
+        raise TypeError(f'orders_by_time_slot must be a OrderTimeSpanAggregation: {orders_by_time_slot}')
+    path_temporary_file = path_snapshot_file + '.tmp'
+    with open(path_temporary_file, mode='wb') as snapshot_file:
+        pickle.dump({'version': SNAPSHOT_VERSION, 'csv_file_offsets': dict(csv_file_offsets),
+                     'analysis': orders_by_time_slot.snapshot_state()}, snapshot_file, protocol=PICKLE_PROTOCOL)
+    os.replace(path_temporary_file, path_snapshot_file)
+    return os.path.getsize(path_snapshot_file)
+
+
+def load_snapshot(path_snapshot_file: str) -> (otsa.OrderTimeSpanAggregation, dict):
+    """
+    Read the state of an analysis saved by save_snapshot.
+    Will raise IOError if the file cannot be read, and ValueError if it is not a snapshot of this version
+    :param path_snapshot_file: path of the snapshot
+    :return: the analysis with its customer cohorts, and the csv file offsets saved with it
+    """
+
+    with open(path_snapshot_file, mode='rb') as snapshot_file:
+        try:
+            snapshot = BuiltinsUnpickler(snapshot_file).load()
+        except (pickle.UnpicklingError, EOFError) as e:
+            raise ValueError(f'not a cohort analysis snapshot: {path_snapshot_file}') from e
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f'snapshot version must be {SNAPSHOT_VERSION}: {path_snapshot_file}')
+    return otsa.OrderTimeSpanAggregation.from_state(snapshot['analysis']), snapshot['csv_file_offsets']
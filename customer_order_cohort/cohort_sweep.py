@@ -0,0 +1,212 @@
+"""Several cohort analysis on the same customers and orders csv files, in a single read of each file.
+Each entry is parsed once, and routed to every analysis with a date range containing it.
+"""
+
+import datetime as dtm
+import os
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+from customer_order_cohort import csv_input
+from customer_order_cohort.pipeline_metrics import PipelineMetrics
+
+# marker for a day not yet seen by CohortSweep.parse_date_to_seconds
+_NOT_MEMOIZED = object()
+
+
+class CohortSweep:
+    """
+    Cohort analysis for a list of configurations: recent date, days per interval and number of intervals
+    """
+
+    def __init__(self, configurations: [(dtm.datetime, int, int)] = None, time_zone: dtm.tzinfo = None,
+                 sketch_precision: int = None):
+        """
+        :param time_zone: time zone of all configurations, see CustomerTimeSpanCohorts
+        :param sketch_precision: approximate distinct customers for all configurations, see OrderTimeSpanAggregation
+        """
+
+        if configurations is None or not isinstance(configurations, (list, tuple)) or len(configurations) < 1:
+            raise TypeError(f'configurations must be a non empty list: {configurations}')
+        self.configurations: [(dtm.datetime, int, int)] = [tuple(configuration) for configuration in configurations]
+        self.analysis: [otsa.OrderTimeSpanAggregation] = [
+            otsa.OrderTimeSpanAggregation(customer_cohorts=ctsc.CustomerTimeSpanCohorts(
+                recent_date=recent_date, days_interval_length=days_interval_length,
+                number_of_intervals=number_of_intervals, time_zone=time_zone), sketch_precision=sketch_precision)
+            for recent_date, days_interval_length, number_of_intervals in self.configurations]
+        # GMT seconds of the union of all date ranges, to reject entries before any routing
+        self.oldest_seconds: int = min(
+            orders.customer_cohorts.oldest_date_seconds - max(orders.customer_cohorts.utc_offsets)
+            for orders in self.analysis)
+        self.recent_seconds: int = max(
+            orders.customer_cohorts.recent_date_seconds - min(orders.customer_cohorts.utc_offsets)
+            for orders in self.analysis)
+        # 'YYYY-mm-dd' GMT day to its seconds at midnight, see CustomerTimeSpanCohorts.to_seconds
+        self.day_seconds_memo: dict = {}
+        # stages and entries rejected by every configuration, the analysis metrics count their own rejections
+        self.metrics: PipelineMetrics = PipelineMetrics()
+        output_names = [self.get_output_csv_file_path('', index) for index in range(len(self.configurations))]
+        if len(set(output_names)) < len(output_names):
+            raise ValueError(f'configurations must be distinct: {self.configurations}')
+
+    def __str__(self):
+        """Build commend prompt friendly string representation for this sweep"""
+
+        return f'Sweep of {len(self.analysis)} analysis:\n' + '\n'.join(
+            str(orders.customer_cohorts) for orders in self.analysis)
+
+    def parse_date_to_seconds(self, date_representation: str) -> int:
+        """
+        Memoized equivalent of CustomerTimeSpanCohorts.parse_date_to_seconds, shared by all configurations
+        :returns GMT seconds since 0001-01-01 00:00:00, None for invalid dates
+        """
+
+        if date_representation is not None and len(date_representation) == 19:
+            day_representation = date_representation[0:10]
+            day_seconds = self.day_seconds_memo.get(day_representation, _NOT_MEMOIZED)
+            if day_seconds is _NOT_MEMOIZED and day_representation[4] == '-' and day_representation[7] == '-' \
+                    and ctsc.CustomerTimeSpanCohorts.is_ascii_digits(
+                        day_representation[0:4] + day_representation[5:7] + day_representation[8:10]):
+                day_seconds = ctsc.CustomerTimeSpanCohorts.parse_date_to_seconds(day_representation + ' 00:00:00')
+                self.day_seconds_memo[day_representation] = day_seconds
+            if day_seconds is None:
+                return None
+            time_seconds = ctsc.CustomerTimeSpanCohorts.time_of_day_seconds_memo.get(date_representation[10:19])
+            if time_seconds is None:
+                time_seconds = ctsc.CustomerTimeSpanCohorts.memoize_time_of_day(date_representation[10:19])
+            if day_seconds is not _NOT_MEMOIZED and time_seconds is not None:
+                return day_seconds + time_seconds
+        return ctsc.CustomerTimeSpanCohorts.parse_date_to_seconds(date_representation)
+
+    def track_customer(self, customer_id: str, customer_creation_date: str) -> int:
+        """
+        Same as CustomerTimeSpanCohorts.track_customer, for all configurations
+        :param customer_id: a unique customer ID
+        :param customer_creation_date: when the customer entry was created in the input data set
+        :returns number of configurations tracking this customer from this entry"""
+
+        rejected_customers = self.metrics.rejected_customers
+        if customer_id is None:
+            rejected_customers[PipelineMetrics.MISSING_CUSTOMER_ID] += 1
+            return 0
+        created = self.parse_date_to_seconds(customer_creation_date)
+        if created is None or not self.oldest_seconds <= created < self.recent_seconds:
+            rejected_customers[PipelineMetrics.INVALID_DATE if created is None else PipelineMetrics.DATE_OUT_OF_RANGE] += 1
+            return 0
+        tracked = 0
+        duplicate = False
+        for orders in self.analysis:
+            customer_cohorts = orders.customer_cohorts
+            seconds = customer_cohorts.get_local_seconds(created) - customer_cohorts.oldest_date_seconds
+            if 0 <= seconds < customer_cohorts.recent_date_seconds - customer_cohorts.oldest_date_seconds:
+                if customer_id in customer_cohorts.customers_cohort_index:
+                    duplicate = True
+                else:
+                    customer_cohorts.add_customer(
+                        customer_id, seconds // (customer_cohorts.SECONDS_PER_DAY * customer_cohorts.days_interval_length))
+                    tracked += 1
+        if tracked == 0:
+            rejected_customers[PipelineMetrics.DUPLICATE_CUSTOMER_ID if duplicate else PipelineMetrics.DATE_OUT_OF_RANGE] += 1
+        return tracked
+
+    def track_order(self, customer_id: str, order_creation_date: str, order_sequence: str) -> int:
+        """
+        Same as OrderTimeSpanAggregation.track_order, for all configurations
+        :param customer_id: customer ID that placed the order
+        :param order_creation_date: when the order was placed
+        :param order_sequence: number of order the customer made (1 indexed)
+        :returns number of configurations counting this order"""
+
+        rejected_orders = self.metrics.rejected_orders
+        if customer_id is None:
+            rejected_orders[PipelineMetrics.MISSING_CUSTOMER_ID] += 1
+            return 0
+        created = self.parse_date_to_seconds(order_creation_date)
+        if created is None or not self.oldest_seconds <= created < self.recent_seconds:
+            rejected_orders[PipelineMetrics.INVALID_DATE if created is None else PipelineMetrics.DATE_OUT_OF_RANGE] += 1
+            return 0
+        tracked = 0
+        in_range = False
+        for orders in self.analysis:
+            customer_cohorts = orders.customer_cohorts
+            seconds = customer_cohorts.get_local_seconds(created) - customer_cohorts.oldest_date_seconds
+            if 0 <= seconds < customer_cohorts.recent_date_seconds - customer_cohorts.oldest_date_seconds:
+                in_range = True
+                located = customer_cohorts.locate_customer(customer_id)
+                if located is not None:
+                    count_and_first_count: [] = orders.get_counts_for_cohort_index(located[0], seconds)
+                    count_and_first_count[0].add(located[1])
+                    if order_sequence == '1':
+                        count_and_first_count[1].add(located[1])
+                    tracked += 1
+        if tracked == 0:
+            rejected_orders[PipelineMetrics.UNKNOWN_CUSTOMER_ID if in_range else PipelineMetrics.DATE_OUT_OF_RANGE] += 1
+        return tracked
+
+    def read_csv_files(self, path_customers_csv_file: str = './data/customers.csv',
+                       path_orders_csv_file: str = './data/orders.csv') -> int:
+        """
+        Read each csv file once for all configurations.
+        Will raise IOError if a csv file is not valid
+        :param path_customers_csv_file: path to the customers csv file, see csv_input.open_csv_input
+        :param path_orders_csv_file: path to the orders csv file, see csv_input.open_csv_input
+        :returns number of configurations with at least one customer"""
+
+        with self.metrics.measure('customer_read') as stage_metrics:
+            with csv_input.open_csv_input(path_customers_csv_file) as csv_file:
+                for entry in ctsc.skip_csv_header(csv_file):
+                    self.track_customer(entry[0], entry[1])
+                    stage_metrics.rows += 1
+        with self.metrics.measure('order_read') as stage_metrics:
+            with csv_input.open_csv_input(path_orders_csv_file) as csv_file:
+                # order ID, customer ID, order date, num order by customer
+                for entry in ctsc.skip_csv_header(csv_file):
+                    self.track_order(entry[2], entry[3], entry[1])
+                    stage_metrics.rows += 1
+        return sum(1 for orders in self.analysis if len(orders.customer_cohorts.cohort_cardinality) > 0)
+
+    def get_output_csv_file_path(self, output_csv_file_path: str, configuration_index: int) -> str:
+        """
+        :param output_csv_file_path: path of the output for a single configuration, like './ordercounts.csv'
+        :param configuration_index: index of a configuration
+        :returns the output path with recent date and time, UTC offset of the recent date,
+        days per interval and number of intervals of the configuration, like './ordercounts-2015-07-07T234713-0700-7x8.csv'.
+        Configurations differing only by time or time zone have different paths"""
+
+        recent_date, days_interval_length, number_of_intervals = self.configurations[configuration_index]
+        customer_cohorts = self.analysis[configuration_index].customer_cohorts
+        offset_minutes = customer_cohorts.delta_time_zone_seconds // 60
+        offset = f'{"-" if offset_minutes < 0 else "+"}{abs(offset_minutes) // 60:02d}{abs(offset_minutes) % 60:02d}'
+        root, extension = os.path.splitext(output_csv_file_path)
+        return f'{root}-{recent_date:%Y-%m-%dT%H%M%S}{offset}-{days_interval_length}x{number_of_intervals}{extension}'
+
+    def write_orders_count_by_cohorts_files(self, output_file_path: str, output_format: str = 'human') -> [str]:
+        """
+        Write one order counts file per configuration, see OrderTimeSpanAggregation.write_orders_count_by_cohorts_file
+        :param output_file_path: path of the output for a single configuration, see get_output_csv_file_path
+        :param output_format: one of cohort_writers.OUTPUT_FORMATS
+        :returns paths of the written files, in configurations order"""
+
+        output_file_paths = []
+        with self.metrics.measure('csv_write') as stage_metrics:
+            for configuration_index, orders in enumerate(self.analysis):
+                output_file_paths.append(self.get_output_csv_file_path(output_file_path, configuration_index))
+                stage_metrics.rows += orders.write_orders_count_by_cohorts_file(output_file_paths[-1], output_format)
+        return output_file_paths
+
+    def write_orders_count_by_cohorts_csv_files(self, output_csv_file_path: str) -> [str]:
+        """
+        Write one order counts csv file per configuration,
+        see OrderTimeSpanAggregation.write_orders_count_by_cohorts_csv_file
+        :param output_csv_file_path: path of the output for a single configuration, see get_output_csv_file_path
+        :returns paths of the written files, in configurations order"""
+
+        return self.write_orders_count_by_cohorts_files(output_csv_file_path)
+
+
+def parse_configuration(configuration_representation: str) -> (dtm.datetime, int, int):
+    """
+    :param configuration_representation: 'YYYY-mm-dd:days_interval_length:number_of_intervals', like '2015-07-07:7:8'
+    :returns the configuration tuple, raise ValueError if the string does not match
+    """
+
+    recent_date, days_interval_length, number_of_intervals = configuration_representation.split(':')
+    return dtm.datetime.strptime(recent_date, '%Y-%m-%d'), int(days_interval_length), int(number_of_intervals)
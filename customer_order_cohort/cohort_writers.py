@@ -0,0 +1,161 @@
+"""Writers of the order counts by customer cohort, streamed one cohort at a time, most recent cohort first.
+Cohorts are walked in CustomerTimeSpanCohorts.cohort_table order, nothing is sorted or materialized.
+
+    human    today's ordercounts.csv: two lines per cohort with percentages, for people
+    csv      one line per cohort with integer counts: cohort,customers,orders_0..,first_orders_0..
+    jsonl    one JSON object per line: {"cohort", "customers", "orders": [...], "first_orders": [...]}
+    binary   fixed size records of little endian 64 bits integers, see write_binary and read_binary
+
+Periods are counted from the start of each cohort, period 0 is its first days. A cohort has orders
+only for the periods before the recent date of the analysis: missing periods are empty in csv,
+absent in jsonl and -1 in binary.
+"""
+
+import csv
+import json
+import sys
+from array import array
+
+# first bytes of the binary format, with its version
+BINARY_MAGIC = b'COHORTB1'
+
+
+def iterate_cohort_counts(orders_by_time_slot) -> iter:
+    """
+    :param orders_by_time_slot: OrderTimeSpanAggregation, or any analysis with its customer_cohorts and
+    customer_group_to_order_accumulated
+    :returns iterator of cohort index, cohort ID, customers, orders per period and first orders per period,
+    for each cohort with orders, most recent cohort first, see OrderTimeSpanAggregation.get_counts_for_cohort
+    """
+
+    customer_cohorts = orders_by_time_slot.customer_cohorts
+    for cohort_index in range(len(customer_cohorts.cohort_table) - 1, -1, -1):
+        cohort_key = customer_cohorts.cohort_table[cohort_index].id
+        periods = orders_by_time_slot.customer_group_to_order_accumulated.get(cohort_key)
+        if periods is not None:
+            yield cohort_index, cohort_key, customer_cohorts.cohort_cardinality[cohort_key], \
+                [len(order_count[0]) for order_count in reversed(periods)], \
+                [len(order_count[1]) for order_count in reversed(periods)]
+
+
+def get_period_headers(customer_cohorts) -> [str]:
+    """:returns '0-6 days' like header of each period"""
+
+    days_in_period: int = customer_cohorts.days_interval_length
+    return [f'{i*days_in_period}-{(i+1)*days_in_period-1} days' for i in range(customer_cohorts.number_of_intervals)]
+
+
+def write_human(orders_by_time_slot, text_file) -> int:
+    """
+    Two lines per customer cohort: cohort ID, total customer count in the cohort,
+    then one column per period, line 1 for total count, line 2 for first count, with their percentage
+    :returns number of lines written after the header"""
+
+    entry_writer = csv.writer(text_file, lineterminator='\n')
+    entry_writer.writerow(['Cohort', 'Customers'] + get_period_headers(orders_by_time_slot.customer_cohorts))
+    lines = 0
+    for _, cohort_key, cohort_total, orders, first_orders in iterate_cohort_counts(orders_by_time_slot):
+        entry_writer.writerow([cohort_key, cohort_total] + [
+            f'{round(100*count/cohort_total, 2)}% orders ({count})' for count in orders])
+        entry_writer.writerow(['', ''] + [
+            f'{round(100*count/cohort_total, 2)}% 1st time ({count})' for count in first_orders])
+        lines += 2
+    return lines
+
+
+def write_counts_csv(orders_by_time_slot, text_file) -> int:
+    """One line per customer cohort, integer counts only. :returns number of lines written after the header"""
+
+    number_of_intervals = orders_by_time_slot.customer_cohorts.number_of_intervals
+    entry_writer = csv.writer(text_file, lineterminator='\n')
+    entry_writer.writerow(['cohort', 'customers'] + [f'orders_{i}' for i in range(number_of_intervals)] +
+                          [f'first_orders_{i}' for i in range(number_of_intervals)])
+    lines = 0
+    for _, cohort_key, cohort_total, orders, first_orders in iterate_cohort_counts(orders_by_time_slot):
+        padding = [''] * (number_of_intervals - len(orders))
+        entry_writer.writerow([cohort_key, cohort_total] + orders + padding + first_orders + padding)
+        lines += 1
+    return lines
+
+
+def write_json_lines(orders_by_time_slot, text_file) -> int:
+    """One JSON object per customer cohort. :returns number of lines written"""
+
+    lines = 0
+    for _, cohort_key, cohort_total, orders, first_orders in iterate_cohort_counts(orders_by_time_slot):
+        text_file.write(json.dumps({'cohort': cohort_key, 'customers': cohort_total, 'orders': orders,
+                                    'first_orders': first_orders}, separators=(',', ':')))
+        text_file.write('\n')
+        lines += 1
+    return lines
+
+
+def write_binary(orders_by_time_slot, binary_file) -> int:
+    """
+    BINARY_MAGIC, header length as 4 bytes little endian, JSON header padded with spaces to 8 bytes,
+    then one record per customer cohort of 2 + 2 * number_of_intervals little endian signed 64 bits integers:
+    cohort index in cohort_table, customers, orders per period, first orders per period.
+    Fixed size records can be mapped as a matrix of integers, one line per cohort.
+    :returns number of records written"""
+
+    customer_cohorts = orders_by_time_slot.customer_cohorts
+    number_of_intervals = customer_cohorts.number_of_intervals
+    header = json.dumps({'oldest_date': customer_cohorts.oldest_date.isoformat(),
+                         'days_interval_length': customer_cohorts.days_interval_length,
+                         'number_of_intervals': number_of_intervals,
+                         'record_items': 2 + 2 * number_of_intervals}).encode()
+    header += b' ' * (-(len(BINARY_MAGIC) + 4 + len(header)) % 8)
+    binary_file.write(BINARY_MAGIC + len(header).to_bytes(4, 'little') + header)
+    records = 0
+    for cohort_index, _, cohort_total, orders, first_orders in iterate_cohort_counts(orders_by_time_slot):
+        padding = [-1] * (number_of_intervals - len(orders))
+        record = array('q', [cohort_index, cohort_total] + orders + padding + first_orders + padding)
+        if sys.byteorder == 'big':
+            record.byteswap()
+        binary_file.write(record.tobytes())
+        records += 1
+    return records
+
+
+def read_binary(binary_file) -> (dict, [array]):
+    """
+    Read a file written by write_binary
+    :param binary_file: file open in binary mode
+    :returns JSON header and one array of integers per record
+    """
+
+    magic = binary_file.read(len(BINARY_MAGIC))
+    if magic != BINARY_MAGIC:
+        raise ValueError(f'not a binary cohort counts file: {magic}')
+    header = json.loads(binary_file.read(int.from_bytes(binary_file.read(4), 'little')).decode())
+    items = array('q', binary_file.read())
+    if sys.byteorder == 'big':
+        items.byteswap()
+    record_items = header['record_items']
+    return header, [items[start:start + record_items] for start in range(0, len(items), record_items)]
+
+
+# output format to its writer function and whether it writes bytes
+OUTPUT_FORMATS = {'human': (write_human, False), 'csv': (write_counts_csv, False),
+                  'jsonl': (write_json_lines, False), 'binary': (write_binary, True)}
+
+
+def write_orders_count_by_cohorts_file(orders_by_time_slot, output_file_path: str, output_format: str = 'human') -> int:
+    """
+    Write the order counts by customer cohort in a file. Will raise IOError if the file cannot be written
+    :param orders_by_time_slot: OrderTimeSpanAggregation
+    :param output_file_path: path to write file
+    :param output_format: one of OUTPUT_FORMATS
+    :returns number of lines or records written after the header
+    """
+
+    if output_file_path is None or not isinstance(output_file_path, str):
+        raise TypeError(f'output_file_path must be a string: {output_file_path}')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'output_format must be one of {", ".join(OUTPUT_FORMATS)}: {output_format}')
+    writer, binary = OUTPUT_FORMATS[output_format]
+    if binary:
+        with open(output_file_path, mode='wb') as output_file:
+            return writer(orders_by_time_slot, output_file)
+    with open(output_file_path, mode='w', encoding='utf8') as output_file:
+        return writer(orders_by_time_slot, output_file)
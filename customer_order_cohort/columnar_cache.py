@@ -0,0 +1,147 @@
+"""Binary columnar cache of parsed csv files, for reruns on the same input with a different analysis.
+The first read of a csv file parses the needed columns to integers and writes them in a sidecar file.
+Next reads map the sidecar in memory, without copy, as long as the csv file fingerprint is unchanged:
+size, modification time and hash of its first and last bytes.
+
+Sidecar layout: MAGIC, header length as 4 bytes little endian, JSON header padded to 8 bytes,
+then each column as ITEM_FORMAT integers in native byte order.
+A csv file with a value that cannot be cached gets a sidecar without columns, marked not cacheable in its header:
+next reads parse it as csv right away, until its fingerprint changes.
+"""
+
+from array import array
+import hashlib
+import json
+import mmap
+import os
+from customer_order_cohort import csv_input
+
+MAGIC = b'COHORTC1'
+
+# signed 64 bits integers, as stored in each column
+ITEM_FORMAT = 'q'
+
+# returned by map_cache_file for a sidecar marking its csv file as not cacheable
+NOT_CACHEABLE = object()
+
+# number of bytes hashed at the start and at the end of the csv file for its fingerprint
+FINGERPRINT_SAMPLE_BYTES = 1 << 16
+
+
+class NotCacheableError(ValueError):
+    """Raised by a column converter when a csv value cannot be stored as an integer"""
+
+
+def get_csv_file_fingerprint(path_csv_file: str) -> dict:
+    """
+    :param path_csv_file: path to the csv file
+    :return: size, modification time in nanoseconds and hash of the first and last bytes of the file
+    """
+
+    with open(path_csv_file, mode='rb') as csv_file:
+        status = os.fstat(csv_file.fileno())
+        sample_hash = hashlib.blake2b(csv_file.read(FINGERPRINT_SAMPLE_BYTES), digest_size=16)
+        csv_file.seek(max(0, status.st_size - FINGERPRINT_SAMPLE_BYTES))
+        sample_hash.update(csv_file.read(FINGERPRINT_SAMPLE_BYTES))
+    return {'size': status.st_size, 'mtime_ns': status.st_mtime_ns, 'hash': sample_hash.hexdigest()}
+
+
+def map_cache_file(path_cache_file: str, header_fields: dict) -> [memoryview]:
+    """
+    Map the columns of a sidecar file if its header matches
+    :param path_cache_file: path to the sidecar file
+    :param header_fields: expected fingerprint and layout
+    :return: one read only memoryview of integers per column, None if the sidecar is missing or stale,
+    NOT_CACHEABLE if the sidecar marks the csv file as not cacheable
+    """
+
+    try:
+        with open(path_cache_file, mode='rb') as cache_file:
+            mapped = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):  # ValueError for an empty file
+        return None
+    header_length = int.from_bytes(mapped[len(MAGIC):len(MAGIC) + 4], 'little')
+    columns_start = len(MAGIC) + 4 + header_length
+    try:
+        header = json.loads(mapped[len(MAGIC) + 4:columns_start].decode())
+    except ValueError:
+        header = None
+    if mapped[0:len(MAGIC)] != MAGIC or not isinstance(header, dict) \
+            or any(header.get(field) != value for field, value in header_fields.items()):
+        mapped.close()
+        return None
+    if header.get('not_cacheable'):
+        mapped.close()
+        return NOT_CACHEABLE
+    rows = header['rows']
+    item_size = array(ITEM_FORMAT).itemsize
+    if len(mapped) != columns_start + rows * item_size * len(header['columns']):
+        mapped.close()
+        return None
+    view = memoryview(mapped)
+    return [view[columns_start + column * rows * item_size:columns_start + (column + 1) * rows * item_size]
+            .cast(ITEM_FORMAT) for column in range(len(header['columns']))]
+
+
+def write_cache_file(path_cache_file: str, header_fields: dict, columns: [array]) -> int:
+    """
+    Write a sidecar file, replacing any previous one once fully written
+    :param path_cache_file: path to the sidecar file
+    :param header_fields: fingerprint and layout of the columns
+    :param columns: parsed columns, same length
+    :return: size of the sidecar file in bytes
+    """
+
+    header = dict(header_fields, rows=len(columns[0]) if columns else 0)
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (-(len(MAGIC) + 4 + len(header_bytes)) % 8)
+    path_temporary_file = f'{path_cache_file}.{os.getpid()}.tmp'
+    with open(path_temporary_file, mode='wb') as cache_file:
+        cache_file.write(MAGIC)
+        cache_file.write(len(header_bytes).to_bytes(4, 'little'))
+        cache_file.write(header_bytes)
+        for column in columns:
+            column.tofile(cache_file)
+    os.replace(path_temporary_file, path_cache_file)
+    return os.path.getsize(path_cache_file)
+
+
+def read_csv_columns(path_csv_file: str, layout: str, columns: [(int, callable)], entry_reader_factory,
+                     path_cache_file: str = None) -> [memoryview]:
+    """
+    Get integer columns of a csv file, from its sidecar file when still valid,
+    else by parsing the csv file and writing the sidecar file for next reads.
+    Will raise IOError if path_csv_file is not valid
+    :param path_csv_file: path to the csv file, compressed or not, see csv_input.open_csv_input
+    :param layout: name and version of the columns and their converters, a sidecar with another layout is stale
+    :param columns: index of each column in a csv entry, with its converter from string to integer,
+    raising NotCacheableError when the value cannot be cached
+    :param entry_reader_factory: function of an open text file returning an iterator on entries after the header
+    :param path_cache_file: path to the sidecar file, default is path_csv_file with '.columns' suffix
+    :return: one read only memoryview or array of integers per column, None if a value cannot be cached
+    """
+
+    if path_cache_file is None:
+        path_cache_file = path_csv_file + '.columns'
+    header_fields = {'fingerprint': get_csv_file_fingerprint(path_csv_file), 'layout': layout,
+                     'columns': [index for index, _ in columns]}
+    mapped_columns = map_cache_file(path_cache_file, header_fields)
+    if mapped_columns is NOT_CACHEABLE:
+        return None
+    if mapped_columns is not None:
+        return mapped_columns
+    parsed_columns = [array(ITEM_FORMAT) for _ in columns]
+    with csv_input.open_csv_input(path_csv_file) as csv_file:
+        try:
+            for entry in entry_reader_factory(csv_file):
+                for parsed_column, (index, converter) in zip(parsed_columns, columns):
+                    parsed_column.append(converter(entry[index]))
+        except NotCacheableError:
+            parsed_columns = None
+    # the csv file may have changed while parsed, the sidecar would not match it
+    if get_csv_file_fingerprint(path_csv_file) == header_fields['fingerprint']:
+        if parsed_columns is None:  # not parsed again up to the same value on next reads
+            write_cache_file(path_cache_file, dict(header_fields, not_cacheable=True), [])
+        else:
+            write_cache_file(path_cache_file, header_fields, parsed_columns)
+    return parsed_columns
@@ -0,0 +1,164 @@
+"""Read the customers and orders csv files at the same time, in a single pass over each file.
+Worker processes parse the orders csv file, split in new line aligned byte ranges as in
+OrderTimeSpanAggregation.read_orders_csv_file_in_parallel, into columns of customer IDs and encoded order dates,
+while this process reads the customers file. Parsing the orders and their dates is about two thirds of their read:
+once all customers are tracked, only the lookup of each customer and the count of its order are left to this process.
+Ranges are tracked in file order, so results and rejected entries are the same as reading the customers file,
+then the orders file. The scans overlap on at least two cores, see benchmarks/bench_concurrent_ingestion.py.
+"""
+
+import csv
+import io
+import multiprocessing
+import time
+from array import array
+from customer_order_cohort import csv_input as ci, customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+from customer_order_cohort.pipeline_metrics import PipelineMetrics
+
+# date rejection reasons of parsed orders, stored as negative codes, see parse_order_entries
+_DATE_REJECTIONS = (PipelineMetrics.INVALID_DATE, PipelineMetrics.DATE_OUT_OF_RANGE)
+
+
+class ConcurrentIngestion:
+    """
+    Read the customers and orders csv files of an aggregation concurrently, see module documentation
+    """
+
+    def __init__(self, orders_by_time_slot: otsa.OrderTimeSpanAggregation, workers: int = 2,
+                 ranges_per_worker: int = 4):
+        """
+        :param orders_by_time_slot: aggregation to fill, and its customer cohorts, not yet read
+        :param workers: number of processes parsing the orders csv file
+        :param ranges_per_worker: number of byte ranges per process, to track the first ones while the others are parsed
+        """
+
+        if orders_by_time_slot is None or not isinstance(orders_by_time_slot, otsa.OrderTimeSpanAggregation):
+            raise TypeError(f'orders_by_time_slot must be an OrderTimeSpanAggregation: {orders_by_time_slot}')
+        for name, value in (('workers', workers), ('ranges_per_worker', ranges_per_worker)):
+            if value is None or not isinstance(value, int):
+                raise TypeError(f'{name} must be an integer: {value}')
+            if value < 1:
+                raise ValueError(f'value for {name} must be a positive integer: {value}')
+        self.orders_by_time_slot: otsa.OrderTimeSpanAggregation = orders_by_time_slot
+        self.customer_cohorts: ctsc.CustomerTimeSpanCohorts = orders_by_time_slot.customer_cohorts
+        self.metrics: PipelineMetrics = orders_by_time_slot.metrics
+        self.workers: int = workers
+        self.ranges_per_worker: int = ranges_per_worker
+        # byte ranges of the last read, and time spent waiting for their parsed columns once customers were read
+        self.byte_ranges: int = 0
+        self.wait_seconds: float = 0.0
+
+    def __str__(self):
+        """Build commend prompt friendly string representation of the last read"""
+
+        return f'Concurrent read: orders parsed in {self.byte_ranges} ranges by {self.workers} processes,' \
+               f' waited {self.wait_seconds:.3f}s for them after the customers'
+
+    def read_csv_files(self, path_customers_csv_file='./data/customers.csv',
+                       path_orders_csv_file='./data/orders.csv') -> int:
+        """
+        Parse the orders csv file in worker processes while the customers csv file is read here,
+        then track the parsed orders. Quoted values of the orders csv file must not contain new lines.
+        Will raise IOError if a path is invalid
+        :param path_customers_csv_file: path to the customers csv file, compressed or not, '-' for the standard input,
+        or an open file, see csv_input.open_csv_input
+        :param path_orders_csv_file: path to the orders csv file, compressed or not. Compressed files are parsed
+        by one process
+        :returns the total number of customer groups"""
+
+        if path_customers_csv_file is None or not (isinstance(path_customers_csv_file, str) or
+                                                   hasattr(path_customers_csv_file, 'read')):
+            raise TypeError(f'path_customers_csv_file must be a string or a file object: {path_customers_csv_file}')
+        if path_orders_csv_file is None or not isinstance(path_orders_csv_file, str):
+            raise TypeError(f'path_orders_csv_file must be a string: {path_orders_csv_file}')
+        if path_orders_csv_file == ci.STDIN_PATH:
+            raise ValueError('orders are parsed by worker processes, they cannot be read from the standard input')
+        byte_ranges = otsa.split_csv_file_byte_ranges(path_orders_csv_file, self.workers * self.ranges_per_worker) \
+            if ci.is_plain_csv_file(path_orders_csv_file) else [(None, None)]
+        self.byte_ranges = len(byte_ranges)
+        self.wait_seconds = 0.0
+        with multiprocessing.Pool(self.workers, initializer=otsa.init_order_worker,
+                                  initargs=(self.customer_cohorts,)) as pool:
+            # parsing starts now, in file order
+            parsed_ranges = pool.imap(parse_orders_byte_range, [
+                (path_orders_csv_file, start, end) for start, end in byte_ranges])
+            self.customer_cohorts.read_customers_csv_file(path_customers_csv_file)
+            if len(self.customer_cohorts.cohort_cardinality) < 1:
+                raise ValueError(f'at least on cohort is needed in customer_cohorts: {self.customer_cohorts}')
+            with self.metrics.measure('order_read'):
+                for _ in byte_ranges:
+                    start = time.perf_counter()
+                    customer_ids, encoded_orders = next(parsed_ranges)
+                    self.wait_seconds += time.perf_counter() - start
+                    self.track_order_columns(customer_ids.split('\n') if encoded_orders else [], encoded_orders)
+        return len(self.customer_cohorts.cohort_cardinality)
+
+    def track_order_columns(self, customer_ids: [str], encoded_orders: array) -> int:
+        """
+        Same as track_order, for orders parsed by parse_order_entries, in one customer lookup each
+        :param customer_ids: customer ID of each order
+        :param encoded_orders: date and first order flag of each order, or its date rejection reason
+        :returns number of orders tracked"""
+
+        get_packed_index = self.customer_cohorts.customers_cohort_index.get
+        number_of_intervals = self.customer_cohorts.number_of_intervals
+        get_counts_for_cohort_index = self.orders_by_time_slot.get_counts_for_cohort_index
+        rejected_orders = self.metrics.rejected_orders
+        tracked = 0
+        for customer_id, encoded_order in zip(customer_ids, encoded_orders):
+            packed_index = get_packed_index(customer_id)
+            if packed_index is None:
+                rejected_orders[PipelineMetrics.UNKNOWN_CUSTOMER_ID] += 1
+            elif encoded_order < 0:
+                rejected_orders[_DATE_REJECTIONS[-1 - encoded_order]] += 1
+            else:
+                customer_ordinal, cohort_index = divmod(packed_index, number_of_intervals)
+                count_and_first_count: [] = get_counts_for_cohort_index(cohort_index, encoded_order >> 1)
+                count_and_first_count[0].add(customer_ordinal)
+                if encoded_order & 1:
+                    count_and_first_count[1].add(customer_ordinal)
+                tracked += 1
+        self.metrics.add_rows('order_read', len(encoded_orders))
+        return tracked
+
+
+def parse_order_entries(entry_reader) -> (str, array):
+    """
+    Parse order entries with the customer cohorts of the worker process, see otsa.init_order_worker
+    :param entry_reader: order entries: order ID, order number, customer ID, order date
+    :return: customer IDs of the orders joined by new lines, and for each order 2 * seconds from oldest_date
+    plus 1 for a first order, or -1 - index of its date rejection reason in _DATE_REJECTIONS
+    """
+
+    customer_cohorts = otsa.worker_customer_cohorts
+    seconds_from_oldest = customer_cohorts.seconds_from_oldest
+    customer_ids = []
+    encoded_orders = array('q')
+    for entry in entry_reader:
+        customer_ids.append(entry[2])
+        order_created_seconds = seconds_from_oldest(entry[3])
+        encoded_orders.append(
+            -1 - _DATE_REJECTIONS.index(customer_cohorts.get_date_rejection_reason(entry[3]))
+            if order_created_seconds is None else 2 * order_created_seconds + (entry[1] == '1'))
+    return '\n'.join(customer_ids), encoded_orders
+
+
+def parse_orders_byte_range(path_start_end: (str, int, int)) -> (str, array):
+    """
+    Parse the orders of a byte range of the orders csv file, in a worker process
+    :param path_start_end: path to the orders csv file, start and end byte offsets of new line aligned entries,
+    or None and None for all entries of a compressed file
+    :return: parsed orders, see parse_order_entries
+    """
+
+    path_csv_file, start, end = path_start_end
+    if start is None:
+        with ci.open_csv_input(path_csv_file) as csv_file:
+            entry_reader = csv.reader(csv_file)
+            next(entry_reader, None)  # skip header
+            return parse_order_entries(entry_reader)
+    with open(path_csv_file, mode='rb') as csv_file:
+        csv_file.seek(start)
+        entries = io.StringIO(csv_file.read(end - start).decode(), newline='')
+    return parse_order_entries(csv.reader(entries))
@@ -0,0 +1,184 @@
+"""Open csv input from a path, a compressed path, an open file or stdin, for the csv readers.
+Gzip, bzip2 and xz compression is detected by file extension or magic bytes. Compressed input is
+decompressed in a background thread, by large chunks through a bounded queue: parsing runs while the
+next chunks are decompressed, and memory stays constant whatever the size of the input.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+
+# compression name to the file extensions, magic bytes and open function of its compressed files
+COMPRESSIONS = {'gzip': (('.gz', '.gzip'), b'\x1f\x8b', gzip.open),
+                'bzip2': (('.bz2',), b'BZh', bz2.open),
+                'xz': (('.xz', '.lzma'), b'\xfd7zXZ\x00', lzma.open)}
+
+# bytes of decompressed data per chunk given by the background thread
+CHUNK_SIZE = 1 << 20
+
+# chunks decompressed ahead of parsing, bounds the memory used by the background thread
+QUEUED_CHUNKS = 4
+
+# path for the standard input
+STDIN_PATH = '-'
+
+
+def detect_compression(path_csv_file: str = None, magic_bytes: bytes = b'') -> str:
+    """
+    :param path_csv_file: path of the csv file, its extension is checked first
+    :param magic_bytes: first bytes of the file, checked when the extension is unknown
+    :returns one of COMPRESSIONS, None for an uncompressed file
+    """
+
+    if path_csv_file is not None:
+        extension = os.path.splitext(path_csv_file)[1].lower()
+        for compression, (extensions, _, _) in COMPRESSIONS.items():
+            if extension in extensions:
+                return compression
+    for compression, (_, magic, _) in COMPRESSIONS.items():
+        if magic_bytes.startswith(magic):
+            return compression
+    return None
+
+
+def is_plain_csv_file(path_csv_file) -> bool:
+    """:returns True for a path to an uncompressed file, that can be read by byte offsets"""
+
+    if not isinstance(path_csv_file, str) or path_csv_file == STDIN_PATH:
+        return False
+    with open(path_csv_file, mode='rb') as binary_file:
+        return detect_compression(path_csv_file, peek_magic_bytes(binary_file)) is None
+
+
+class BackgroundReader(io.RawIOBase):
+    """
+    Raw binary stream reading another stream in a background thread, CHUNK_SIZE bytes at a time,
+    at most QUEUED_CHUNKS ahead of the reader
+    """
+
+    def __init__(self, stream, chunk_size: int = CHUNK_SIZE, queued_chunks: int = QUEUED_CHUNKS):
+        """:param stream: binary stream, closed with this one"""
+
+        super().__init__()
+        self.stream = stream
+        self.chunk_size: int = chunk_size
+        self.chunks: queue.Queue = queue.Queue(queued_chunks)
+        self.pending: memoryview = memoryview(b'')
+        self.at_end: bool = False
+        self.stopped: bool = False
+        self.thread = threading.Thread(target=self.fill, name='csv-input-reader', daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        """Background thread: read chunks until the end of the stream, an empty chunk marks the end"""
+
+        try:
+            chunk = self.stream.read(self.chunk_size)
+            while not self.stopped:
+                self.put(chunk)
+                if not chunk:
+                    return
+                chunk = self.stream.read(self.chunk_size)
+        except Exception as e:  # raised again by readinto, in the reading thread
+            self.put(e)
+
+    def put(self, item):
+        while not self.stopped:
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass  # check stopped again, the reader may be gone
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self.pending:
+            if self.at_end:
+                return 0
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                self.at_end = True
+                raise chunk
+            if not chunk:
+                self.at_end = True
+                return 0
+            self.pending = memoryview(chunk)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped = True
+            self.thread.join()
+            self.stream.close()
+        super().close()
+
+
+def peek_magic_bytes(binary_file) -> bytes:
+    """:returns first bytes of a binary file without consuming them, empty if it can neither peek nor seek"""
+
+    size = max(len(magic) for _, magic, _ in COMPRESSIONS.values())
+    if hasattr(binary_file, 'peek'):
+        return binary_file.peek(size)[:size]
+    if binary_file.seekable():
+        position = binary_file.tell()
+        magic_bytes = binary_file.read(size)
+        binary_file.seek(position)
+        return magic_bytes
+    return b''
+
+
+@contextmanager
+def open_csv_input(path_csv_file, background: bool = True):
+    """
+    Context manager of a text file on csv input. Only the files opened here are closed on exit.
+    Will raise IOError if path_csv_file is not valid
+    :param path_csv_file: path to a csv file, compressed or not, STDIN_PATH for the standard input,
+    or an open text or binary file, compressed or not
+    :param background: decompress in a background thread, see BackgroundReader
+    :returns text file, with the same encoding and new line handling as open(path_csv_file, mode='r')
+    """
+
+    if isinstance(path_csv_file, str) and path_csv_file != STDIN_PATH:
+        binary_file = open(path_csv_file, mode='rb')
+        compression = detect_compression(path_csv_file, peek_magic_bytes(binary_file))
+        if compression is None:
+            binary_file.close()
+            with open(path_csv_file, mode='r') as csv_file:
+                yield csv_file
+            return
+        owned = True
+    elif path_csv_file == STDIN_PATH or hasattr(path_csv_file, 'read'):
+        binary_file = sys.stdin.buffer if path_csv_file == STDIN_PATH else path_csv_file
+        if isinstance(binary_file, io.TextIOBase):
+            yield binary_file
+            return
+        compression = detect_compression(magic_bytes=peek_magic_bytes(binary_file))
+        owned = False
+    else:
+        raise TypeError(f'path_csv_file must be a string or a file object: {path_csv_file}')
+    try:
+        stream = binary_file if compression is None else COMPRESSIONS[compression][2](binary_file, mode='rb')
+        if compression is not None and background:
+            stream = io.BufferedReader(BackgroundReader(stream), CHUNK_SIZE)
+        csv_file = io.TextIOWrapper(stream)
+        try:
+            yield csv_file
+        finally:
+            if compression is None:
+                csv_file.detach()  # the caller's file stays open
+            else:
+                csv_file.close()
+    finally:
+        if owned:
+            binary_file.close()
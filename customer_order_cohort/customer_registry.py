@@ -0,0 +1,312 @@
+"""Compact registry of customer ID to an integer, the packed cohort index and ordinal of CustomerTimeSpanCohorts.
+Decimal customer IDs, like the ones of ./data, are kept as integers in arrays, without any object per customer:
+    dense IDs, like database sequences, index an array of values directly: 4 to 16 bytes per customer,
+    sparse IDs are keys of an open addressing hash table of two arrays: 16 to 32 bytes per customer.
+The layout is chosen again each time the arrays grow. Other customer IDs are kept in a dict.
+This trades lookup speed for memory: a lookup in python code is 2 to 4 times slower than in a dict, see
+benchmarks/bench_customer_registry.py. CustomerTimeSpanCohorts fills a dict, and compacts it at once into a registry
+only when asked to, for windows too large for memory, see CustomerTimeSpanCohorts.compact_customer_index.
+"""
+
+from array import array
+from collections.abc import Mapping
+
+# key of an empty slot of the hash table, never the key of a decimal customer ID
+_EMPTY_KEY = -1
+
+# 2 ** 64 / golden ratio, spreads consecutive keys over the slots, see CustomerRegistry.get_slot
+_FIBONACCI_MULTIPLIER = 0x9e3779b97f4a7c15
+_HASH_MASK = (1 << 64) - 1
+
+
+class CustomerRegistry(Mapping):
+    """
+    Mapping of customer ID string to a non negative integer, a few bytes per decimal customer ID.
+    Same lookup API as a dict: in, [], get, len, iteration, plus assignment and update. Customers are never removed.
+    Values are stored plus one, 0 for no value, as 32 bits integers until a value needs 64 bits.
+    """
+
+    # slots of the smallest hash table, a power of 2
+    INITIAL_SLOTS = 1 << 10
+
+    # at most 3 slots out of 4 of the hash table are used, longer probe sequences above
+    MAX_LOAD_NUMERATOR = 3
+    MAX_LOAD_DENOMINATOR = 4
+
+    # direct values for keys in a range up to this many times the number of keys, or up to MIN_DIRECT_SLOTS
+    MAX_DIRECT_SLOTS_PER_KEY = 4
+    MIN_DIRECT_SLOTS = 1 << 16
+
+    def __init__(self):
+        # hash table layout: decimal customer IDs as integers, _EMPTY_KEY for empty slots. None for direct layout
+        self.slot_keys: array = None
+        # values plus one, of the key in the same slot of slot_keys, or of the key base_key + index
+        self.slot_values: array = array('I')
+        self.base_key: int = 0
+        self.key_count: int = 0
+        self.min_key: int = None
+        self.max_key: int = None
+        self.shift: int = 64
+        # other customer IDs: not decimal, with leading zeros, or too large for 64 bits
+        self.other_ids: dict = {}
+
+    @staticmethod
+    def parse_key(customer_id: str) -> int:
+        """:returns the integer of a decimal customer ID with the same string representation, None for others"""
+
+        if customer_id.__class__ is str and customer_id.isdigit() and len(customer_id) < 19 \
+                and max(customer_id) <= '9' and (customer_id[0] != '0' or len(customer_id) == 1):
+            return int(customer_id)
+        return None
+
+    def get_slot(self, key: int) -> int:
+        """:returns slot of a key in the hash table, or of the empty slot where it would be stored"""
+
+        slot_keys = self.slot_keys
+        mask = len(slot_keys) - 1
+        slot = ((key * _FIBONACCI_MULTIPLIER) & _HASH_MASK) >> self.shift
+        slot_key = slot_keys[slot]
+        while slot_key != key and slot_key != _EMPTY_KEY:
+            slot = (slot + 1) & mask
+            slot_key = slot_keys[slot]
+        return slot
+
+    def get(self, customer_id: str, default=None) -> int:
+        # same as parse_key and get_slot, inlined for track_order
+        if customer_id.__class__ is not str or not customer_id.isdigit() or len(customer_id) > 18 \
+                or max(customer_id) > '9' or (customer_id[0] == '0' and len(customer_id) > 1):
+            return self.other_ids.get(customer_id, default)
+        key = int(customer_id)
+        slot_keys = self.slot_keys
+        if slot_keys is None:
+            index = key - self.base_key
+            value = self.slot_values[index] if 0 <= index < len(self.slot_values) else 0
+            return value - 1 if value else default
+        slot = ((key * _FIBONACCI_MULTIPLIER) & _HASH_MASK) >> self.shift
+        slot_key = slot_keys[slot]
+        while slot_key != key:
+            if slot_key == _EMPTY_KEY:
+                return default
+            slot = (slot + 1) & (len(slot_keys) - 1)
+            slot_key = slot_keys[slot]
+        return self.slot_values[slot] - 1
+
+    def __getitem__(self, customer_id: str) -> int:
+        value = self.get(customer_id)
+        if value is None:
+            raise KeyError(customer_id)
+        return value
+
+    def __contains__(self, customer_id) -> bool:
+        return self.get(customer_id) is not None
+
+    def __setitem__(self, customer_id: str, value: int):
+        """
+        Set the value of a customer ID, growing the arrays when needed
+        :param value: non negative integer
+        """
+
+        if value is None or not isinstance(value, int) or value < 0:
+            raise ValueError(f'value must be a non negative integer: {value}')
+        key = self.parse_key(customer_id)
+        if key is None:
+            self.other_ids[customer_id] = value
+            return
+        if self.slot_keys is None:
+            index = key - self.base_key
+            if not 0 <= index < len(self.slot_values):
+                if not self.grow_direct(key):  # too sparse, now a hash table
+                    self[customer_id] = value
+                    return
+                index = key - self.base_key
+            if not self.slot_values[index]:
+                self.add_key(key)
+            self.set_value(index, value)
+            return
+        slot = self.get_slot(key)
+        if self.slot_keys[slot] == _EMPTY_KEY:
+            if (self.key_count + 1) * self.MAX_LOAD_DENOMINATOR > len(self.slot_keys) * self.MAX_LOAD_NUMERATOR:
+                self.resize(self.key_count + 1)
+                self[customer_id] = value
+                return
+            self.slot_keys[slot] = key
+            self.add_key(key)
+        self.set_value(slot, value)
+
+    def add_key(self, key: int):
+        """Count a new decimal customer ID, and widen the range of keys to it"""
+
+        self.key_count += 1
+        if self.min_key is None or key < self.min_key:
+            self.min_key = key
+        if self.max_key is None or key > self.max_key:
+            self.max_key = key
+
+    def set_value(self, index: int, value: int):
+        """Store a value plus one, in 64 bits integers from the first one too large for 32 bits"""
+
+        try:
+            self.slot_values[index] = value + 1
+        except OverflowError:
+            self.slot_values = array('q', self.slot_values)
+            self.slot_values[index] = value + 1
+
+    def get_max_direct_slots(self, key_count: int) -> int:
+        """:returns the largest range of keys kept as direct values for this number of keys"""
+
+        return max(self.MIN_DIRECT_SLOTS, self.MAX_DIRECT_SLOTS_PER_KEY * key_count)
+
+    def grow_direct(self, key: int) -> bool:
+        """
+        Extend the direct values to a new key, at least doubling them, or move to a hash table if too sparse
+        :returns True if the key now has a direct value
+        """
+
+        low = key if self.min_key is None else min(self.min_key, key)
+        high = key if self.max_key is None else max(self.max_key, key)
+        max_slots = self.get_max_direct_slots(self.key_count + 1)
+        if high - low + 1 > max_slots:
+            self.resize(self.key_count + 1, key)
+            return False
+        slots = min(max(high - low + 1, 2 * len(self.slot_values), 16), max_slots)
+        base_key = low if key == high else high + 1 - slots  # room left on the side of the new key
+        slot_values = array(self.slot_values.typecode, bytes(self.slot_values.itemsize * slots))
+        if self.min_key is not None:
+            slot_values[self.min_key - base_key:self.max_key - base_key + 1] = \
+                self.slot_values[self.min_key - self.base_key:self.max_key - self.base_key + 1]
+        self.slot_values = slot_values
+        self.base_key = base_key
+        return True
+
+    def resize(self, key_count: int, new_key: int = None):
+        """
+        Move all decimal customer IDs to a hash table with room for twice key_count keys,
+        or to direct values if they are dense enough for twice key_count keys, in less memory
+        :param new_key: key about to be added, its direct value included in the range
+        """
+
+        low, high = self.min_key, self.max_key
+        if new_key is not None:
+            low, high = min(low, new_key), max(high, new_key)
+        self.build_layout(list(self.iterate_keys_and_values()), 2 * key_count, low, high, self.slot_values.typecode)
+
+    def build_layout(self, items: [(int, int)], room: int, low: int, high: int, typecode: str):
+        """
+        Store decimal customer IDs in direct values if they are dense enough for room keys, else in a hash table
+        :param items: decimal customer IDs as integers, with their values plus one
+        :param room: number of keys the arrays are sized for
+        :param low: smallest key of the range of direct values
+        :param high: largest key of the range of direct values
+        :param typecode: array typecode of the values
+        """
+
+        if high - low + 1 <= self.get_max_direct_slots(room):
+            self.slot_keys = None
+            self.base_key = low
+            self.slot_values = array(typecode, bytes(array(typecode).itemsize * (high - low + 1)))
+            for key, value in items:
+                self.slot_values[key - self.base_key] = value
+            return
+        slots = self.INITIAL_SLOTS
+        while room * self.MAX_LOAD_DENOMINATOR > slots * self.MAX_LOAD_NUMERATOR:
+            slots *= 2
+        self.slot_keys = array('q', [_EMPTY_KEY]) * slots
+        self.slot_values = array(typecode, bytes(array(typecode).itemsize * slots))
+        self.shift = 64 - (slots.bit_length() - 1)
+        for key, value in items:
+            slot = self.get_slot(key)
+            self.slot_keys[slot] = key
+            self.slot_values[slot] = value
+
+    def iterate_keys_and_values(self):
+        """Iterate over decimal customer IDs as integers, with their values plus one"""
+
+        if self.slot_keys is None:
+            base_key = self.base_key
+            for index, value in enumerate(self.slot_values):
+                if value:
+                    yield base_key + index, value
+        else:
+            for key, value in zip(self.slot_keys, self.slot_values):
+                if key != _EMPTY_KEY:
+                    yield key, value
+
+    def to_dict(self) -> dict:
+        """:returns dict of customer ID to value, decimal customer IDs in increasing order first"""
+
+        customers = {str(key): value - 1 for key, value in sorted(self.iterate_keys_and_values())}
+        customers.update(self.other_ids)
+        return customers
+
+    def update(self, other: Mapping):
+        """Set the values of all customer IDs of a mapping, like dict.update"""
+
+        for customer_id, value in other.items():
+            self[customer_id] = value
+
+    def __len__(self) -> int:
+        return self.key_count + len(self.other_ids)
+
+    def __iter__(self):
+        """Iterate over the customer IDs, decimal ones first"""
+
+        for key, _ in self.iterate_keys_and_values():
+            yield str(key)
+        yield from self.other_ids
+
+    def get_memory_bytes(self) -> int:
+        """:returns bytes used by the arrays, the other customer IDs excluded"""
+
+        return self.slot_values.itemsize * len(self.slot_values) + \
+            (0 if self.slot_keys is None else self.slot_keys.itemsize * len(self.slot_keys))
+
+    def snapshot_state(self) -> dict:
+        """:returns the content of this registry, built-in types only, see from_state"""
+
+        return {'keys': None if self.slot_keys is None else self.slot_keys.tobytes(),
+                'value_typecode': self.slot_values.typecode, 'values': self.slot_values.tobytes(),
+                'base_key': self.base_key, 'key_count': self.key_count, 'min_key': self.min_key,
+                'max_key': self.max_key, 'other_ids': self.other_ids}
+
+    @staticmethod
+    def from_mapping(mapping: Mapping):
+        """
+        Build a registry from all the customer IDs of a mapping at once, like a dict filled by a customer read.
+        Faster than setting the customer IDs one by one, and the same arrays whatever the mapping order
+        :param mapping: customer ID to non negative integer
+        :returns CustomerRegistry instance"""
+
+        registry = CustomerRegistry()
+        items = []
+        parse_key = registry.parse_key
+        for customer_id, value in mapping.items():
+            key = parse_key(customer_id)
+            if key is None:
+                registry.other_ids[customer_id] = value
+            else:
+                items.append((key, value + 1))
+        if items:
+            items.sort()
+            registry.key_count = len(items)
+            registry.min_key, registry.max_key = items[0][0], items[-1][0]
+            registry.build_layout(items, len(items), registry.min_key, registry.max_key,
+                                  'I' if max(value for _, value in items) < 1 << 32 else 'q')
+        return registry
+
+    @staticmethod
+    def from_state(state: dict):
+        """
+        Build a registry from the state saved by snapshot_state, on a machine with the same byte order
+        :returns CustomerRegistry instance"""
+
+        registry = CustomerRegistry()
+        if state['keys'] is not None:
+            registry.slot_keys = array('q', state['keys'])
+            registry.shift = 64 - (len(registry.slot_keys).bit_length() - 1)
+        registry.slot_values = array(state['value_typecode'], state['values'])
+        registry.base_key = state['base_key']
+        registry.key_count = state['key_count']
+        registry.min_key = state['min_key']
+        registry.max_key = state['max_key']
+        registry.other_ids.update(state['other_ids'])
+        return registry
@@ -5,12 +5,33 @@ record count of customer data entry per cohort.
 """
 
 import datetime as dtm
+from bisect import bisect_right
 from collections import defaultdict
+from collections.abc import Mapping
+from itertools import islice, repeat
+from operator import itemgetter
 import csv
+import os
+from customer_order_cohort import block_index as bi, columnar_cache as cc, csv_input as ci, sqlite_input as si
+from customer_order_cohort.customer_registry import CustomerRegistry
+from customer_order_cohort.pipeline_metrics import PipelineMetrics
+
+# marker for a day not yet seen by CustomerTimeSpanCohorts.seconds_from_oldest
+_NOT_MEMOIZED = object()
+
+# day and time of day parts of a fixed layout 'YYYY-mm-dd HH:MM:SS' date, see CustomerTimeSpanCohorts.seconds_from_oldest
+_DAY_SLICE = itemgetter(slice(0, 10))
+_TIME_OF_DAY_SLICE = itemgetter(slice(10, 19))
+
+# marker for a day when the offset of the time zone changes, see CustomerTimeSpanCohorts.memoize_day
+_TRANSITION_DAY = object()
 
 
 class TimeSpanCohort:
     """Simple read-only representation of a cohort: ID, plus time start and time end"""
+
+    __slots__ = ('immutable',)
+
     def __init__(self, unique_id: str, oldest_date: dtm.datetime, recent_date: dtm.datetime):
         self.immutable = (unique_id, oldest_date, recent_date)
 
@@ -26,6 +47,29 @@ class TimeSpanCohort:
         return self.immutable[2]
 
 
+class CustomerCohortView(Mapping):
+    """
+    Read-only mapping of customer ID to its TimeSpanCohort,
+    over the packed cohort index and ordinal stored per customer by CustomerTimeSpanCohorts
+    """
+
+    def __init__(self, customer_cohorts):
+        self.customer_cohorts = customer_cohorts
+
+    def __getitem__(self, customer_id: str) -> TimeSpanCohort:
+        return self.customer_cohorts.cohort_table[
+            self.customer_cohorts.customers_cohort_index[customer_id] % self.customer_cohorts.number_of_intervals]
+
+    def __contains__(self, customer_id) -> bool:
+        return customer_id in self.customer_cohorts.customers_cohort_index
+
+    def __iter__(self):
+        return iter(self.customer_cohorts.customers_cohort_index)
+
+    def __len__(self) -> int:
+        return len(self.customer_cohorts.customers_cohort_index)
+
+
 class CustomerTimeSpanCohorts:
     """
     Class collecting input data for customers cohort analysis
@@ -36,8 +80,25 @@ class CustomerTimeSpanCohorts:
 
     # from dateutil.parser import parse ??instead / also??
 
+    # number of seconds in a day, the unit of the integer day arithmetic
+    SECONDS_PER_DAY = 86400
+
+    # number of entries read together as columns by the batched reader
+    BATCH_SIZE = 1 << 12
+
+    # name and version of the columns cached by read_customers_csv_file, see columnar_cache
+    COLUMNAR_CACHE_LAYOUT = 'customers-1'
+
+    # ' HH:MM:SS' end of a date string to its seconds since midnight, shared by all instances, at most a day of keys
+    time_of_day_seconds_memo: dict = {}
+
     def __init__(self, recent_date: dtm.datetime = dtm.datetime.now(), days_interval_length: int = 7,
-                 number_of_intervals: int = 8):
+                 number_of_intervals: int = 8, time_zone: dtm.tzinfo = None):
+        """
+        :param time_zone: time zone of the cohorts, like zoneinfo.ZoneInfo('America/Los_Angeles'), with its daylight
+        saving time changes. By default, the fixed offset of an aware recent_date, or the current local offset
+        """
+
         # accept any path_csv_file for now. Will check when reading data. Easier to test with fake data path
         if days_interval_length is None or not isinstance(days_interval_length, int):
             raise TypeError(f'days_interval_length must be an integer: {days_interval_length}')
@@ -47,7 +108,13 @@ class CustomerTimeSpanCohorts:
         # try to use tzinfo but not sure it is useful. No default implementation. Should import pytz maybe
         if recent_date is None or not isinstance(recent_date, dtm.datetime):
             raise TypeError(f'recent_date must be a datetime instance: {recent_date}')
-        self.delta_time_zone: dtm.timedelta = recent_date.utcoffset()  # delta with GMT time
+        if time_zone is not None and not isinstance(time_zone, dtm.tzinfo):
+            raise TypeError(f'time_zone must be a tzinfo instance: {time_zone}')
+        self.time_zone: dtm.tzinfo = time_zone
+        if time_zone is not None:  # recent_date on the wall clock of the time zone
+            recent_date = recent_date.replace(tzinfo=time_zone) if recent_date.tzinfo is None \
+                else recent_date.astimezone(time_zone)
+        self.delta_time_zone: dtm.timedelta = recent_date.utcoffset()  # delta with GMT time, on recent_date
         if self.delta_time_zone is None:
             self.delta_time_zone = dtm.datetime.now() - dtm.datetime.utcnow()  # default to local offset
             # rounding to the second, seems test failure on github with 3 or 4 microseconds diff
@@ -64,8 +131,41 @@ class CustomerTimeSpanCohorts:
         self.number_of_intervals = number_of_intervals
         self.oldest_date = self.recent_date -\
                            self.get_time_rounding_precision()*days_interval_length*number_of_intervals
-        self.customers_and_matching_cohort: dict = defaultdict(TimeSpanCohort)
+        # every possible cohort, from oldest_date, built once: cohort index is day offset // days_interval_length
+        self.cohort_table: tuple = tuple(
+            self.build_unique_cohort_id(self.oldest_date + dtm.timedelta(days=cohort_index * days_interval_length))
+            for cohort_index in range(number_of_intervals))
+        # customer ID to its cohort index plus number_of_intervals times its ordinal in its cohort,
+        # ordinal is 0 to cohort cardinality - 1, in tracking order. See locate_customer.
+        # A CustomerRegistry once compacted, see compact_customer_index
+        self.customers_cohort_index: Mapping = {}
+        self.customers_and_matching_cohort: Mapping = CustomerCohortView(self)
         self.cohort_cardinality: dict = defaultdict(int)
+        # same date range as integer seconds, to compute day offsets without datetime instances
+        self.oldest_date_seconds: int = self.to_seconds(self.oldest_date)
+        self.recent_date_seconds: int = self.to_seconds(self.recent_date)
+        # rounded down to the second, see convert_date_in_range
+        self.delta_time_zone_seconds: int = \
+            self.delta_time_zone.days * self.SECONDS_PER_DAY + self.delta_time_zone.seconds
+        # GMT seconds from which each offset of the time zone applies, sorted, and these offsets in seconds,
+        # a single fixed offset without time_zone. See use_utc_offset_table and get_local_seconds
+        self.utc_transitions: [int] = [0]
+        self.utc_offsets: [int] = [self.delta_time_zone_seconds]
+        # 'YYYY-mm-dd' GMT days that can match the date range once in the same time zone as self.recent_date
+        self.oldest_day_prefix: str = None
+        self.recent_day_prefix: str = None
+        # 'YYYY-mm-dd' GMT day to seconds from oldest_date at its midnight, None when out of the date range
+        self.day_seconds_memo: dict = {}
+        # 'YYYY-mm-dd' GMT day memoized as None to its rejection reason, see get_date_rejection_reason
+        self.day_rejection_reason_memo: dict = {}
+        if time_zone is None:
+            self.use_utc_offset_table(self.utc_transitions, self.utc_offsets)
+        else:  # a day of margin on both ends, more than any offset
+            self.use_utc_offset_table(*self.build_utc_offset_table(
+                time_zone, self.oldest_date_seconds - self.SECONDS_PER_DAY,
+                self.recent_date_seconds + self.SECONDS_PER_DAY))
+        # stage timings and rejected entries, shared with the orders aggregated on these cohorts
+        self.metrics: PipelineMetrics = PipelineMetrics()
 
     def __str__(self):
         """Build commend prompt friendly string representation for these cohorts"""
@@ -89,17 +189,267 @@ class CustomerTimeSpanCohorts:
         except ValueError:
             return None
 
+    @staticmethod
+    def to_seconds(date_and_time: dtm.datetime) -> int:
+        """Helper function to get the integer number of seconds of a date time since 0001-01-01 00:00:00.
+        Microseconds and time zone are ignored."""
+
+        return date_and_time.toordinal() * CustomerTimeSpanCohorts.SECONDS_PER_DAY +\
+            date_and_time.hour * 3600 + date_and_time.minute * 60 + date_and_time.second
+
+    @staticmethod
+    def is_ascii_digits(characters: str) -> bool:
+        """:returns True if all characters are '0' to '9', int() accepts other digits, but not all of them, like '²'"""
+
+        return characters.isdigit() and max(characters) <= '9'
+
+    @staticmethod
+    def parse_date_to_seconds(date_representation: str) -> int:
+        """
+        :returns integer seconds since 0001-01-01 00:00:00 from a date string representation, see to_seconds.
+        Fixed layout 'YYYY-mm-dd HH:MM:SS' strings are decoded by slicing,
+        anything else falls back to parse_date. Ignore None or mal formatted string.
+        """
+
+        if date_representation is not None and len(date_representation) == 19 \
+                and date_representation[4] == '-' and date_representation[7] == '-' \
+                and date_representation[10] == ' ' and date_representation[13] == ':' \
+                and date_representation[16] == ':':
+            hour = date_representation[11:13]
+            minute = date_representation[14:16]
+            second = date_representation[17:19]
+            if CustomerTimeSpanCohorts.is_ascii_digits(date_representation[0:4] + date_representation[5:7] +
+                                                       date_representation[8:10] + hour + minute + second):
+                hour, minute, second = int(hour), int(minute), int(second)
+                if hour < 24 and minute < 60 and second < 60:
+                    try:
+                        return dtm.date(int(date_representation[0:4]), int(date_representation[5:7]),
+                                        int(date_representation[8:10])).toordinal() *\
+                            CustomerTimeSpanCohorts.SECONDS_PER_DAY + hour * 3600 + minute * 60 + second
+                    except ValueError:
+                        return None
+        date_parsed = CustomerTimeSpanCohorts.parse_date(date_representation)
+        return None if date_parsed is None else CustomerTimeSpanCohorts.to_seconds(date_parsed)
+
+    @staticmethod
+    def get_utc_offset_seconds(time_zone: dtm.tzinfo, utc_seconds: int) -> int:
+        """:returns offset in seconds of a time zone at a GMT time, given as seconds, see to_seconds"""
+
+        utc_date = dtm.datetime.fromordinal(utc_seconds // CustomerTimeSpanCohorts.SECONDS_PER_DAY) + \
+            dtm.timedelta(seconds=utc_seconds % CustomerTimeSpanCohorts.SECONDS_PER_DAY)
+        offset = utc_date.replace(tzinfo=dtm.timezone.utc).astimezone(time_zone).utcoffset()
+        return offset.days * CustomerTimeSpanCohorts.SECONDS_PER_DAY + offset.seconds
+
+    @staticmethod
+    def build_utc_offset_table(time_zone: dtm.tzinfo, oldest_utc_seconds: int, recent_utc_seconds: int) -> ([int], [int]):
+        """
+        Find the offset changes of a time zone over a GMT date range, hour by hour, then to the second by bisection
+        :param time_zone: any tzinfo, like zoneinfo.ZoneInfo
+        :returns GMT seconds from which each offset applies, the first one is 0, and the offsets in seconds
+        """
+
+        transitions, offsets = [0], [CustomerTimeSpanCohorts.get_utc_offset_seconds(time_zone, oldest_utc_seconds)]
+        previous_seconds = oldest_utc_seconds
+        for utc_seconds in range(oldest_utc_seconds + 3600, recent_utc_seconds + 3600, 3600):
+            offset = CustomerTimeSpanCohorts.get_utc_offset_seconds(time_zone, utc_seconds)
+            if offset != offsets[-1]:
+                # previous offset still applies at previous_seconds, the new one at utc_seconds
+                while utc_seconds - previous_seconds > 1:
+                    middle_seconds = (previous_seconds + utc_seconds) // 2
+                    if CustomerTimeSpanCohorts.get_utc_offset_seconds(time_zone, middle_seconds) == offset:
+                        utc_seconds = middle_seconds
+                    else:
+                        previous_seconds = middle_seconds
+                transitions.append(utc_seconds)
+                offsets.append(offset)
+            previous_seconds = utc_seconds
+        return transitions, offsets
+
+    def use_utc_offset_table(self, utc_transitions: [int], utc_offsets: [int]):
+        """
+        Convert GMT dates with these offsets from now on, see build_utc_offset_table.
+        Only the transitions between oldest_date and recent_date matter.
+        """
+
+        self.utc_transitions = list(utc_transitions)
+        self.utc_offsets = list(utc_offsets)
+        self.oldest_day_prefix = dtm.date.fromordinal(
+            (self.oldest_date_seconds - max(self.utc_offsets)) // self.SECONDS_PER_DAY).isoformat()
+        self.recent_day_prefix = dtm.date.fromordinal(
+            (self.recent_date_seconds - min(self.utc_offsets) - 1) // self.SECONDS_PER_DAY).isoformat()
+        self.day_seconds_memo.clear()
+        self.day_rejection_reason_memo.clear()
+
+    def get_local_seconds(self, utc_seconds: int) -> int:
+        """:returns seconds in the same time zone as self.recent_date from GMT seconds, see to_seconds"""
+
+        return utc_seconds + self.utc_offsets[bisect_right(self.utc_transitions, utc_seconds) - 1]
+
+    def get_utc_seconds_range(self) -> (int, int):
+        """:returns oldest and most recent GMT seconds, included, of the dates that can be in the date range"""
+
+        return self.oldest_date_seconds - max(self.utc_offsets), self.recent_date_seconds - min(self.utc_offsets) - 1
+
+    def select_indexed_byte_ranges(self, path_csv_file: str, date_index: int, stage: str,
+                                   rejected: dict, oldest_date_seconds: int = None) -> [(int, int)]:
+        """
+        Select the blocks of a csv file with dates in the date range, from its block index, see block_index.
+        Rows of the other blocks are counted in the stage rows, and as rejected for their date,
+        with PipelineMetrics.INVALID_DATE or PipelineMetrics.DATE_OUT_OF_RANGE, their IDs are not checked
+        :param path_csv_file: path to an uncompressed csv file
+        :param date_index: index of the date in a csv entry
+        :param stage: name of the reading stage, like 'customer_read'
+        :param rejected: rejected entries count per reason, like self.metrics.rejected_customers
+        :param oldest_date_seconds: oldest date of the blocks to read, in the same seconds as oldest_date_seconds,
+        default oldest_date_seconds
+        :returns byte ranges of the selected blocks, see block_index.iterate_byte_range_entries
+        """
+
+        min_seconds, max_seconds = self.get_utc_seconds_range()
+        if oldest_date_seconds is not None:
+            min_seconds = oldest_date_seconds - max(self.utc_offsets)
+        byte_ranges, skipped_rows, skipped_invalid_rows = bi.select_byte_ranges(
+            bi.read_block_index(path_csv_file, (date_index, self.parse_date_to_cacheable_seconds)),
+            min_seconds, max_seconds)
+        self.metrics.add_rows(stage, skipped_rows)
+        if skipped_invalid_rows:
+            rejected[PipelineMetrics.INVALID_DATE] += skipped_invalid_rows
+        if skipped_rows > skipped_invalid_rows:
+            rejected[PipelineMetrics.DATE_OUT_OF_RANGE] += skipped_rows - skipped_invalid_rows
+        return byte_ranges
+
+    @staticmethod
+    def parse_id_to_int(id_representation: str) -> int:
+        """
+        Converter of ID values for the columnar cache
+        :returns integer with the same string representation, raise cc.NotCacheableError if there is none
+        """
+
+        try:
+            id_value = int(id_representation)
+        except ValueError as e:
+            raise cc.NotCacheableError(f'not an integer ID: {id_representation}') from e
+        if str(id_value) != id_representation or not -2 ** 63 <= id_value < 2 ** 63:
+            raise cc.NotCacheableError(f'not an integer ID: {id_representation}')
+        return id_value
+
+    @staticmethod
+    def parse_date_to_cacheable_seconds(date_representation: str) -> int:
+        """Converter of date values for the columnar cache. :returns parse_date_to_seconds, -1 for invalid dates"""
+
+        seconds = CustomerTimeSpanCohorts.parse_date_to_seconds(date_representation)
+        return -1 if seconds is None else seconds
+
+    def memoize_day(self, day_representation: str):
+        """
+        Remember the seconds from oldest_date at midnight of a 'YYYY-mm-dd' GMT day, see seconds_from_oldest.
+        Days outside of the prefixes of the date range are rejected by string comparison, without a date instance.
+        :returns the memoized seconds, None for a day out of the date range or invalid,
+        _NOT_MEMOIZED when the day does not have the fixed layout, _TRANSITION_DAY when the offset of the
+        time zone changes during the day: its dates are converted one by one
+        """
+
+        if day_representation[4] != '-' or day_representation[7] != '-' or \
+                not self.is_ascii_digits(day_representation[0:4] + day_representation[5:7] + day_representation[8:10]):
+            return _NOT_MEMOIZED
+        day_seconds = None
+        if self.oldest_day_prefix <= day_representation <= self.recent_day_prefix:
+            try:
+                day_utc_seconds = dtm.date(int(day_representation[0:4]), int(day_representation[5:7]),
+                                           int(day_representation[8:10])).toordinal() * self.SECONDS_PER_DAY
+            except ValueError:
+                day_utc_seconds = None
+            if day_utc_seconds is not None:
+                transition = bisect_right(self.utc_transitions, day_utc_seconds)
+                if transition < len(self.utc_transitions) and \
+                        self.utc_transitions[transition] < day_utc_seconds + self.SECONDS_PER_DAY:
+                    day_seconds = _TRANSITION_DAY
+                else:
+                    day_seconds = day_utc_seconds + self.utc_offsets[transition - 1] - self.oldest_date_seconds
+        self.day_seconds_memo[day_representation] = day_seconds
+        return day_seconds
+
+    @staticmethod
+    def memoize_time_of_day(time_representation: str) -> int:
+        """
+        Remember the seconds since midnight of a ' HH:MM:SS' time, see seconds_from_oldest.
+        :returns the memoized seconds, None when the time does not have the fixed layout
+        """
+
+        if time_representation[0] != ' ' or time_representation[3] != ':' or time_representation[6] != ':' \
+                or not CustomerTimeSpanCohorts.is_ascii_digits(
+                    time_representation[1:3] + time_representation[4:6] + time_representation[7:9]):
+            return None
+        hour, minute, second = int(time_representation[1:3]), int(time_representation[4:6]), \
+            int(time_representation[7:9])
+        if hour > 23 or minute > 59 or second > 59:
+            return None
+        time_seconds = hour * 3600 + minute * 60 + second
+        CustomerTimeSpanCohorts.time_of_day_seconds_memo[time_representation] = time_seconds
+        return time_seconds
+
+    def seconds_from_oldest(self, date_representation: str) -> int:
+        """
+        Fast equivalent of convert_date_in_range, as integer seconds from oldest_date.
+        Fixed layout 'YYYY-mm-dd HH:MM:SS' strings are split in a memoized day and a memoized time of day,
+        days out of the date range are rejected on their prefix only.
+        Anything else, and the days when the offset of the time zone changes, fall back to parse_date_to_seconds
+        and get_local_seconds.
+        :returns seconds from oldest_date in the same time zone as self.recent_date, IF string representation
+        looks valid and IF the date is with the overall study date range.
+        """
+
+        if date_representation is not None and len(date_representation) == 19:
+            day_seconds = self.day_seconds_memo.get(date_representation[0:10], _NOT_MEMOIZED)
+            if day_seconds is _NOT_MEMOIZED:
+                day_seconds = self.memoize_day(date_representation[0:10])
+            if day_seconds is None:
+                return None
+            if day_seconds is not _NOT_MEMOIZED and day_seconds is not _TRANSITION_DAY:
+                time_seconds = self.time_of_day_seconds_memo.get(date_representation[10:19])
+                if time_seconds is None:
+                    time_seconds = self.memoize_time_of_day(date_representation[10:19])
+                if time_seconds is not None:
+                    seconds = day_seconds + time_seconds
+                    return seconds if 0 <= seconds < self.recent_date_seconds - self.oldest_date_seconds else None
+        seconds = self.parse_date_to_seconds(date_representation)
+        if seconds is None:
+            return None
+        seconds = self.get_local_seconds(seconds) - self.oldest_date_seconds
+        return seconds if 0 <= seconds < self.recent_date_seconds - self.oldest_date_seconds else None
+
+    def get_date_rejection_reason(self, date_representation: str) -> str:
+        """
+        Tell why seconds_from_oldest rejected a date, only called for rejected entries.
+        Like seconds_from_oldest, fixed layout strings with a day out of the date range are classified
+        on their day only, memoized per day: the time of day is not checked.
+        :returns PipelineMetrics.INVALID_DATE or PipelineMetrics.DATE_OUT_OF_RANGE
+        """
+
+        if date_representation is not None and len(date_representation) == 19:
+            day_representation = date_representation[0:10]
+            reason = self.day_rejection_reason_memo.get(day_representation)
+            if reason is not None:
+                return reason
+            if self.day_seconds_memo.get(day_representation, _NOT_MEMOIZED) is None:
+                reason = PipelineMetrics.INVALID_DATE if self.parse_date_to_seconds(
+                    day_representation + ' 00:00:00') is None else PipelineMetrics.DATE_OUT_OF_RANGE
+                self.day_rejection_reason_memo[day_representation] = reason
+                return reason
+        return PipelineMetrics.INVALID_DATE if self.parse_date_to_seconds(date_representation) is None \
+            else PipelineMetrics.DATE_OUT_OF_RANGE
+
     def convert_date_in_range(self, date_created_representation: str) -> dtm.datetime:
         """
         :returns datetime instance from its string representation, IF string representation looks valid
         and IF the date is with the overall study date range.
         """
 
-        date_created = self.parse_date(date_created_representation)
-        if date_created is not None:  # put in same time zone as self.recent_date
-            date_created = date_created + self.delta_time_zone
-        return date_created if date_created is not None \
-                               and self.oldest_date <= date_created < self.recent_date else None
+        seconds = self.seconds_from_oldest(date_created_representation)
+        if seconds is None:
+            return None
+        # put in same time zone as self.recent_date
+        return self.oldest_date + dtm.timedelta(seconds=seconds, microseconds=self.delta_time_zone.microseconds)
 
     @staticmethod  # SHOULDDO: make it a property ?
     def get_time_rounding_precision() -> dtm.timedelta:
@@ -147,16 +497,42 @@ class CustomerTimeSpanCohorts:
         :returns the cohort identifier linked by the given customer ID, based on its creation date"""
 
         if customer_id is None:
+            self.metrics.rejected_customers[PipelineMetrics.MISSING_CUSTOMER_ID] += 1
             return None
-        if customer_id in self.customers_and_matching_cohort:
+        if customer_id in self.customers_cohort_index:
+            self.metrics.rejected_customers[PipelineMetrics.DUPLICATE_CUSTOMER_ID] += 1
             return None  # raise invalid input exception ?
-        creation_date = self.convert_date_in_range(customer_creation_date)
-        if creation_date is None:
+        creation_seconds = self.seconds_from_oldest(customer_creation_date)
+        if creation_seconds is None:
+            self.metrics.rejected_customers[self.get_date_rejection_reason(customer_creation_date)] += 1
             return None
-        cohort: TimeSpanCohort = self.build_unique_cohort_id(creation_date)
-        self.customers_and_matching_cohort[customer_id] = cohort
+        return self.add_customer(
+            customer_id, creation_seconds // (self.SECONDS_PER_DAY * self.days_interval_length)).id
+
+    def add_customer(self, customer_id: str, cohort_index: int) -> TimeSpanCohort:
+        """
+        Record a new customer ID in a cohort, with the next ordinal of that cohort
+        :param customer_id: a unique customer ID, not yet tracked
+        :param cohort_index: index of the customer cohort in cohort_table
+        :returns the customer cohort"""
+
+        cohort: TimeSpanCohort = self.cohort_table[cohort_index]
+        self.customers_cohort_index[customer_id] = \
+            cohort_index + self.number_of_intervals * self.cohort_cardinality[cohort.id]
         self.cohort_cardinality[cohort.id] += 1
-        return cohort.id
+        return cohort
+
+    def locate_customer(self, customer_id: str) -> (int, int):
+        """
+        :param customer_id: a customer ID
+        :returns pair of cohort index in cohort_table and ordinal in its cohort, None if the customer is not tracked
+        """
+
+        packed_index = self.customers_cohort_index.get(customer_id)
+        if packed_index is None:
+            return None
+        ordinal, cohort_index = divmod(packed_index, self.number_of_intervals)
+        return cohort_index, ordinal
 
     def read_all_customer_entries(self, iterator: [str], index_for_id: int, index_for_created: int) -> int:
         """
@@ -167,21 +543,301 @@ class CustomerTimeSpanCohorts:
         :returns the total number of costumer groups recorded from all entries, matching date range for this analysis
         """
 
+        rows = 0
         for entry in iterator:
             self.track_customer(entry[index_for_id], entry[index_for_created])
+            rows += 1
+        self.metrics.add_rows('customer_read', rows)
         return len(self.cohort_cardinality)
 
-    def read_customers_csv_file(self, path_csv_file: str = './data/customers.csv', ) -> int:
+    def track_customer_batch(self, customer_ids: [str], customer_creation_dates: [str]) -> int:
+        """
+        Columnar equivalent of track_customer on a batch of entries.
+        Fixed layout creation dates are split in a day column and a time of day column, both looked up in the
+        memos of seconds_from_oldest with map, without a function call per entry: the cohort index is integer
+        arithmetic on the sum of both columns. Dates missing from the memos fall back to seconds_from_oldest.
+        :param customer_ids: unique customer IDs
+        :param customer_creation_dates: matching creation dates, same length as customer_ids
+        :returns the number of customers tracked from this batch
+        """
+
+        if None in customer_creation_dates:  # no slicing, entry by entry
+            day_seconds_column, time_seconds_column = repeat(_NOT_MEMOIZED), repeat(None)
+        else:
+            day_seconds_column = map(self.day_seconds_memo.get, map(_DAY_SLICE, customer_creation_dates),
+                                     repeat(_NOT_MEMOIZED))
+            time_seconds_column = map(self.time_of_day_seconds_memo.get, map(_TIME_OF_DAY_SLICE, customer_creation_dates))
+        range_seconds = self.recent_date_seconds - self.oldest_date_seconds
+        seconds_per_interval = self.SECONDS_PER_DAY * self.days_interval_length
+        customers_cohort_index = self.customers_cohort_index
+        tracked = 0
+        rejected_customers = self.metrics.rejected_customers
+        for customer_id, customer_creation_date, day_seconds, time_seconds in zip(
+                customer_ids, customer_creation_dates, day_seconds_column, time_seconds_column):
+            if day_seconds.__class__ is int and time_seconds is not None and len(customer_creation_date) == 19:
+                created = day_seconds + time_seconds
+                if not 0 <= created < range_seconds:
+                    created = None
+            elif day_seconds is None and len(customer_creation_date) == 19:
+                created = None  # day out of the date range, or invalid
+            else:
+                created = self.seconds_from_oldest(customer_creation_date)
+            if created is not None and customer_id is not None and customer_id not in customers_cohort_index:
+                self.add_customer(customer_id, created // seconds_per_interval)
+                tracked += 1
+            elif customer_id is None:
+                rejected_customers[PipelineMetrics.MISSING_CUSTOMER_ID] += 1
+            elif customer_id in customers_cohort_index:
+                rejected_customers[PipelineMetrics.DUPLICATE_CUSTOMER_ID] += 1
+            else:
+                rejected_customers[self.get_date_rejection_reason(customer_creation_date)] += 1
+        self.metrics.add_rows('customer_read', len(customer_ids))
+        return tracked
+
+    def read_all_customer_entries_in_batches(self, iterator: [str], index_for_id: int, index_for_created: int,
+                                             batch_size: int = BATCH_SIZE) -> int:
+        """
+        Same as read_all_customer_entries, but reads entries by batches of columns, see track_customer_batch.
+        Only the two columns of a batch are kept, not its entries.
+        :param iterator: the iterator to get all entries, full scan
+        :param index_for_id: index on entry to get customer ID value
+        :param index_for_created: index on entry to get customer created date value
+        :param batch_size: number of entries converted together
+        :returns the total number of costumer groups recorded from all entries, matching date range for this analysis
+        """
+
+        if batch_size is None or not isinstance(batch_size, int):
+            raise TypeError(f'batch_size must be an integer: {batch_size}')
+        if batch_size < 1:
+            raise ValueError(f'value for batch_size must be a positive integer: {batch_size}')
+        columns = itemgetter(index_for_id, index_for_created)
+        iterator = iter(iterator)
+        batch = list(map(columns, islice(iterator, batch_size)))
+        while batch:
+            customer_ids, customer_creation_dates = zip(*batch)
+            self.track_customer_batch(customer_ids, customer_creation_dates)
+            batch = list(map(columns, islice(iterator, batch_size)))
+        return len(self.cohort_cardinality)
+
+    def track_customer_columns(self, customer_ids: [int], creation_seconds: [int]) -> int:
+        """
+        Equivalent of track_customer on columns from the columnar cache
+        :param customer_ids: integer customer IDs, see parse_id_to_int
+        :param creation_seconds: matching creation dates, see parse_date_to_cacheable_seconds
+        :returns the number of customers tracked from these columns
+        """
+
+        # same shift for all dates without offset changes, else get_local_seconds
+        shift_seconds = self.utc_offsets[0] - self.oldest_date_seconds if len(self.utc_offsets) == 1 else None
+        range_seconds = self.recent_date_seconds - self.oldest_date_seconds
+        cohort_seconds = self.SECONDS_PER_DAY * self.days_interval_length
+        tracked = 0
+        rejected_customers = self.metrics.rejected_customers
+        for customer_id, created in zip(customer_ids, creation_seconds):
+            if created >= 0:  # else invalid date
+                created_from_oldest = created + shift_seconds if shift_seconds is not None \
+                    else self.get_local_seconds(created) - self.oldest_date_seconds
+                if 0 <= created_from_oldest < range_seconds:
+                    customer_id = str(customer_id)
+                    if customer_id not in self.customers_cohort_index:
+                        self.add_customer(customer_id, created_from_oldest // cohort_seconds)
+                        tracked += 1
+                    else:
+                        rejected_customers[PipelineMetrics.DUPLICATE_CUSTOMER_ID] += 1
+                    continue
+            # same rejection reasons as track_customer, which checks duplicates first
+            if str(customer_id) in self.customers_cohort_index:
+                rejected_customers[PipelineMetrics.DUPLICATE_CUSTOMER_ID] += 1
+            else:
+                rejected_customers[PipelineMetrics.INVALID_DATE if created < 0 else PipelineMetrics.DATE_OUT_OF_RANGE] += 1
+        self.metrics.add_rows('customer_read', len(customer_ids))
+        return tracked
+
+    def compact_customer_index(self) -> int:
+        """
+        Move the customers from a dict to a CustomerRegistry, a few bytes per decimal customer ID instead of about 120,
+        for windows with too many customers for memory. Lookups of the order read are then several times slower:
+        call it once, after the customer read. Customers can still be tracked, in the registry
+        :returns bytes used by the arrays of the registry"""
+
+        if not isinstance(self.customers_cohort_index, CustomerRegistry):
+            self.customers_cohort_index = CustomerRegistry.from_mapping(self.customers_cohort_index)
+        return self.customers_cohort_index.get_memory_bytes()
+
+    def snapshot_state(self) -> dict:
+        """
+        :returns the accumulated state of these cohorts, built-in types only, see from_state.
+        Customers are saved as a CustomerRegistry, compacted or not
+        """
+
+        compact_customers = isinstance(self.customers_cohort_index, CustomerRegistry)
+        return {
+            'last_day_ordinal': self.recent_date.toordinal() - 1,
+            'delta_time_zone': (self.delta_time_zone.days, self.delta_time_zone.seconds,
+                                self.delta_time_zone.microseconds),
+            'utc_offset_table': (self.utc_transitions, self.utc_offsets),
+            'days_interval_length': self.days_interval_length,
+            'number_of_intervals': self.number_of_intervals,
+            'customer_registry': (self.customers_cohort_index if compact_customers
+                                  else CustomerRegistry.from_mapping(self.customers_cohort_index)).snapshot_state(),
+            'compact_customers': compact_customers,
+            'cohort_cardinality': dict(self.cohort_cardinality)}
+
+    @staticmethod
+    def from_state(state: dict):
+        """
+        Build cohorts from the state saved by snapshot_state, with the same date range and time zone
+        :param state: state from snapshot_state
+        :returns CustomerTimeSpanCohorts instance"""
+
+        days, seconds, microseconds = state['delta_time_zone']
+        last_day = dtm.date.fromordinal(state['last_day_ordinal'])
+        customer_cohorts = CustomerTimeSpanCohorts(
+            recent_date=dtm.datetime(last_day.year, last_day.month, last_day.day, tzinfo=dtm.timezone(
+                dtm.timedelta(days=days, seconds=seconds, microseconds=microseconds))),
+            days_interval_length=state['days_interval_length'], number_of_intervals=state['number_of_intervals'])
+        customer_cohorts.use_utc_offset_table(*state['utc_offset_table'])
+        registry = CustomerRegistry.from_state(state['customer_registry'])
+        customer_cohorts.customers_cohort_index = registry if state['compact_customers'] else registry.to_dict()
+        customer_cohorts.cohort_cardinality.update(state['cohort_cardinality'])
+        return customer_cohorts
+
+    def read_customers_csv_file_from_offset(self, path_csv_file: str, offset: int = None) -> int:
+        """
+        Read the customer entries appended to the csv file since a previous read, see read_csv_file_from_offset
+        :param path_csv_file: path to the customers csv file
+        :param offset: byte offset returned by the previous read, None to read all entries
+        :returns the byte offset for the next read"""
+
+        with self.metrics.measure('customer_read'):
+            entry_reader, offset = read_csv_file_from_offset(path_csv_file, offset)
+            self.read_all_customer_entries(entry_reader, 0, 1)
+        return offset
+
+    def read_customers_csv_file(self, path_csv_file: str = './data/customers.csv', batch_size: int = None,
+                                columnar_cache: bool = False, block_index: bool = False) -> int:
         """
         Open the csv file and iterate over its entries to build customer cohorts.
         Will raise IOError if path_csv_file is not valid
+        :param path_csv_file: path to the customers csv file, gzip, bzip2 or xz compressed or not,
+        '-' for the standard input, or an open file, see csv_input.open_csv_input
+        :param batch_size: when set, use the batched reader read_all_customer_entries_in_batches
+        :param columnar_cache: when True, read parsed columns from a sidecar file written by a previous read,
+        see columnar_cache.read_csv_columns. Files with non integer customer IDs, open files and the standard
+        input are read as csv
+        :param block_index: when True, read only the blocks of the csv file with creation dates in the date range,
+        see select_indexed_byte_ranges. Compressed files, open files and the standard input are fully read
         :returns the total number of customer groups from all entries of the csv file
         in the date range of the analysis"""
 
-        if path_csv_file is None or not isinstance(path_csv_file, str):
-            raise TypeError(f'path_csv_file must be a string: {path_csv_file}')
-        with open(path_csv_file, mode='r') as csv_file:
-            entry_reader = csv.reader(csv_file)  # use csv.DictReader instead?
-            next(entry_reader)  # skip header
-            self.read_all_customer_entries(entry_reader, 0, 1)
+        if path_csv_file is None or not (isinstance(path_csv_file, str) or hasattr(path_csv_file, 'read')):
+            raise TypeError(f'path_csv_file must be a string or a file object: {path_csv_file}')
+        with self.metrics.measure('customer_read'):
+            if columnar_cache and isinstance(path_csv_file, str) and path_csv_file != ci.STDIN_PATH:
+                columns = cc.read_csv_columns(
+                    path_csv_file, self.COLUMNAR_CACHE_LAYOUT,
+                    [(0, self.parse_id_to_int), (1, self.parse_date_to_cacheable_seconds)], skip_csv_header)
+                if columns is not None:
+                    self.track_customer_columns(*columns)
+                    return len(self.cohort_cardinality)
+            if block_index and ci.is_plain_csv_file(path_csv_file):
+                entry_reader = bi.iterate_byte_range_entries(path_csv_file, self.select_indexed_byte_ranges(
+                    path_csv_file, 1, 'customer_read', self.metrics.rejected_customers))
+                self.read_customer_entries(entry_reader, batch_size)
+                return len(self.cohort_cardinality)
+            with ci.open_csv_input(path_csv_file) as csv_file:
+                entry_reader = csv.reader(csv_file)  # use csv.DictReader instead?
+                next(entry_reader)  # skip header
+                self.read_customer_entries(entry_reader, batch_size)
+        return len(self.cohort_cardinality)
+
+    def read_customer_entries(self, entry_reader: iter, batch_size: int = None) -> int:
+        """
+        Read customer ID and creation date entries, one by one or by batches
+        :param entry_reader: iterator on csv entries, after the header
+        :param batch_size: when set, use the batched reader read_all_customer_entries_in_batches
+        :returns the total number of customer groups"""
+
+        if batch_size is None:
+            return self.read_all_customer_entries(entry_reader, 0, 1)
+        return self.read_all_customer_entries_in_batches(entry_reader, 0, 1, batch_size)
+
+    def read_customers_database(self, path_database='./data/cohorts.sqlite', batch_size: int = None) -> int:
+        """
+        Query the customers of a SQLite database created in the date range, see sqlite_input.query_customers,
+        and build customer cohorts. Customers created out of the date range are not fetched, nor counted in metrics.
+        Will raise sqlite3.Error if the database has no customers table
+        :param path_database: path to a SQLite database file, or an open sqlite3.Connection, left open
+        :param batch_size: when set, use the batched reader read_all_customer_entries_in_batches
+        :returns the total number of customer groups in the date range of the analysis"""
+
+        connection = si.open_database(path_database)
+        try:
+            with self.metrics.measure('customer_read'):
+                self.read_customer_entries(si.query_customers(connection, self.get_utc_seconds_range()), batch_size)
+        finally:
+            if connection is not path_database:
+                connection.close()
         return len(self.cohort_cardinality)
+
+
+def skip_csv_header(csv_file) -> iter:
+    """:returns csv reader on an open csv file, after its header line"""
+
+    entry_reader = csv.reader(csv_file)
+    next(entry_reader, None)
+    return entry_reader
+
+
+def read_csv_file_from_offset(path_csv_file: str, offset: int = None) -> (iter, int):
+    """
+    Read the complete lines of a csv file from a byte offset, to ingest entries appended since a previous read.
+    Lines are streamed from the file as the entries are iterated, the appended entries are not held in memory.
+    Will raise IOError if path_csv_file is not valid, and ValueError if the file is now shorter than offset
+    :param path_csv_file: path to the csv file
+    :param offset: byte offset of the first line to read, None to read all entries after the header
+    :returns csv reader on the entries read, and the byte offset after the last complete line
+    """
+
+    if path_csv_file is None or not isinstance(path_csv_file, str):
+        raise TypeError(f'path_csv_file must be a string: {path_csv_file}')
+    with open(path_csv_file, mode='rb') as csv_file:
+        if offset is None:
+            csv_file.readline()  # skip header
+            offset = csv_file.tell()
+        size = os.fstat(csv_file.fileno()).st_size
+        if size < offset:
+            raise ValueError(f'csv file is shorter than offset {offset}, was it rewritten? {path_csv_file}')
+        # a line still being written is left for the next read
+        complete_lines_end = find_complete_lines_end(csv_file, offset, size)
+    return csv.reader(iterate_decoded_lines(path_csv_file, offset, complete_lines_end)), complete_lines_end
+
+
+def find_complete_lines_end(binary_file, start: int, end: int, block_bytes: int = 1 << 16) -> int:
+    """
+    Search the last new line of a byte range backward, block by block
+    :returns the byte offset after the last new line in [start, end), start if there is none
+    """
+
+    block_end = end
+    while block_end > start:
+        block_start = max(start, block_end - block_bytes)
+        binary_file.seek(block_start)
+        new_line = binary_file.read(block_end - block_start).rfind(b'\n')
+        if new_line >= 0:
+            return block_start + new_line + 1
+        block_end = block_start
+    return start
+
+
+def iterate_decoded_lines(path_file: str, start: int, end: int) -> iter:
+    """:returns iterator on the decoded lines of a file in a byte range, end excluded, read when iterated"""
+
+    with open(path_file, mode='rb') as binary_file:
+        binary_file.seek(start)
+        while start < end:
+            line = binary_file.readline(end - start)
+            if not line:
+                return  # file truncated since its size was read
+            start += len(line)
+            yield line.decode()
@@ -0,0 +1,416 @@
+"""Daily cube of customers and orders over a sliding window of days, to run the analysis every day without
+reading everything again. Customers are kept per creation day, distinct customers with orders per creation day
+and order day. Any analysis with days in the window is rolled up from the days, with the same result as
+reading the csv files for it. Moving the window forward drops the oldest days, and reads the new days only.
+"""
+
+import csv
+import datetime as dtm
+import os
+import pickle
+from customer_order_cohort import block_index as bi, cohort_snapshot, csv_input as ci
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+from customer_order_cohort.order_time_span_aggregation import CustomerBitmap
+from customer_order_cohort.pipeline_metrics import PipelineMetrics
+
+# increment when the saved state changes
+CUBE_VERSION = 3
+
+
+class DailyCohortCube:
+    """
+    Customers per creation day, and per creation day and order day the bitmaps of customers with an order and with
+    a first order, for the window_days days up to recent_date, in the time zone of the cohorts.
+    Days are read once they have ended: entries of days already read are skipped by the next reads,
+    the current day is read again until it ends. Orders on days already read, dated before the creation of their
+    customer, are counted by the read of the customer.
+    As in a full read, a customer ID is tracked on the day of its first entry in the window, in file order.
+    When that entry is dropped with its day, or when an ID of a day already read has an entry on a new day,
+    the cube does not know which entry comes first: all days are read again, see unload.
+    """
+
+    def __init__(self, recent_date: dtm.datetime = dtm.datetime.now(), window_days: int = 56,
+                 time_zone: dtm.tzinfo = None):
+        """
+        :param recent_date: most recent day of the window, see CustomerTimeSpanCohorts
+        :param window_days: number of days kept, up to recent_date, the longest analysis rolled up from this cube
+        :param time_zone: time zone of the days, see CustomerTimeSpanCohorts
+        """
+
+        if window_days is None or not isinstance(window_days, int):
+            raise TypeError(f'window_days must be an integer: {window_days}')
+        if window_days < 1:
+            raise ValueError(f'value for window_days must be a positive integer: {window_days}')
+        self.window_days: int = window_days
+        self.time_zone: dtm.tzinfo = time_zone
+        self.metrics: PipelineMetrics = PipelineMetrics()
+        # one day cohorts of the window, to convert dates to days, see build_day_cohorts
+        self.day_cohorts: ctsc.CustomerTimeSpanCohorts = self.build_day_cohorts(recent_date)
+        self.recent_date: dtm.datetime = recent_date
+        # ordinal of the day after the last ended day read, the oldest day of the window before any read
+        self.loaded_day: int = self.oldest_day
+        # ordinal of the day after the last day read, the current day included even if not ended, see roll_up
+        self.read_day: int = self.oldest_day
+        # customer ID to its creation day ordinal and its ordinal among the customers of that day
+        self.customer_days: dict = {}
+        # creation day ordinal to its customer IDs, in tracking order
+        self.day_customers: dict = {}
+        # creation day ordinal to (order day ordinal, True for an order at midnight) to 2 CustomerBitmap,
+        # all orders and first orders, of the ordinals of the customers of the creation day
+        self.day_orders: dict = {}
+        # customer IDs with entries on several days of the window, see track_customer
+        self.duplicate_ids: set = set()
+        # True when the days read must be read again, see unload
+        self.full_read_needed: bool = False
+
+    def __str__(self):
+        """Build commend prompt friendly string representation for this cube"""
+
+        return f'Daily cohort cube of {self.window_days} days between {self.day_cohorts.oldest_date} and ' \
+               f'{self.day_cohorts.recent_date}, read up to {dtm.date.fromordinal(self.loaded_day)},' \
+               f' with {len(self.customer_days)} customers.'
+
+    @property
+    def oldest_day(self) -> int:
+        """:returns ordinal of the oldest day of the window"""
+
+        return self.day_cohorts.oldest_date.toordinal()
+
+    @property
+    def recent_day(self) -> int:
+        """:returns ordinal of the day after the most recent day of the window"""
+
+        return self.day_cohorts.recent_date.toordinal()
+
+    def build_day_cohorts(self, recent_date: dtm.datetime) -> ctsc.CustomerTimeSpanCohorts:
+        """:returns one day cohorts of the window ending on recent_date, sharing the metrics of this cube"""
+
+        day_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=recent_date, days_interval_length=1, number_of_intervals=self.window_days,
+            time_zone=self.time_zone)
+        day_cohorts.metrics = self.metrics
+        return day_cohorts
+
+    def get_current_day(self) -> int:
+        """:returns ordinal of the current day in the time zone of the cube, the days before it have ended"""
+
+        utc_seconds = ctsc.CustomerTimeSpanCohorts.to_seconds(dtm.datetime.utcnow())
+        return self.day_cohorts.get_local_seconds(utc_seconds) // ctsc.CustomerTimeSpanCohorts.SECONDS_PER_DAY
+
+    def keep_days(self, oldest_day: int, loaded_day: int) -> int:
+        """
+        Drop the customers and orders of the days out of oldest_day included to loaded_day excluded
+        :returns number of creation days dropped
+        """
+
+        dropped_days = [day for day in self.day_customers if not oldest_day <= day < loaded_day]
+        for day in dropped_days:
+            for customer_id in self.day_customers.pop(day):
+                del self.customer_days[customer_id]
+                # another entry of the customer may be tracked by a full read
+                self.full_read_needed = self.full_read_needed or customer_id in self.duplicate_ids
+            self.day_orders.pop(day, None)
+        for order_days in self.day_orders.values():
+            for order_key in [order_key for order_key in order_days if not oldest_day <= order_key[0] < loaded_day]:
+                del order_days[order_key]
+        return len(dropped_days)
+
+    def unload(self) -> int:
+        """
+        Forget the days read, for the next read to read all days of the window, as a full read
+        :returns number of customers forgotten
+        """
+
+        customers = len(self.customer_days)
+        self.loaded_day = self.read_day = self.oldest_day
+        self.customer_days, self.day_customers, self.day_orders = {}, {}, {}
+        self.duplicate_ids = set()
+        self.full_read_needed = False
+        return customers
+
+    def advance(self, recent_date: dtm.datetime) -> int:
+        """
+        Move the window forward to end on recent_date: drop the days before the new window.
+        The new days are read by the next read_csv_files. The cube is unchanged when recent_date is rejected
+        :param recent_date: most recent day of the window, not before the current one
+        :returns number of creation days dropped
+        """
+
+        if recent_date is None or not isinstance(recent_date, dtm.datetime):
+            raise TypeError(f'recent_date must be a datetime instance: {recent_date}')
+        day_cohorts = self.build_day_cohorts(recent_date)
+        if day_cohorts.recent_date.toordinal() < self.recent_day:
+            raise ValueError(f'recent_date must not be before the window of the cube: {recent_date}')
+        self.day_cohorts = day_cohorts
+        self.recent_date = recent_date
+        self.loaded_day = max(self.loaded_day, self.oldest_day)
+        self.read_day = max(self.read_day, self.oldest_day)
+        return self.keep_days(self.oldest_day, self.loaded_day)
+
+    def locate_date(self, date_representation: str) -> (int, bool):
+        """
+        :returns ordinal of the day of a date in the time zone of the cube, with True for a date at midnight,
+        None for an invalid date or a date out of the window
+        """
+
+        seconds = self.day_cohorts.seconds_from_oldest(date_representation)
+        if seconds is None:
+            return None
+        days, seconds_in_day = divmod(seconds, ctsc.CustomerTimeSpanCohorts.SECONDS_PER_DAY)
+        return self.oldest_day + days, seconds_in_day == 0
+
+    def track_customer(self, customer_id: str, customer_creation_date: str) -> int:
+        """
+        Same as CustomerTimeSpanCohorts.track_customer, for the days not yet read
+        :returns the creation day ordinal of the customer, None if not tracked"""
+
+        if customer_id is None:
+            self.metrics.rejected_customers[PipelineMetrics.MISSING_CUSTOMER_ID] += 1
+            return None
+        located = self.locate_date(customer_creation_date)
+        if located is not None and located[0] < self.loaded_day:
+            return None  # tracked or rejected by a previous read
+        customer_day = self.customer_days.get(customer_id)
+        if customer_day is not None:
+            self.metrics.rejected_customers[PipelineMetrics.DUPLICATE_CUSTOMER_ID] += 1
+            if located is not None:
+                self.duplicate_ids.add(customer_id)
+                # the entry of the day read may come after this one in the file
+                self.full_read_needed = self.full_read_needed or customer_day[0] < self.loaded_day
+            return None
+        if located is None:
+            self.metrics.rejected_customers[self.day_cohorts.get_date_rejection_reason(customer_creation_date)] += 1
+            return None
+        day_customers = self.day_customers.setdefault(located[0], [])
+        self.customer_days[customer_id] = (located[0], len(day_customers))
+        day_customers.append(customer_id)
+        return located[0]
+
+    def track_order(self, customer_id: str, order_creation_date: str, order_sequence: str) -> []:
+        """
+        Same as OrderTimeSpanAggregation.track_order, for the days not yet read and the customers of these days
+        :returns the 2 CustomerBitmap of the creation day and order day, None if the order is not counted"""
+
+        if customer_id is None:
+            self.metrics.rejected_orders[PipelineMetrics.MISSING_CUSTOMER_ID] += 1
+            return None
+        located = self.locate_date(order_creation_date)
+        customer_day = self.customer_days.get(customer_id)
+        if located is not None and located[0] < self.loaded_day and (
+                customer_day is None or customer_day[0] < self.loaded_day):
+            return None  # counted or rejected by a previous read, with its customer
+        if customer_day is None:
+            self.metrics.rejected_orders[PipelineMetrics.UNKNOWN_CUSTOMER_ID] += 1
+            return None
+        if located is None:
+            self.metrics.rejected_orders[self.day_cohorts.get_date_rejection_reason(order_creation_date)] += 1
+            return None
+        creation_day, customer_ordinal = customer_day
+        order_counts = self.day_orders.setdefault(creation_day, {}).get(located)
+        if order_counts is None:
+            order_counts = self.day_orders[creation_day][located] = [CustomerBitmap(), CustomerBitmap()]
+        order_counts[0].add(customer_ordinal)
+        if order_sequence == '1':
+            order_counts[1].add(customer_ordinal)
+        return order_counts
+
+    def iterate_csv_entries(self, path_csv_file: str, date_index: int, stage: str, rejected: dict,
+                            block_index: bool, oldest_day: int) -> iter:
+        """:returns iterator on the entries of a csv file after its header, from oldest_day on with block_index"""
+
+        if block_index and ci.is_plain_csv_file(path_csv_file):
+            yield from bi.iterate_byte_range_entries(path_csv_file, self.day_cohorts.select_indexed_byte_ranges(
+                path_csv_file, date_index, stage, rejected, oldest_day * ctsc.CustomerTimeSpanCohorts.SECONDS_PER_DAY))
+            return
+        with ci.open_csv_input(path_csv_file) as csv_file:
+            entry_reader = csv.reader(csv_file)
+            next(entry_reader)  # skip header
+            yield from entry_reader
+
+    def read_customers_csv_file(self, path_customers_csv_file: str, block_index: bool) -> int:
+        """:returns number of customers of the days not yet read"""
+
+        customers = len(self.customer_days)
+        with self.metrics.measure('customer_read') as stage_metrics:
+            for entry in self.iterate_csv_entries(path_customers_csv_file, 1, 'customer_read',
+                                                  self.metrics.rejected_customers, block_index, self.loaded_day):
+                self.track_customer(entry[0], entry[1])
+                stage_metrics.rows += 1
+        return len(self.customer_days) - customers
+
+    def read_csv_files(self, path_customers_csv_file: str = './data/customers.csv',
+                       path_orders_csv_file: str = './data/orders.csv', block_index: bool = False) -> int:
+        """
+        Read the entries of the days of the window not yet read, customers first.
+        Entries of the current day, see get_current_day, are kept but the day is not marked as read:
+        they are dropped and read again by the next read, with the entries appended meanwhile.
+        All days are read again when the days read cannot be kept, see unload. With block_index, the orders
+        of all days are read, for the orders of new customers on days already read.
+        Will raise IOError if a csv file is not valid
+        :param path_customers_csv_file: path to the customers csv file, see csv_input.open_csv_input
+        :param path_orders_csv_file: path to the orders csv file, see csv_input.open_csv_input
+        :param block_index: when True, read only the blocks of the csv files with dates in the days not yet read,
+        see CustomerTimeSpanCohorts.select_indexed_byte_ranges
+        :returns number of ended days read"""
+
+        self.keep_days(self.oldest_day, self.loaded_day)  # current day of a previous read
+        if self.full_read_needed:
+            self.unload()
+        rejected_customers = dict(self.metrics.rejected_customers)
+        self.read_customers_csv_file(path_customers_csv_file, block_index)
+        if self.full_read_needed:
+            self.unload()
+            self.metrics.rejected_customers.clear()
+            self.metrics.rejected_customers.update(rejected_customers)
+            self.read_customers_csv_file(path_customers_csv_file, block_index)
+        with self.metrics.measure('order_read') as stage_metrics:
+            # order ID, customer ID, order date, num order by customer
+            for entry in self.iterate_csv_entries(path_orders_csv_file, 3, 'order_read',
+                                                  self.metrics.rejected_orders, block_index, self.oldest_day):
+                self.track_order(entry[2], entry[3], entry[1])
+                stage_metrics.rows += 1
+        loaded_day = max(self.loaded_day, min(self.recent_day, self.get_current_day()))
+        days = loaded_day - self.loaded_day
+        self.loaded_day = loaded_day
+        self.read_day = self.recent_day
+        return days
+
+    def check_read_days(self, customer_cohorts: ctsc.CustomerTimeSpanCohorts) -> (int, int):
+        """
+        Will raise ValueError if the days of customer_cohorts cannot be rolled up from this cube, see roll_up
+        :returns ordinals of the oldest day, and of the day after the most recent day, of customer_cohorts
+        """
+
+        oldest_day, recent_day = customer_cohorts.oldest_date.toordinal(), customer_cohorts.recent_date.toordinal()
+        if oldest_day < self.oldest_day or recent_day > self.read_day or self.full_read_needed:
+            raise ValueError(f'days from {customer_cohorts.oldest_date} to {customer_cohorts.recent_date}'
+                             f' must be read in the cube: {self}')
+        if self.duplicate_ids and (oldest_day, recent_day) != (self.oldest_day, self.recent_day):
+            raise ValueError(f'with {len(self.duplicate_ids)} customer IDs on several days, days from'
+                             f' {customer_cohorts.oldest_date} to {customer_cohorts.recent_date} must be the window'
+                             f' of the cube: {self}')
+        return oldest_day, recent_day
+
+    def roll_up(self, days_interval_length: int = 7, number_of_intervals: int = 8,
+                recent_date: dtm.datetime = None) -> otsa.OrderTimeSpanAggregation:
+        """
+        Build an analysis from the days of this cube, same counts and customers as reading the csv files for it.
+        Its customer ordinals are in creation day order.
+        :param days_interval_length: days per cohort, see CustomerTimeSpanCohorts
+        :param number_of_intervals: number of cohorts, see CustomerTimeSpanCohorts
+        :param recent_date: most recent day of the analysis, default the recent date of the cube.
+        All days of the analysis must be in the window, and read: the current day as read so far.
+        With customer IDs on several days, only the window of the cube: a full read of another window may track
+        other entries of these IDs
+        :returns OrderTimeSpanAggregation instance, with its customer cohorts
+        """
+
+        customer_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=self.recent_date if recent_date is None else recent_date,
+            days_interval_length=days_interval_length, number_of_intervals=number_of_intervals,
+            time_zone=self.time_zone)
+        oldest_day, recent_day = self.check_read_days(customer_cohorts)
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customer_cohorts)
+        # ordinal of the first customer of each creation day in its cohort
+        first_ordinals = {}
+        for day in range(oldest_day, recent_day):
+            cohort_index = (day - oldest_day) // days_interval_length
+            cohort_key = customer_cohorts.cohort_table[cohort_index].id
+            first_ordinals[day] = customer_cohorts.cohort_cardinality.get(cohort_key, 0)
+            for customer_id in self.day_customers.get(day, ()):
+                customer_cohorts.add_customer(customer_id, cohort_index)
+        # bitmaps of each cell of the analysis, as integers, merged from its creation days and order days
+        cell_bits = {}
+        for creation_day, order_days in self.day_orders.items():
+            if not oldest_day <= creation_day < recent_day:
+                continue
+            cohort_index = (creation_day - oldest_day) // days_interval_length
+            for (order_day, at_midnight), order_counts in order_days.items():
+                if oldest_day <= order_day < recent_day:
+                    # seconds from oldest date of the order day, like seconds_from_oldest at or after midnight
+                    order_seconds = (order_day - oldest_day) * ctsc.CustomerTimeSpanCohorts.SECONDS_PER_DAY
+                    cell = orders_by_time_slot.get_counts_for_cohort_index(
+                        cohort_index, order_seconds if at_midnight else order_seconds + 1)
+                    bits = cell_bits.setdefault(id(cell), [cell, 0, 0])
+                    for bits_index in (0, 1):
+                        bits[bits_index + 1] |= int.from_bytes(order_counts[bits_index].bits, 'little') \
+                            << first_ordinals[creation_day]
+        for cell, all_bits, first_bits in cell_bits.values():
+            size = len(cell[0].bits)
+            cell[0] = CustomerBitmap.from_bytes(all_bits.to_bytes(size, 'little'))
+            cell[1] = CustomerBitmap.from_bytes(first_bits.to_bytes(size, 'little'))
+        return orders_by_time_slot
+
+    def snapshot_state(self) -> dict:
+        """:returns the days of this cube, built-in types only, see from_state"""
+
+        return {'last_day_ordinal': self.recent_day - 1,
+                'delta_time_zone_seconds': self.day_cohorts.delta_time_zone_seconds,
+                'window_days': self.window_days, 'time_zone_key': getattr(self.time_zone, 'key', None),
+                'loaded_day': self.loaded_day, 'read_day': self.read_day,
+                'day_customers': self.day_customers, 'duplicate_ids': sorted(self.duplicate_ids),
+                'full_read_needed': self.full_read_needed,
+                'day_orders': {creation_day: {order_key: [bytes(order_count) for order_count in order_counts]
+                                              for order_key, order_counts in order_days.items()}
+                               for creation_day, order_days in self.day_orders.items()}}
+
+    @staticmethod
+    def from_state(state: dict, time_zone: dtm.tzinfo = None):
+        """
+        Build a cube from the state saved by snapshot_state
+        :param state: state from snapshot_state
+        :param time_zone: time zone of the saved cube, its key must match the saved one
+        :returns DailyCohortCube instance"""
+
+        if state['time_zone_key'] != getattr(time_zone, 'key', None):
+            raise ValueError(f'time zone of the cube is {state["time_zone_key"]}: {time_zone}')
+        last_day = dtm.date.fromordinal(state['last_day_ordinal'])
+        # on the wall clock of time_zone, else at the saved offset, like CustomerTimeSpanCohorts.from_state
+        recent_date = dtm.datetime(last_day.year, last_day.month, last_day.day, tzinfo=None if time_zone is not None
+                                   else dtm.timezone(dtm.timedelta(seconds=state['delta_time_zone_seconds'])))
+        cube = DailyCohortCube(recent_date, state['window_days'], time_zone)
+        cube.loaded_day = state['loaded_day']
+        cube.read_day = state['read_day']
+        cube.day_customers = state['day_customers']
+        cube.duplicate_ids = set(state['duplicate_ids'])
+        cube.full_read_needed = state['full_read_needed']
+        cube.customer_days = {customer_id: (day, ordinal) for day, customer_ids in cube.day_customers.items()
+                              for ordinal, customer_id in enumerate(customer_ids)}
+        cube.day_orders = {creation_day: {order_key: [CustomerBitmap.from_bytes(bits) for bits in order_counts]
+                                          for order_key, order_counts in order_days.items()}
+                           for creation_day, order_days in state['day_orders'].items()}
+        return cube
+
+
+def save_cube(path_cube_file: str, cube: DailyCohortCube) -> int:
+    """
+    Write the days of a cube, replacing any previous file at the same path once fully written, see save_snapshot.
+    Will raise IOError if the file cannot be written
+    :return: size of the file in bytes
+    """
+
+    if cube is None or not isinstance(cube, DailyCohortCube):
+        raise TypeError(f'cube must be a DailyCohortCube: {cube}')
+    path_temporary_file = path_cube_file + '.tmp'
+    with open(path_temporary_file, mode='wb') as cube_file:
+        pickle.dump({'version': CUBE_VERSION, 'cube': cube.snapshot_state()}, cube_file,
+                    protocol=cohort_snapshot.PICKLE_PROTOCOL)
+    os.replace(path_temporary_file, path_cube_file)
+    return os.path.getsize(path_cube_file)
+
+
+def load_cube(path_cube_file: str, time_zone: dtm.tzinfo = None) -> DailyCohortCube:
+    """
+    Read the days of a cube saved by save_cube.
+    Will raise IOError if the file cannot be read, and ValueError if it is not a cube of this version
+    :param time_zone: time zone of the saved cube, see DailyCohortCube.from_state
+    """
+
+    with open(path_cube_file, mode='rb') as cube_file:
+        try:
+            saved = cohort_snapshot.BuiltinsUnpickler(cube_file).load()
+        except (pickle.UnpicklingError, EOFError) as e:
+            raise ValueError(f'not a daily cohort cube: {path_cube_file}') from e
+    if not isinstance(saved, dict) or saved.get('version') != CUBE_VERSION:
+        raise ValueError(f'cube version must be {CUBE_VERSION}: {path_cube_file}')
+    return DailyCohortCube.from_state(saved['cube'], time_zone)
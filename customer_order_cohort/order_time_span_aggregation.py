@@ -1,6 +1,189 @@
 import csv
 import datetime
+import io
+import math
+import multiprocessing
+import os
+from customer_order_cohort import block_index as bi, cohort_writers as cw, columnar_cache as cc, csv_input as ci
+from customer_order_cohort import sqlite_input as si
 from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort.pipeline_metrics import PipelineMetrics
+
+
+class CustomerBitmap:
+    """
+    Distinct customers for one order cell: one bit per customer ordinal in its cohort.
+    Replace a set of customer IDs, len() is the number of distinct customers.
+    """
+
+    __slots__ = ('bits', 'count')
+
+    def __init__(self, customer_count: int = 0):
+        self.bits: bytearray = bytearray((customer_count + 7) >> 3)
+        self.count: int = 0
+
+    def add(self, ordinal: int) -> bool:
+        """
+        Set the bit for a customer ordinal, growing the bitmap if needed
+        :param ordinal: customer ordinal in its cohort, see CustomerTimeSpanCohorts.locate_customer
+        :return: True if the customer was not yet in this cell
+        """
+
+        byte_index = ordinal >> 3
+        if byte_index >= len(self.bits):
+            self.bits.extend(bytes(byte_index + 1 - len(self.bits)))
+        mask = 1 << (ordinal & 7)
+        if self.bits[byte_index] & mask:
+            return False
+        self.bits[byte_index] |= mask
+        self.count += 1
+        return True
+
+    def __contains__(self, ordinal: int) -> bool:
+        byte_index = ordinal >> 3
+        return byte_index < len(self.bits) and bool(self.bits[byte_index] & (1 << (ordinal & 7)))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def update(self, other) -> int:
+        """
+        Merge the customers of another bitmap of the same cohort in this one
+        :param other: CustomerBitmap for the same cohort and period, for instance from another process
+        :return: the number of distinct customers after the merge
+        """
+
+        size = max(len(self.bits), len(other.bits))
+        merged = int.from_bytes(self.bits, 'little') | int.from_bytes(other.bits, 'little')
+        self.bits = bytearray(merged.to_bytes(size, 'little'))
+        self.count = bin(merged).count('1')
+        return self.count
+
+    @staticmethod
+    def from_bytes(bits: bytes):
+        """:returns CustomerBitmap with the given bits, as saved from CustomerBitmap.bits"""
+
+        bitmap = CustomerBitmap()
+        bitmap.bits = bytearray(bits)
+        bitmap.count = bin(int.from_bytes(bits, 'little')).count('1')
+        return bitmap
+
+    def __bytes__(self) -> bytes:
+        """:returns the bits of this bitmap, see from_bytes"""
+
+        return bytes(self.bits)
+
+    def __iter__(self):
+        """Iterate over the customer ordinals in this cell, smallest first"""
+
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (byte_index << 3) | bit
+
+
+class CustomerSketch:
+    """
+    Approximate distinct customers for one order cell: HyperLogLog sketch of 2 ** precision registers of one byte.
+    Same interface as CustomerBitmap, with a fixed size whatever the number of customers in the cohort.
+    len() is an estimate with a relative standard error of 1.04 / sqrt(2 ** precision), see get_standard_error:
+    about 99% of estimates are within three standard errors, and counts up to 2 ** precision are almost exact.
+    """
+
+    __slots__ = ('precision', 'registers')
+
+    # lowest and highest precision accepted, from 16 registers (26% error) to 65536 registers (0.41% error)
+    MIN_PRECISION = 4
+    MAX_PRECISION = 16
+
+    # bits of the hash of a customer ordinal
+    HASH_MASK = (1 << 64) - 1
+
+    def __init__(self, precision: int = 12):
+        if precision is None or not isinstance(precision, int):
+            raise TypeError(f'precision must be an integer: {precision}')
+        if not self.MIN_PRECISION <= precision <= self.MAX_PRECISION:
+            raise ValueError(f'value for precision must be between {self.MIN_PRECISION} and {self.MAX_PRECISION}:'
+                             f' {precision}')
+        self.precision: int = precision
+        self.registers: bytearray = bytearray(1 << precision)
+
+    @staticmethod
+    def get_standard_error(precision: int) -> float:
+        """:returns relative standard error of the estimates of a sketch with this precision"""
+
+        return 1.04 / (1 << precision) ** 0.5
+
+    @staticmethod
+    def hash_ordinal(ordinal: int) -> int:
+        """
+        Mix the bits of a customer ordinal, same value in every process unlike hash(), see splitmix64
+        :returns 64 bits hash
+        """
+
+        ordinal = (ordinal + 0x9e3779b97f4a7c15) & CustomerSketch.HASH_MASK
+        ordinal = ((ordinal ^ (ordinal >> 30)) * 0xbf58476d1ce4e5b9) & CustomerSketch.HASH_MASK
+        ordinal = ((ordinal ^ (ordinal >> 27)) * 0x94d049bb133111eb) & CustomerSketch.HASH_MASK
+        return ordinal ^ (ordinal >> 31)
+
+    def add(self, ordinal: int) -> bool:
+        """
+        Record a customer ordinal: its register keeps the longest run of leading zeros seen in the remaining bits
+        :param ordinal: customer ordinal in its cohort, see CustomerTimeSpanCohorts.locate_customer
+        :return: True if the sketch changed, which a customer already recorded never does
+        """
+
+        hashed = self.hash_ordinal(ordinal)
+        register_index = hashed >> (64 - self.precision)
+        rank = 65 - self.precision - (hashed & ((1 << (64 - self.precision)) - 1)).bit_length()
+        if rank <= self.registers[register_index]:
+            return False
+        self.registers[register_index] = rank
+        return True
+
+    def __len__(self) -> int:
+        """:returns estimated number of distinct customers, with linear counting for small counts"""
+
+        register_count = len(self.registers)
+        if register_count == 16:
+            alpha = 0.673
+        elif register_count == 32:
+            alpha = 0.697
+        elif register_count == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / register_count)
+        estimate = alpha * register_count * register_count / sum(2.0 ** -rank for rank in self.registers)
+        empty_registers = self.registers.count(0)
+        if estimate <= 2.5 * register_count and empty_registers > 0:
+            estimate = register_count * math.log(register_count / empty_registers)
+        return int(round(estimate))
+
+    def update(self, other) -> int:
+        """
+        Merge the customers of another sketch of the same cohort in this one, as if all were added to this one
+        :param other: CustomerSketch with the same precision, for the same cohort and period
+        :return: the estimated number of distinct customers after the merge
+        """
+
+        if other.precision != self.precision:
+            raise ValueError(f'cannot merge sketches of precision {other.precision} and {self.precision}')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return len(self)
+
+    def __bytes__(self) -> bytes:
+        """:returns the registers of this sketch, see from_bytes"""
+
+        return bytes(self.registers)
+
+    @staticmethod
+    def from_bytes(registers: bytes):
+        """:returns CustomerSketch with the given registers, as saved by bytes()"""
+
+        sketch = CustomerSketch(len(registers).bit_length() - 1)
+        sketch.registers[:] = registers
+        return sketch
 
 
 class OrderTimeSpanAggregation:
@@ -9,27 +192,179 @@ class OrderTimeSpanAggregation:
     Time span are offset from customer cohort interval: recent date plus number of days from order created
     """
 
-    def __init__(self, customer_cohorts: ctsc.CustomerTimeSpanCohorts = None):
+    # name and version of the columns cached by read_orders_csv_file, see columnar_cache
+    COLUMNAR_CACHE_LAYOUT = 'orders-1'
+
+    def __init__(self, customer_cohorts: ctsc.CustomerTimeSpanCohorts = None, sketch_precision: int = None):
+        """
+        :param sketch_precision: when set, count distinct customers per cell approximately, with a CustomerSketch
+        of this precision instead of a CustomerBitmap: fixed memory per cell, but estimated counts
+        """
+
         self.customer_group_to_order_accumulated: dict = {}  # SHOULDDO: defaultdict of array?
         if customer_cohorts is None or not isinstance(customer_cohorts, ctsc.CustomerTimeSpanCohorts):
             raise TypeError(f'customer_cohorts must be a CustomerTimeSpanCohorts : {customer_cohorts}')
         self.customer_cohorts = customer_cohorts
+        if sketch_precision is not None:
+            CustomerSketch(sketch_precision)  # check precision now rather than on the first order
+        self.sketch_precision: int = sketch_precision
+        # one set of metrics for the whole pipeline, from reading customers to writing order counts
+        self.metrics: PipelineMetrics = customer_cohorts.metrics
 
-    def read_orders_csv_file(self, path_csv_file: str = './data/orders.csv') -> int:
+    def read_orders_csv_file(self, path_csv_file: str = './data/orders.csv', workers: int = None,
+                             columnar_cache: bool = False, block_index: bool = False) -> int:
         """
         Open the csv file and iterate over its entries to aggregate orders by day intervals.
         Will raise IOError if path is invalid
+        :param path_csv_file: path to the orders csv file, gzip, bzip2 or xz compressed or not,
+        '-' for the standard input, or an open file, see csv_input.open_csv_input
+        :param workers: when set, number of processes reading the file in parallel, see read_orders_csv_file_in_parallel.
+        Compressed files, open files and the standard input are read by this process only
+        :param columnar_cache: when True, read parsed columns from a sidecar file written by a previous read,
+        see columnar_cache.read_csv_columns. Files with non integer IDs or order numbers, open files and the standard
+        input are read as csv
+        :param block_index: when True, read only the blocks of the csv file with order dates in the date range,
+        see ctsc.CustomerTimeSpanCohorts.select_indexed_byte_ranges. Compressed files, open files and the standard
+        input are fully read
         :returns the total number of customer groups"""
 
         # same pattern as CustomerTimeSpanCohorts.read_customers_csv_file to get an iterator
-        if path_csv_file is None or not isinstance(path_csv_file, str):
-            raise TypeError(f'path_csv_file must be a string: {path_csv_file}')
-        with open(path_csv_file, mode='r') as csv_file:
-            entry_reader = csv.reader(csv_file)  # use csv.DictReader instead?
-            next(entry_reader)  # skip header
+        if path_csv_file is None or not (isinstance(path_csv_file, str) or hasattr(path_csv_file, 'read')):
+            raise TypeError(f'path_csv_file must be a string or a file object: {path_csv_file}')
+        with self.metrics.measure('order_read'):
+            if columnar_cache and isinstance(path_csv_file, str) and path_csv_file != ci.STDIN_PATH:
+                parse_id_to_int = ctsc.CustomerTimeSpanCohorts.parse_id_to_int
+                columns = cc.read_csv_columns(
+                    path_csv_file, self.COLUMNAR_CACHE_LAYOUT,
+                    [(2, parse_id_to_int), (3, ctsc.CustomerTimeSpanCohorts.parse_date_to_cacheable_seconds),
+                     (1, parse_id_to_int)], ctsc.skip_csv_header)
+                if columns is not None:
+                    self.track_order_columns(*columns)
+                    return len(self.customer_cohorts.cohort_cardinality)
+            if block_index and ci.is_plain_csv_file(path_csv_file):
+                byte_ranges = self.customer_cohorts.select_indexed_byte_ranges(
+                    path_csv_file, 3, 'order_read', self.metrics.rejected_orders)
+                if workers is not None:
+                    return self.read_orders_csv_file_in_parallel(path_csv_file, workers, byte_ranges=byte_ranges)
+                self.read_all_order_entries(bi.iterate_byte_range_entries(path_csv_file, byte_ranges), 0, 2, 3, 1)
+                return len(self.customer_cohorts.cohort_cardinality)
+            if workers is not None and ci.is_plain_csv_file(path_csv_file):
+                return self.read_orders_csv_file_in_parallel(path_csv_file, workers)
+            with ci.open_csv_input(path_csv_file) as csv_file:
+                entry_reader = csv.reader(csv_file)  # use csv.DictReader instead?
+                next(entry_reader)  # skip header
+                # order ID, customer ID, order date, num order by customer
+                self.read_all_order_entries(entry_reader, 0, 2, 3, 1)
+        return len(self.customer_cohorts.cohort_cardinality)
+
+    def read_orders_database(self, path_database='./data/cohorts.sqlite') -> int:
+        """
+        Query the orders of a SQLite database in the date range, of customers created in the date range,
+        see sqlite_input.query_orders, and aggregate them by day intervals.
+        Orders not fetched are not counted in metrics.
+        Will raise sqlite3.Error if the database has no customers or orders table
+        :param path_database: path to a SQLite database file, or an open sqlite3.Connection, left open
+        :returns the total number of customer groups"""
+
+        connection = si.open_database(path_database)
+        try:
+            with self.metrics.measure('order_read'):
+                # order ID, order number, customer ID, order date, as in the csv file
+                self.read_all_order_entries(si.query_orders(
+                    connection, self.customer_cohorts.get_utc_seconds_range()), 0, 2, 3, 1)
+        finally:
+            if connection is not path_database:
+                connection.close()
+        return len(self.customer_cohorts.cohort_cardinality)
+
+    def read_orders_csv_file_in_parallel(self, path_csv_file: str, workers: int, ranges_per_worker: int = 4,
+                                         byte_ranges: [(int, int)] = None) -> int:
+        """
+        Split the csv file in newline aligned byte ranges, aggregate each range in a pool of processes,
+        and merge the partial aggregations in this one. Same result as read_orders_csv_file.
+        Quoted values of the csv file must not contain new lines.
+        The customer cohorts are given once to each process, read only.
+        Rows and rejected orders of the processes are added to the metrics, their CPU time is not.
+        :param path_csv_file: path to the orders csv file
+        :param workers: number of processes
+        :param ranges_per_worker: number of byte ranges per process, to balance the load
+        :param byte_ranges: new line aligned byte ranges to read, instead of the whole file split by ranges_per_worker
+        :returns the total number of customer groups"""
+
+        if workers is None or not isinstance(workers, int):
+            raise TypeError(f'workers must be an integer: {workers}')
+        if workers < 1:
+            raise ValueError(f'value for workers must be a positive integer: {workers}')
+        if len(self.customer_cohorts.cohort_cardinality) < 1:
+            raise ValueError(f'at least on cohort is needed in customer_cohorts: {self.customer_cohorts}')
+        if byte_ranges is None:
+            byte_ranges = split_csv_file_byte_ranges(path_csv_file, workers * ranges_per_worker)
+        with multiprocessing.Pool(workers, initializer=init_order_worker, initargs=(self.customer_cohorts,)) as pool:
+            for partial_accumulated, partial_metrics in pool.imap_unordered(aggregate_orders_byte_range, [
+                    (path_csv_file, start, end, self.sketch_precision) for start, end in byte_ranges]):
+                self.merge_order_accumulated(partial_accumulated)
+                self.metrics.merge(partial_metrics, timings=False)
+        return len(self.customer_cohorts.cohort_cardinality)
+
+    def merge_order_accumulated(self, other_accumulated: dict) -> int:
+        """
+        Merge the distinct customers per cohort and period of another aggregation on the same customer cohorts
+        :param other_accumulated: customer_group_to_order_accumulated of the other aggregation
+        :return: number of cohorts with orders after the merge
+        """
+
+        for cohort_key, other_periods in other_accumulated.items():
+            if cohort_key not in self.customer_group_to_order_accumulated:
+                self.customer_group_to_order_accumulated[cohort_key] = other_periods
+                continue
+            for order_count, other_order_count in zip(self.customer_group_to_order_accumulated[cohort_key],
+                                                      other_periods):
+                order_count[0].update(other_order_count[0])
+                order_count[1].update(other_order_count[1])
+        return len(self.customer_group_to_order_accumulated)
+
+    def read_orders_csv_file_from_offset(self, path_csv_file: str, offset: int = None) -> int:
+        """
+        Read the order entries appended to the csv file since a previous read, see ctsc.read_csv_file_from_offset
+        :param path_csv_file: path to the orders csv file
+        :param offset: byte offset returned by the previous read, None to read all entries
+        :returns the byte offset for the next read"""
+
+        with self.metrics.measure('order_read'):
+            entry_reader, offset = ctsc.read_csv_file_from_offset(path_csv_file, offset)
             # order ID, customer ID, order date, num order by customer
             self.read_all_order_entries(entry_reader, 0, 2, 3, 1)
-        return len(self.customer_cohorts.cohort_cardinality)
+        return offset
+
+    def snapshot_state(self) -> dict:
+        """
+        :return: the accumulated state of this aggregation and its customer cohorts, built-in types only
+        """
+
+        return {
+            'customer_cohorts': self.customer_cohorts.snapshot_state(),
+            'sketch_precision': self.sketch_precision,
+            'customer_group_to_order_accumulated': {
+                cohort_key: [[bytes(order_count[0]), bytes(order_count[1])] for order_count in periods]
+                for cohort_key, periods in self.customer_group_to_order_accumulated.items()}}
+
+    @staticmethod
+    def from_state(state: dict):
+        """
+        Build an aggregation, and its customer cohorts, from the state saved by snapshot_state
+        :param state: state from snapshot_state
+        :return: OrderTimeSpanAggregation instance
+        """
+
+        orders_by_time_slot = OrderTimeSpanAggregation(
+            customer_cohorts=ctsc.CustomerTimeSpanCohorts.from_state(state['customer_cohorts']),
+            sketch_precision=state.get('sketch_precision'))
+        cell_class = CustomerBitmap if orders_by_time_slot.sketch_precision is None else CustomerSketch
+        for cohort_key, periods in state['customer_group_to_order_accumulated'].items():
+            orders_by_time_slot.customer_group_to_order_accumulated[cohort_key] = [
+                [cell_class.from_bytes(cell_bytes), cell_class.from_bytes(first_cell_bytes)]
+                for cell_bytes, first_cell_bytes in periods]
+        return orders_by_time_slot
 
     def read_all_order_entries(self, entry_reader, order_id_index: int, customer_id_index: int,
                                order_created_index: int, order_sequence_index: int) -> int:
@@ -45,8 +380,11 @@ class OrderTimeSpanAggregation:
 
         if len(self.customer_cohorts.cohort_cardinality) < 1:
             raise ValueError(f'at least on cohort is needed in customer_cohorts: {self.customer_cohorts}')
+        rows = 0
         for entry in entry_reader:
             self.track_order(entry[customer_id_index], entry[order_created_index], entry[order_sequence_index])
+            rows += 1
+        self.metrics.add_rows('order_read', rows)
         return len(self.customer_cohorts.cohort_cardinality)
 
     def track_order(self, customer_id: str, order_creation_date: str, order_sequence: str) -> []:
@@ -60,39 +398,111 @@ class OrderTimeSpanAggregation:
         :return: array of order counts matching customer cohort and order time slot if withing time range of analysis
         """
 
-        if customer_id is None or customer_id not in self.customer_cohorts.customers_and_matching_cohort:
+        if customer_id is None:
+            self.metrics.rejected_orders[PipelineMetrics.MISSING_CUSTOMER_ID] += 1
+            return None
+        # one registry lookup, same as locate_customer
+        packed_index = self.customer_cohorts.customers_cohort_index.get(customer_id)
+        if packed_index is None:
+            self.metrics.rejected_orders[PipelineMetrics.UNKNOWN_CUSTOMER_ID] += 1
             return None
-        order_created = self.customer_cohorts.convert_date_in_range(order_creation_date)
-        if order_created is None:
+        order_created_seconds = self.customer_cohorts.seconds_from_oldest(order_creation_date)
+        if order_created_seconds is None:
+            self.metrics.rejected_orders[self.customer_cohorts.get_date_rejection_reason(order_creation_date)] += 1
             return None
         # aggregate order data, simple count increment
-        count_and_first_count: [] = self.get_counts_for_date(customer_id, order_created)
-        count_and_first_count[0].add(customer_id)
+        customer_ordinal, cohort_index = divmod(packed_index, self.customer_cohorts.number_of_intervals)
+        count_and_first_count: [] = self.get_counts_for_cohort_index(cohort_index, order_created_seconds)
+        count_and_first_count[0].add(customer_ordinal)
         if order_sequence == '1':
-            count_and_first_count[1].add(customer_id)
+            count_and_first_count[1].add(customer_ordinal)
         return count_and_first_count
 
+    def track_order_columns(self, customer_ids: [int], order_creation_seconds: [int], order_sequences: [int]) -> int:
+        """
+        Equivalent of track_order on columns from the columnar cache
+        :param customer_ids: integer customer IDs, see CustomerTimeSpanCohorts.parse_id_to_int
+        :param order_creation_seconds: when the orders were placed, see parse_date_to_cacheable_seconds
+        :param order_sequences: number of order the customer made (1 indexed)
+        :return: number of orders tracked from these columns
+        """
+
+        if len(self.customer_cohorts.cohort_cardinality) < 1:
+            raise ValueError(f'at least on cohort is needed in customer_cohorts: {self.customer_cohorts}')
+        # same shift for all dates without offset changes, else get_local_seconds
+        shift_seconds = self.customer_cohorts.utc_offsets[0] - self.customer_cohorts.oldest_date_seconds \
+            if len(self.customer_cohorts.utc_offsets) == 1 else None
+        range_seconds = self.customer_cohorts.recent_date_seconds - self.customer_cohorts.oldest_date_seconds
+        tracked = 0
+        rejected_orders = self.metrics.rejected_orders
+        for customer_id, created, order_sequence in zip(customer_ids, order_creation_seconds, order_sequences):
+            if created >= 0:  # else invalid date
+                created_from_oldest = created + shift_seconds if shift_seconds is not None \
+                    else self.customer_cohorts.get_local_seconds(created) - self.customer_cohorts.oldest_date_seconds
+                if 0 <= created_from_oldest < range_seconds:
+                    located = self.customer_cohorts.locate_customer(str(customer_id))
+                    if located is not None:
+                        count_and_first_count: [] = self.get_counts_for_cohort_index(located[0], created_from_oldest)
+                        count_and_first_count[0].add(located[1])
+                        if order_sequence == 1:
+                            count_and_first_count[1].add(located[1])
+                        tracked += 1
+                        continue
+            # same rejection reasons as track_order, which checks the customer first
+            if str(customer_id) not in self.customer_cohorts.customers_cohort_index:
+                rejected_orders[PipelineMetrics.UNKNOWN_CUSTOMER_ID] += 1
+            else:
+                rejected_orders[PipelineMetrics.INVALID_DATE if created < 0 else PipelineMetrics.DATE_OUT_OF_RANGE] += 1
+        self.metrics.add_rows('order_read', len(customer_ids))
+        return tracked
+
     def get_counts_for_date(self, customer_id: str, order_created: datetime.datetime) -> []:
         """
         Get the cohort for a customer, the array of the matching orders distinct customer ids,
         and the matching sub set for the order creation time
         :param customer_id: a customer ID captured when building teh cohorts
         :param order_created: order creation to locate matching period
-        :return: array with two sets, one for all distinct orders, one for first time orders
+        :return: array with two CustomerBitmap, one for all distinct orders, one for first time orders
+        """
+
+        return self.get_counts_for_seconds(customer_id, ctsc.CustomerTimeSpanCohorts.to_seconds(
+            order_created) - self.customer_cohorts.oldest_date_seconds)
+
+    def get_counts_for_seconds(self, customer_id: str, order_created_seconds: int) -> []:
+        """
+        Same as get_counts_for_date, with the order creation as seconds from oldest date of the customer cohorts
+        :param customer_id: a customer ID captured when building the cohorts
+        :param order_created_seconds: order creation to locate matching period, see seconds_from_oldest
+        :return: array with two CustomerBitmap, one for all distinct orders, one for first time orders
         """
 
-        customer_cohort_key: str = self.customer_cohorts.customers_and_matching_cohort[customer_id].id
+        return self.get_counts_for_cohort_index(
+            self.customer_cohorts.locate_customer(customer_id)[0], order_created_seconds)
+
+    def get_counts_for_cohort_index(self, cohort_index: int, order_created_seconds: int) -> []:
+        """
+        Same as get_counts_for_seconds, for a customer cohort given by its index
+        :param cohort_index: index of the customer cohort, see CustomerTimeSpanCohorts.cohort_table
+        :param order_created_seconds: order creation to locate matching period, see seconds_from_oldest
+        :return: array with two CustomerBitmap, or CustomerSketch, one for all distinct orders, one for first time orders
+        """
+
+        customer_cohort_key: str = self.customer_cohorts.cohort_table[cohort_index].id
         if customer_cohort_key not in self.customer_group_to_order_accumulated:
-            # init time slot with 0 order and 0 first time order
-            # we could always init with self.customer_cohorts.number_of_intervals array length ...
-            cohort_intervals_delta: datetime.timedelta = \
-                self.customer_cohorts.recent_date -\
-                self.customer_cohorts.customers_and_matching_cohort[customer_id].oldest_date
-            cohort_intervals: int = cohort_intervals_delta.days // self.customer_cohorts.days_interval_length
-            self.customer_group_to_order_accumulated[customer_cohort_key] =\
-                [[set(), set()] for i in range(cohort_intervals)]
-        time_slot_delta: datetime.timedelta = self.customer_cohorts.recent_date - order_created
-        time_slot_index: int = time_slot_delta.days // self.customer_cohorts.days_interval_length
+            # init time slot with 0 order and 0 first time order, one per period from the cohort to recent_date
+            cohort_intervals: int = self.customer_cohorts.number_of_intervals - cohort_index
+            if self.sketch_precision is not None:
+                self.customer_group_to_order_accumulated[customer_cohort_key] = [
+                    [CustomerSketch(self.sketch_precision), CustomerSketch(self.sketch_precision)]
+                    for i in range(cohort_intervals)]
+            else:
+                cohort_total: int = self.customer_cohorts.cohort_cardinality[customer_cohort_key]
+                self.customer_group_to_order_accumulated[customer_cohort_key] =\
+                    [[CustomerBitmap(cohort_total), CustomerBitmap(cohort_total)] for i in range(cohort_intervals)]
+        # whole days to recent_date, like (recent_date - order_created).days
+        time_slot_days: int = (self.customer_cohorts.recent_date_seconds - self.customer_cohorts.oldest_date_seconds -
+                               order_created_seconds) // ctsc.CustomerTimeSpanCohorts.SECONDS_PER_DAY
+        time_slot_index: int = time_slot_days // self.customer_cohorts.days_interval_length
         return self.customer_group_to_order_accumulated[customer_cohort_key][time_slot_index]
 
     def get_counts_for_cohort(self, customer_cohort_key: str) -> []:
@@ -107,6 +517,25 @@ class OrderTimeSpanAggregation:
         return [[len(order_count[0]), len(order_count[1])] for
                 order_count in reversed(customer_ids_per_periods)]
 
+    def get_customer_ids_for_cohort(self, customer_cohort_key: str) -> []:
+        """
+        Helper method to decode the distinct customers tracked per period back to their customer IDs
+        :param customer_cohort_key: one of the customer cohort ID tracked by this analysis
+        :return: array of 2 sets of customer IDs per period, all orders and first orders, in accumulation order
+        """
+        if self.sketch_precision is not None:
+            raise ValueError(f'customer IDs are not kept with sketch_precision: {self.sketch_precision}')
+        if customer_cohort_key not in self.customer_group_to_order_accumulated:
+            return None
+        customer_ids: dict = {}
+        for customer_id in self.customer_cohorts.customers_cohort_index:
+            cohort_index, ordinal = self.customer_cohorts.locate_customer(customer_id)
+            if self.customer_cohorts.cohort_table[cohort_index].id == customer_cohort_key:
+                customer_ids[ordinal] = customer_id
+        return [[{customer_ids[ordinal] for ordinal in order_count[0]},
+                 {customer_ids[ordinal] for ordinal in order_count[1]}]
+                for order_count in self.customer_group_to_order_accumulated[customer_cohort_key]]
+
     def write_orders_count_by_cohorts_csv_file(self, output_csv_file_path: str) -> int:
         """
         Flush summary of the order analysis as a csv file. Two lines per customer cohort,
@@ -120,26 +549,81 @@ class OrderTimeSpanAggregation:
 
         if output_csv_file_path is None or not isinstance(output_csv_file_path, str):
             raise TypeError(f'output_csv_file_path must be a string: {output_csv_file_path}')
-        with open(output_csv_file_path, mode='w', encoding='utf8') as csv_file:
-            entry_writer = csv.writer(csv_file, lineterminator='\n')
-            days_in_period: int = self.customer_cohorts.days_interval_length
-            headers = ['Cohort', 'Customers']
-            for i in range(self.customer_cohorts.number_of_intervals):
-                headers.append(f'{i*days_in_period}-{(i+1)*days_in_period-1} days')
-            entry_writer.writerow(headers)
-            for cohort_key in reversed(sorted(self.customer_cohorts.cohort_cardinality)):
-                if cohort_key in self.customer_group_to_order_accumulated:
-                    cohort_total = self.customer_cohorts.cohort_cardinality[cohort_key]
-                    cohort_counts = [cohort_key, cohort_total]
-                    cohort_first_counts = ['', '']
-                    customer_ids_per_periods = self.customer_group_to_order_accumulated[cohort_key]
-                    for order_count in reversed(customer_ids_per_periods):
-                        cohort_counts.append(
-                            f'{round(100*len(order_count[0])/cohort_total, 2)}% orders ({len(order_count[0])})'
-                        )
-                        cohort_first_counts.append(
-                            f'{round(100*len(order_count[1])/cohort_total, 2)}% 1st time ({len(order_count[1])})'
-                        )
-                    entry_writer.writerow(cohort_counts)
-                    entry_writer.writerow(cohort_first_counts)
+        self.write_orders_count_by_cohorts_file(output_csv_file_path, 'human')
         return len(self.customer_cohorts.cohort_cardinality)
+
+    def write_orders_count_by_cohorts_file(self, output_file_path: str, output_format: str = 'human') -> int:
+        """
+        Same as write_orders_count_by_cohorts_csv_file, in one of the formats of cohort_writers,
+        for instance with integer counts for other programs
+        :param output_file_path: path to write file
+        :param output_format: one of cohort_writers.OUTPUT_FORMATS
+        :return: number of lines or records written after the header
+        """
+
+        with self.metrics.measure('csv_write') as stage_metrics:
+            lines = cw.write_orders_count_by_cohorts_file(self, output_file_path, output_format)
+            stage_metrics.rows += lines
+        return lines
+
+    def write_orders_count_by_cohorts(self, csv_file) -> int:
+        """
+        Same as write_orders_count_by_cohorts_csv_file, on an open text file
+        :param csv_file: text file to write to, like an open file or io.StringIO
+        :return: number of lines written after the header, two per cohort with orders
+        """
+
+        return cw.write_human(self, csv_file)
+
+
+def split_csv_file_byte_ranges(path_csv_file: str, parts: int) -> [(int, int)]:
+    """
+    Split a csv file after its header line, in about equal byte ranges starting and ending on new lines
+    :param path_csv_file: path to the csv file
+    :param parts: number of ranges wanted, fewer are returned for small files
+    :return: array of (start, end) byte offsets, end excluded
+    """
+
+    with open(path_csv_file, mode='rb') as csv_file:
+        csv_file.readline()  # skip header
+        start = csv_file.tell()
+        size = os.fstat(csv_file.fileno()).st_size
+        boundaries = [start]
+        for part in range(1, parts):
+            csv_file.seek(max(start + (size - start) * part // parts - 1, boundaries[-1]))
+            csv_file.readline()  # move to next line start
+            if boundaries[-1] < csv_file.tell() < size:
+                boundaries.append(csv_file.tell())
+        boundaries.append(size)
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1) if boundaries[i] < boundaries[i + 1]]
+
+
+# customer cohorts shared read only by all orders read in a worker process, see init_order_worker
+worker_customer_cohorts: ctsc.CustomerTimeSpanCohorts = None
+
+
+def init_order_worker(customer_cohorts: ctsc.CustomerTimeSpanCohorts):
+    """Process pool initializer for OrderTimeSpanAggregation.read_orders_csv_file_in_parallel"""
+
+    global worker_customer_cohorts
+    worker_customer_cohorts = customer_cohorts
+
+
+def aggregate_orders_byte_range(path_start_end: (str, int, int, int)) -> dict:
+    """
+    Aggregate the orders of a byte range of the orders csv file, in a worker process
+    :param path_start_end: path to the orders csv file, start and end byte offsets of new line aligned entries,
+    and the sketch_precision of the aggregation
+    :return: the customer_group_to_order_accumulated of the range, and the PipelineMetrics of the range
+    """
+
+    path_csv_file, start, end, sketch_precision = path_start_end
+    with open(path_csv_file, mode='rb') as csv_file:
+        csv_file.seek(start)
+        entries = io.StringIO(csv_file.read(end - start).decode(), newline='')
+    orders_by_time_slot = OrderTimeSpanAggregation(customer_cohorts=worker_customer_cohorts,
+                                                   sketch_precision=sketch_precision)
+    orders_by_time_slot.metrics = PipelineMetrics()  # this range only
+    # order ID, customer ID, order date, num order by customer
+    orders_by_time_slot.read_all_order_entries(csv.reader(entries), 0, 2, 3, 1)
+    return orders_by_time_slot.customer_group_to_order_accumulated, orders_by_time_slot.metrics
@@ -0,0 +1,188 @@
+"""Out of core cohort analysis, for customer files larger than memory.
+Customers and orders csv files are hash partitioned by customer ID into spill files on local disk,
+each partition is analysed with CustomerTimeSpanCohorts and OrderTimeSpanAggregation,
+and their order counts are merged: a customer and all its orders are in a single partition.
+"""
+
+import csv
+import datetime as dtm
+import math
+import os
+import tempfile
+from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+from customer_order_cohort.customer_registry import CustomerRegistry
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+def get_peak_rss_bytes() -> int:
+    """:returns the peak resident set size of this process in bytes, None if it is not available"""
+
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if os.uname().sysname == 'Darwin' else peak_rss * 1024  # kilobytes on Linux
+
+
+class CustomerCount:
+    """Count of distinct customers of one order cell, summed from disjoint partitions. len() like CustomerBitmap"""
+
+    __slots__ = ('count',)
+
+    def __init__(self, count: int = 0):
+        self.count: int = count
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class PartitionedCohortAnalysis:
+    """
+    Cohort analysis with memory bounded by a budget instead of the number of customers in the date range
+    """
+
+    # estimated memory used by one customer in CustomerTimeSpanCohorts, ID string, packed index and dict entry
+    BYTES_PER_CUSTOMER = 200
+
+    # number of first lines of the customers csv file used to estimate the number of customers
+    SAMPLE_LINES = 1000
+
+    def __init__(self, recent_date: dtm.datetime = dtm.datetime.now(), days_interval_length: int = 7,
+                 number_of_intervals: int = 8, memory_budget_bytes: int = 1 << 30, spill_directory: str = None,
+                 time_zone: dtm.tzinfo = None, sketch_precision: int = None):
+        """:param sketch_precision: approximate distinct customers of each partition, see OrderTimeSpanAggregation"""
+
+        if memory_budget_bytes is None or not isinstance(memory_budget_bytes, int):
+            raise TypeError(f'memory_budget_bytes must be an integer: {memory_budget_bytes}')
+        if memory_budget_bytes < 1:
+            raise ValueError(f'value for memory_budget_bytes must be a positive integer: {memory_budget_bytes}')
+        self.memory_budget_bytes: int = memory_budget_bytes
+        self.spill_directory: str = spill_directory
+        self.sketch_precision: int = sketch_precision
+        # merged result: cohort cardinality and order counts, without customer IDs
+        self.customer_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=recent_date, days_interval_length=days_interval_length,
+            number_of_intervals=number_of_intervals, time_zone=time_zone)
+        self.orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=self.customer_cohorts)
+        self.partition_count: int = 0
+        self.spilled_customers: int = 0
+        self.spilled_orders: int = 0
+        self.peak_rss_bytes: int = None
+
+    def __str__(self):
+        """Build commend prompt friendly string representation for this analysis"""
+
+        peak_rss = 'unknown' if self.peak_rss_bytes is None else f'{self.peak_rss_bytes / 2 ** 20:.1f} MiB'
+        return f'Customer time-series cohorts between {self.customer_cohorts.oldest_date}' \
+               f' and {self.customer_cohorts.recent_date},' \
+               f' with {len(self.customer_cohorts.cohort_cardinality)} captured cohorts,' \
+               f' on {sum(self.customer_cohorts.cohort_cardinality.values())} customers,' \
+               f' partitioned in {self.partition_count} for a budget of {self.memory_budget_bytes / 2 ** 20:.1f} MiB,' \
+               f' {self.spilled_customers} customers and {self.spilled_orders} orders spilled,' \
+               f' peak RSS {peak_rss}.'
+
+    def get_partition_count(self, path_customers_csv_file: str) -> int:
+        """
+        Estimate the number of customers from the average line length of the first lines of the csv file,
+        and the number of partitions so that one partition of customers fits in the memory budget
+        :param path_customers_csv_file: path to the customers csv file
+        :returns number of partitions, at least 1"""
+
+        with open(path_customers_csv_file, mode='rb') as csv_file:
+            csv_file.readline()  # skip header
+            sample_start = csv_file.tell()
+            sample_lines = sum(1 for _ in zip(range(self.SAMPLE_LINES), csv_file))
+            sample_bytes = csv_file.tell() - sample_start
+            size = os.fstat(csv_file.fileno()).st_size - sample_start
+        if sample_lines < 1:
+            return 1
+        customers = size * sample_lines / sample_bytes
+        return max(1, math.ceil(customers * self.BYTES_PER_CUSTOMER / self.memory_budget_bytes))
+
+    def spill_csv_file(self, path_csv_file: str, index_for_id: int, index_for_created: int,
+                       path_partition_files: [str], rejected: dict = None) -> int:
+        """
+        Write entries of a csv file in the date range of the analysis to partition files, by hash of customer ID
+        :param path_csv_file: path to the customers or orders csv file
+        :param index_for_id: index on entry to get customer ID value
+        :param index_for_created: index on entry to get created date value
+        :param path_partition_files: path of each partition file to write, with the same header
+        :param rejected: when set, count of entries not written per rejection reason, see PipelineMetrics
+        :returns number of entries written"""
+
+        spilled = 0
+        with open(path_csv_file, mode='r') as csv_file:
+            entry_reader = csv.reader(csv_file)
+            header = next(entry_reader)
+            partition_files = [open(path_partition_file, mode='w', newline='')
+                               for path_partition_file in path_partition_files]
+            try:
+                partition_writers = [csv.writer(partition_file) for partition_file in partition_files]
+                for partition_writer in partition_writers:
+                    partition_writer.writerow(header)
+                for entry in entry_reader:
+                    # out of range entries are never tracked, see track_customer and track_order
+                    if self.customer_cohorts.seconds_from_oldest(entry[index_for_created]) is not None:
+                        partition_writers[hash(entry[index_for_id]) % len(partition_writers)].writerow(entry)
+                        spilled += 1
+                    elif rejected is not None:
+                        rejected[self.customer_cohorts.get_date_rejection_reason(entry[index_for_created])] += 1
+            finally:
+                for partition_file in partition_files:
+                    partition_file.close()
+        return spilled
+
+    def merge_partition(self, partition_orders: otsa.OrderTimeSpanAggregation) -> int:
+        """
+        Add cohort cardinality and order counts of one partition to the merged result
+        :param partition_orders: analysis of one partition, its customers are not in any other partition
+        :returns number of cohorts of the merged result"""
+
+        self.customer_cohorts.metrics.merge(partition_orders.metrics)
+        for cohort_key, cohort_total in partition_orders.customer_cohorts.cohort_cardinality.items():
+            self.customer_cohorts.cohort_cardinality[cohort_key] += cohort_total
+        for cohort_key, periods in partition_orders.customer_group_to_order_accumulated.items():
+            merged_periods = self.orders_by_time_slot.customer_group_to_order_accumulated.setdefault(
+                cohort_key, [[CustomerCount(), CustomerCount()] for _ in periods])
+            for merged_order_count, order_count in zip(merged_periods, periods):
+                merged_order_count[0].count += len(order_count[0])
+                merged_order_count[1].count += len(order_count[1])
+        return len(self.customer_cohorts.cohort_cardinality)
+
+    def read_csv_files(self, path_customers_csv_file: str = './data/customers.csv',
+                       path_orders_csv_file: str = './data/orders.csv') -> int:
+        """
+        Spill both csv files to partitions, analyse partitions one at a time and merge their results.
+        Will raise IOError if a csv file is not valid or the spill files cannot be written
+        :param path_customers_csv_file: path to the customers csv file
+        :param path_orders_csv_file: path to the orders csv file
+        :returns the total number of customer groups in the date range of the analysis"""
+
+        self.partition_count = self.get_partition_count(path_customers_csv_file)
+        with tempfile.TemporaryDirectory(dir=self.spill_directory) as spill_directory:
+            path_customers_files = [os.path.join(spill_directory, f'customers-{partition}.csv')
+                                    for partition in range(self.partition_count)]
+            path_orders_files = [os.path.join(spill_directory, f'orders-{partition}.csv')
+                                 for partition in range(self.partition_count)]
+            metrics = self.customer_cohorts.metrics
+            with metrics.measure('spill') as stage_metrics:
+                self.spilled_customers += self.spill_csv_file(path_customers_csv_file, 0, 1, path_customers_files,
+                                                              metrics.rejected_customers)
+                self.spilled_orders += self.spill_csv_file(path_orders_csv_file, 2, 3, path_orders_files,
+                                                           metrics.rejected_orders)
+                stage_metrics.rows = self.spilled_customers + self.spilled_orders
+            # same date range and time zone for all partitions, no customer yet
+            partition_state = self.customer_cohorts.snapshot_state()
+            partition_state.update(customer_registry=CustomerRegistry().snapshot_state(), cohort_cardinality={})
+            for path_customers_file, path_orders_file in zip(path_customers_files, path_orders_files):
+                partition_cohorts = ctsc.CustomerTimeSpanCohorts.from_state(partition_state)
+                if partition_cohorts.read_customers_csv_file(path_customers_file) > 0:
+                    partition_orders = otsa.OrderTimeSpanAggregation(customer_cohorts=partition_cohorts,
+                                                                     sketch_precision=self.sketch_precision)
+                    partition_orders.read_orders_csv_file(path_orders_file)
+                    self.merge_partition(partition_orders)
+                self.peak_rss_bytes = get_peak_rss_bytes()
+        return len(self.customer_cohorts.cohort_cardinality)
@@ -0,0 +1,153 @@
+"""Metrics of a cohort analysis pipeline: wall and CPU time per stage, rows and throughput,
+and count of rejected entries per reason. Cheap enough to be always on: a few counters per rejected entry,
+two clock reads per stage. Optionally profile the stages with cProfile, or any other hook.
+"""
+
+import cProfile
+import io
+import pstats
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StageMetrics:
+    """Accumulated wall time, CPU time and rows of one stage, over all its runs"""
+
+    __slots__ = ('wall_seconds', 'cpu_seconds', 'rows', 'runs')
+
+    def __init__(self):
+        self.wall_seconds: float = 0.0
+        self.cpu_seconds: float = 0.0
+        self.rows: int = 0
+        self.runs: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {'wall_seconds': self.wall_seconds, 'cpu_seconds': self.cpu_seconds, 'rows': self.rows,
+                'runs': self.runs, 'rows_per_second': self.rows_per_second}
+
+
+class PipelineMetrics:
+    """
+    Metrics shared by CustomerTimeSpanCohorts and the OrderTimeSpanAggregation built on it
+    """
+
+    # rejection reasons of customer entries, see CustomerTimeSpanCohorts.track_customer
+    MISSING_CUSTOMER_ID = 'missing_customer_id'
+    DUPLICATE_CUSTOMER_ID = 'duplicate_customer_id'
+    INVALID_DATE = 'invalid_date'
+    DATE_OUT_OF_RANGE = 'date_out_of_range'
+    # rejection reason of order entries, with MISSING_CUSTOMER_ID, INVALID_DATE and DATE_OUT_OF_RANGE
+    UNKNOWN_CUSTOMER_ID = 'unknown_customer_id'
+
+    def __init__(self):
+        self.stages: dict = defaultdict(StageMetrics)
+        self.rejected_customers: dict = defaultdict(int)
+        self.rejected_orders: dict = defaultdict(int)
+        # function of a stage name returning a context manager, entered around the stage, see enable_profiling
+        self.stage_hook = None
+        self.profiler: cProfile.Profile = None
+
+    def __getstate__(self) -> dict:
+        """Profiler and hook are not sent to worker processes"""
+
+        state = dict(self.__dict__)
+        state.update(stage_hook=None, profiler=None)
+        return state
+
+    def __str__(self):
+        """Build commend prompt friendly string representation of these metrics"""
+
+        lines = ['Pipeline metrics:']
+        for stage, stage_metrics in self.stages.items():
+            lines.append(f'  {stage}: {stage_metrics.rows} rows in {stage_metrics.wall_seconds:.3f}s,'
+                         f' {stage_metrics.cpu_seconds:.3f}s CPU, {stage_metrics.rows_per_second:.0f} rows/s')
+        for entity, rejected in [('customers', self.rejected_customers), ('orders', self.rejected_orders)]:
+            if rejected:
+                lines.append(f'  rejected {entity}: ' + ', '.join(
+                    f'{count} {reason}' for reason, count in sorted(rejected.items())))
+        return '\n'.join(lines)
+
+    def as_dict(self) -> dict:
+        """:returns metrics with built-in types only, to serialize them"""
+
+        return {'stages': {stage: stage_metrics.as_dict() for stage, stage_metrics in self.stages.items()},
+                'rejected_customers': dict(self.rejected_customers), 'rejected_orders': dict(self.rejected_orders)}
+
+    @contextmanager
+    def measure(self, stage: str):
+        """
+        Context manager timing a stage, with the stage hook and the profiler if enabled
+        :param stage: name of the stage, like 'customer_read', 'order_read' or 'csv_write'
+        """
+
+        stage_metrics = self.stages[stage]
+        hook = self.stage_hook(stage) if self.stage_hook is not None else None
+        if hook is not None:
+            hook.__enter__()
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stage_metrics
+        finally:
+            stage_metrics.wall_seconds += time.perf_counter() - start
+            stage_metrics.cpu_seconds += time.process_time() - start_cpu
+            stage_metrics.runs += 1
+            if hook is not None:
+                hook.__exit__(None, None, None)
+
+    def add_rows(self, stage: str, rows: int) -> int:
+        """:returns the total rows of a stage after adding rows to it"""
+
+        self.stages[stage].rows += rows
+        return self.stages[stage].rows
+
+    def merge(self, other, timings: bool = True) -> int:
+        """
+        Add the rows, timings and rejection counts of another pipeline, for instance from a worker process
+        :param other: PipelineMetrics of the other pipeline
+        :param timings: False when the other pipeline ran concurrently to a stage measured here,
+        only its rows and rejected entries are added
+        :returns total number of rejected entries"""
+
+        for stage, other_stage_metrics in other.stages.items():
+            stage_metrics = self.stages[stage]
+            stage_metrics.rows += other_stage_metrics.rows
+            if timings:
+                stage_metrics.wall_seconds += other_stage_metrics.wall_seconds
+                stage_metrics.cpu_seconds += other_stage_metrics.cpu_seconds
+                stage_metrics.runs += other_stage_metrics.runs
+        for rejected, other_rejected in [(self.rejected_customers, other.rejected_customers),
+                                         (self.rejected_orders, other.rejected_orders)]:
+            for reason, count in other_rejected.items():
+                rejected[reason] += count
+        return sum(self.rejected_customers.values()) + sum(self.rejected_orders.values())
+
+    def enable_profiling(self) -> cProfile.Profile:
+        """Profile all next stages with cProfile, see get_profile_summary. :returns the profiler"""
+
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+
+            @contextmanager
+            def profile_stage(stage):
+                self.profiler.enable()
+                try:
+                    yield
+                finally:
+                    self.profiler.disable()
+
+            self.stage_hook = profile_stage
+        return self.profiler
+
+    def get_profile_summary(self, sort_by: str = 'cumulative', limit: int = 20) -> str:
+        """:returns the top functions of the profiled stages, empty if profiling is not enabled"""
+
+        if self.profiler is None:
+            return ''
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats(sort_by).print_stats(limit)
+        return output.getvalue()
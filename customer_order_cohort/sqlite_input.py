@@ -0,0 +1,151 @@
+"""Read customers and orders from a SQLite database instead of csv files, with the python sqlite3 module.
+The date range of the analysis and the join of orders to their customer are queried in SQL, on indexed columns:
+only the rows that can be in the analysis are fetched, by batches, and given to the same readers as csv entries.
+
+Tables have the columns of the csv files, dates as 'YYYY-mm-dd HH:MM:SS' GMT text, see import_csv_files:
+    customers (id, created)
+    orders (id, order_number, user_id, created)
+Date ranges are compared as text: dates must be zero padded in this fixed layout, like '2015-07-01 10:00:00'.
+The csv readers also accept dates like '2015-7-1 10:00:00': import_csv_files stores them in the fixed layout.
+"""
+
+import csv
+import datetime as dtm
+import sqlite3
+from customer_order_cohort import csv_input as ci
+
+# rows fetched at once from a query
+BATCH_SIZE = 10000
+
+# layout of the dates in the tables, compared as text, same as CustomerTimeSpanCohorts.DATE_FORMAT
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# same columns and order as the csv files, IDs and order number as text like csv values, see track_order.
+# Customers in insertion order, the first of duplicate customer IDs is kept, as in the csv files.
+# Orders of customers with a creation date in range, once whatever the number of rows of their customer ID
+CUSTOMERS_QUERY = 'SELECT CAST(id AS TEXT), created FROM customers WHERE created >= ? AND created <= ? ORDER BY rowid'
+ORDERS_QUERY = 'SELECT CAST(id AS TEXT), CAST(order_number AS TEXT), CAST(user_id AS TEXT), created FROM orders' \
+               ' WHERE created >= ? AND created <= ?' \
+               ' AND user_id IN (SELECT id FROM customers WHERE created >= ? AND created <= ?)'
+
+# covering indexes of CUSTOMERS_QUERY and ORDERS_QUERY, the rows in range are read from the indexes only
+INDEXES = ('CREATE INDEX IF NOT EXISTS customers_created ON customers (created, id)',
+           'CREATE INDEX IF NOT EXISTS orders_created ON orders (created, user_id, order_number, id)')
+
+
+def format_seconds(seconds: int) -> str:
+    """:returns 'YYYY-mm-dd HH:MM:SS' date of integer seconds since 0001-01-01 00:00:00, see to_seconds"""
+
+    day_ordinal, seconds_in_day = divmod(seconds, 86400)
+    return (dtm.datetime.fromordinal(day_ordinal) + dtm.timedelta(seconds=seconds_in_day)).strftime(DATE_FORMAT)
+
+
+def is_fixed_layout_date(date_representation: str) -> bool:
+    """:returns True for a date in the layout of DATE_FORMAT, zero padded with ASCII digits, valid or not"""
+
+    if len(date_representation) != 19 or date_representation[4] + date_representation[7] + date_representation[10] + \
+            date_representation[13] + date_representation[16] != '-- ::':
+        return False
+    digits = date_representation[0:4] + date_representation[5:7] + date_representation[8:10] + \
+        date_representation[11:13] + date_representation[14:16] + date_representation[17:19]
+    # same as CustomerTimeSpanCohorts.is_ascii_digits
+    return digits.isdigit() and max(digits) <= '9'
+
+
+def normalize_date(date_representation: str) -> str:
+    """
+    :returns a date in the fixed layout of the tables, like '2015-07-01 10:00:00' for '2015-7-1 10:00:00'.
+    Dates already in this layout, see is_fixed_layout_date, and invalid dates are returned as is,
+    the readers reject invalid dates
+    """
+
+    if is_fixed_layout_date(date_representation):
+        return date_representation
+    try:
+        return dtm.datetime.strptime(date_representation, DATE_FORMAT).strftime(DATE_FORMAT)
+    except ValueError:
+        return date_representation
+
+
+def open_database(path_database) -> sqlite3.Connection:
+    """
+    Will raise sqlite3.Error if path_database is not a SQLite database
+    :param path_database: path to a SQLite database file, or an open sqlite3.Connection, returned as is
+    :returns connection to the database
+    """
+
+    if isinstance(path_database, sqlite3.Connection):
+        return path_database
+    if path_database is None or not isinstance(path_database, str):
+        raise TypeError(f'path_database must be a string or a sqlite3.Connection: {path_database}')
+    return sqlite3.connect(path_database)
+
+
+def iterate_rows(cursor: sqlite3.Cursor, batch_size: int = BATCH_SIZE) -> iter:
+    """:returns iterator on the rows of an executed query, fetched by batches of batch_size"""
+
+    rows = cursor.fetchmany(batch_size)
+    while rows:
+        yield from rows
+        rows = cursor.fetchmany(batch_size)
+
+
+def query_customers(connection: sqlite3.Connection, utc_seconds_range: (int, int),
+                    batch_size: int = BATCH_SIZE) -> iter:
+    """
+    :param connection: database with a customers table
+    :param utc_seconds_range: oldest and most recent GMT seconds of the dates to fetch, included,
+    see CustomerTimeSpanCohorts.get_utc_seconds_range
+    :returns iterator on (id, created) customer rows with a creation date in range
+    """
+
+    return iterate_rows(connection.execute(CUSTOMERS_QUERY, [format_seconds(seconds) for seconds in utc_seconds_range]),
+                        batch_size)
+
+
+def query_orders(connection: sqlite3.Connection, utc_seconds_range: (int, int), batch_size: int = BATCH_SIZE) -> iter:
+    """
+    :param connection: database with customers and orders tables
+    :param utc_seconds_range: oldest and most recent GMT seconds of the dates to fetch, included, see query_customers
+    :returns iterator on (id, order_number, user_id, created) order rows with an order date in range,
+    of customers with a creation date in range
+    """
+
+    date_range = [format_seconds(seconds) for seconds in utc_seconds_range]
+    return iterate_rows(connection.execute(ORDERS_QUERY, date_range + date_range), batch_size)
+
+
+def import_csv_files(path_database, path_customers_csv_file: str = './data/customers.csv',
+                     path_orders_csv_file: str = './data/orders.csv') -> (int, int):
+    """
+    Create the customers and orders tables and their indexes, with the entries of csv files, as text values,
+    in the same order. Dates are stored in the fixed layout of the range queries, see normalize_date
+    Will raise IOError if a csv file is not valid, sqlite3.Error if the tables exist
+    :param path_database: path to a SQLite database file, created if needed, or an open sqlite3.Connection
+    :param path_customers_csv_file: path to the customers csv file, see csv_input.open_csv_input
+    :param path_orders_csv_file: path to the orders csv file, see csv_input.open_csv_input
+    :returns numbers of customers and orders imported
+    """
+
+    connection = open_database(path_database)
+    try:
+        with connection:
+            connection.execute('CREATE TABLE customers (id TEXT, created TEXT)')
+            connection.execute('CREATE TABLE orders (id TEXT, order_number TEXT, user_id TEXT, created TEXT)')
+            counts = []
+            for table, path_csv_file, columns in (('customers', path_customers_csv_file, 2),
+                                                  ('orders', path_orders_csv_file, 4)):
+                with ci.open_csv_input(path_csv_file) as csv_file:
+                    entry_reader = csv.reader(csv_file)
+                    next(entry_reader)  # skip header
+                    cursor = connection.executemany(
+                        f'INSERT INTO {table} VALUES ({", ".join("?" * columns)})',
+                        (entry[:columns - 1] + [normalize_date(entry[columns - 1])]
+                         for entry in entry_reader if len(entry) >= columns))
+                    counts.append(cursor.rowcount)
+            for index in INDEXES:
+                connection.execute(index)
+    finally:
+        if connection is not path_database:
+            connection.close()
+    return tuple(counts)
@@ -1,9 +1,285 @@
 from customer_order_cohort import customer_time_span_cohorts as ctsc, order_time_span_aggregation as otsa
+from customer_order_cohort import cohort_snapshot, cohort_sweep, partitioned_cohort_analysis as pca
+from customer_order_cohort import cohort_query_service as cqs, cohort_writers, csv_input, daily_cohort_cube as dcc
+import argparse
 import datetime
+import os
+
+CUSTOMERS_CSV_FILE = './data/customers.csv'
+ORDERS_CSV_FILE = './data/orders.csv'
+OUTPUT_CSV_FILE = './ordercounts.csv'
+# output file for each format of cohort_writers.OUTPUT_FORMATS
+OUTPUT_FILES = {'human': OUTPUT_CSV_FILE, 'csv': './ordercounts-counts.csv', 'jsonl': './ordercounts.jsonl',
+                'binary': './ordercounts.bin'}
+RECENT_DATE = datetime.datetime(2015, 7, 7, 23, 00, 00)
+# options without effect in each input mode, rejected with it rather than silently ignored
+IGNORED_OPTIONS = {'snapshot': ('columnar_cache', 'block_index', 'compact_customers', 'profile'),
+                   'memory_budget': ('columnar_cache', 'block_index', 'compact_customers', 'profile'),
+                   'sweep': ('recent_date', 'columnar_cache', 'block_index', 'compact_customers'),
+                   'daily_cube': ('sketch_precision', 'columnar_cache', 'compact_customers', 'profile'),
+                   'database': ('columnar_cache', 'block_index', 'compact_customers', 'profile'),
+                   'serve': ('metrics', 'profile')}
+
+
+def parse_time_zone(time_zone_name: str) -> datetime.tzinfo:
+    """Argument type of --time-zone: IANA time zone name, from zoneinfo, python 3.9 and later"""
+
+    try:
+        import zoneinfo
+    except ImportError as e:
+        raise argparse.ArgumentTypeError('time zone names need python 3.9 or later') from e
+    try:
+        return zoneinfo.ZoneInfo(time_zone_name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError) as e:
+        raise argparse.ArgumentTypeError(f'unknown time zone: {time_zone_name}') from e
+
+
+def parse_recent_date(recent_date_representation: str) -> datetime.datetime:
+    """Argument type of --recent-date: 'YYYY-mm-dd', or today"""
+
+    if recent_date_representation == 'today':
+        return datetime.datetime.now()
+    try:
+        return datetime.datetime.strptime(recent_date_representation, '%Y-%m-%d')
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f'recent date must be YYYY-mm-dd or today: {recent_date_representation}') from e
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Order counts by customer cohorts, from ./data to ./ordercounts.csv')
+    parser.add_argument('--customers', default=CUSTOMERS_CSV_FILE, metavar='PATH',
+                        help='customers csv file, may be gzip, bzip2 or xz compressed, - for the standard input')
+    parser.add_argument('--orders', default=ORDERS_CSV_FILE, metavar='PATH',
+                        help='orders csv file, may be gzip, bzip2 or xz compressed, - for the standard input')
+    input_mode = parser.add_mutually_exclusive_group()
+    input_mode.add_argument('--snapshot', help='snapshot file of the analysis: when it exists, only entries appended '
+                                               'to the csv files since the snapshot are read. Updated on each run')
+    input_mode.add_argument('--memory-budget', type=int, metavar='MIB',
+                            help='partition the csv files on disk so that customers of a partition fit in MIB')
+    input_mode.add_argument('--sweep', nargs='+', type=cohort_sweep.parse_configuration,
+                            metavar='RECENT_DATE:DAYS:INTERVALS',
+                            help='read the csv files once for several analysis, like 2015-07-07:7:8 2015-07-07:14:4. '
+                                 'Writes one ./ordercounts-RECENT_DATE-DAYSxINTERVALS.csv per analysis, with the '
+                                 'time and UTC offset of RECENT_DATE, like ./ordercounts-2015-07-07T000000-0700-7x8.csv')
+    input_mode.add_argument('--daily-cube', metavar='PATH',
+                            help='cube file of customers and orders per day: when it exists, its window is moved '
+                                 'forward to the recent date and only the new days are read. Updated on each run')
+    input_mode.add_argument('--database', metavar='PATH',
+                            help='read customers and orders from a SQLite database instead of the csv files, '
+                                 'only the rows in the date range, see sqlite_input')
+    input_mode.add_argument('--serve', metavar='ADDRESS',
+                            help='keep the analysis in memory and answer queries over HTTP on HOST:PORT '
+                                 'or on a Unix socket path, reloaded when the csv files change')
+    parser.add_argument('--reload-interval', type=float, default=5.0, metavar='SECONDS',
+                        help='with --serve, delay between checks of the csv files for changes')
+    parser.add_argument('--recent-date', type=parse_recent_date, metavar='YYYY-mm-dd',
+                        help='most recent day of the cohorts, or today. With --daily-cube, the cube is moved forward '
+                             'to it, and the current day is read again until it ends. Default to 2015-07-07, '
+                             'the last day of ./data. With an existing --snapshot, must be its recent date')
+    parser.add_argument('--time-zone', type=parse_time_zone, metavar='NAME',
+                        help='time zone of the cohorts, like America/Los_Angeles, with its daylight saving time '
+                             'changes. Default to the current offset of the local time zone')
+    parser.add_argument('--sketch-precision', type=int, metavar='P',
+                        help='approximate distinct customers per order cell with HyperLogLog sketches of 2**P '
+                             'registers, P from 4 to 16: fixed memory per cell, relative standard error 1.04/sqrt(2**P)')
+    parser.add_argument('--columnar-cache', action='store_true',
+                        help='keep parsed csv columns in sidecar files, for faster reruns on the same csv files')
+    parser.add_argument('--block-index', action='store_true',
+                        help='keep the date range of each block of the csv files in sidecar files, '
+                             'and read only the blocks overlapping the cohorts date range')
+    parser.add_argument('--compact-customers', action='store_true',
+                        help='keep the customers in a few bytes each instead of about 120, for windows with too many '
+                             'customers for memory. Orders are read slower')
+    parser.add_argument('--output-format', choices=sorted(cohort_writers.OUTPUT_FORMATS), default='human',
+                        help='human: ./ordercounts.csv with percentages, csv: integer counts in '
+                             './ordercounts-counts.csv, jsonl: ./ordercounts.jsonl, binary: ./ordercounts.bin')
+    parser.add_argument('--metrics', action='store_true',
+                        help='print time and rows per stage, and rejected entries per reason')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile the stages with cProfile and print the top functions, implies --metrics')
+    return parser
+
+
+def parse_arguments(command_line: [str] = None) -> argparse.Namespace:
+    """Parse the command line, exits with the usage on options conflicting with the input mode"""
+
+    parser = build_argument_parser()
+    arguments = parser.parse_args(command_line)
+    for mode, options in IGNORED_OPTIONS.items():
+        if getattr(arguments, mode) is None:
+            continue
+        for option in options:
+            if getattr(arguments, option) not in (None, False):
+                parser.error(f'--{mode.replace("_", "-")} does not use --{option.replace("_", "-")}')
+    if (arguments.snapshot is not None or arguments.memory_budget is not None) and not (
+            csv_input.is_plain_csv_file(arguments.customers) and csv_input.is_plain_csv_file(arguments.orders)):
+        parser.error('--snapshot and --memory-budget need uncompressed csv files')
+    return arguments
+
+
+def check_snapshot_analysis(orders_by_time_slot: otsa.OrderTimeSpanAggregation, time_zone: datetime.tzinfo = None,
+                            sketch_precision: int = None,
+                            recent_date: datetime.datetime = None) -> otsa.OrderTimeSpanAggregation:
+    """
+    Will raise ValueError if an option differs from the analysis of a snapshot, resumed with its own options
+    :param time_zone: time zone of the option, None if not given, same as the snapshot if it converts dates the same
+    :param sketch_precision: sketch precision of the option, None if not given
+    :param recent_date: recent date of the option, None if not given, same as the snapshot on the same day
+    :returns orders_by_time_slot"""
+
+    customer_cohorts = orders_by_time_slot.customer_cohorts
+    last_day = datetime.date.fromordinal(customer_cohorts.recent_date.toordinal() - 1)
+    if recent_date is not None and recent_date.date() != last_day:
+        raise ValueError(f'recent date of the snapshot is {last_day}: {recent_date.date()}')
+    if time_zone is not None:
+        expected_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(last_day.year, last_day.month, last_day.day), time_zone=time_zone,
+            days_interval_length=customer_cohorts.days_interval_length,
+            number_of_intervals=customer_cohorts.number_of_intervals)
+        if (expected_cohorts.delta_time_zone, expected_cohorts.utc_transitions, expected_cohorts.utc_offsets) != \
+                (customer_cohorts.delta_time_zone, customer_cohorts.utc_transitions, customer_cohorts.utc_offsets):
+            raise ValueError(f'time zone of the snapshot has other UTC offsets: {time_zone}')
+    if sketch_precision is not None and sketch_precision != orders_by_time_slot.sketch_precision:
+        raise ValueError(f'sketch precision of the snapshot is {orders_by_time_slot.sketch_precision}: '
+                         f'{sketch_precision}')
+    return orders_by_time_slot
+
+
+def read_snapshot_analysis(path_snapshot_file: str, path_customers_csv_file: str = CUSTOMERS_CSV_FILE,
+                           path_orders_csv_file: str = ORDERS_CSV_FILE,
+                           time_zone: datetime.tzinfo = None, sketch_precision: int = None,
+                           recent_date: datetime.datetime = None) -> otsa.OrderTimeSpanAggregation:
+    """
+    Resume the analysis of a snapshot file, or start a new one, and save it.
+    Will raise ValueError if an option differs from a snapshot, see check_snapshot_analysis
+    :param recent_date: recent date of a new snapshot, default RECENT_DATE
+    """
+
+    if os.path.exists(path_snapshot_file):
+        orders_by_time_slot, csv_file_offsets = cohort_snapshot.load_snapshot(path_snapshot_file)
+        check_snapshot_analysis(orders_by_time_slot, time_zone, sketch_precision, recent_date)
+    else:
+        orders_by_time_slot, csv_file_offsets = otsa.OrderTimeSpanAggregation(
+            customer_cohorts=ctsc.CustomerTimeSpanCohorts(recent_date=recent_date or RECENT_DATE,
+                                                          time_zone=time_zone),
+            sketch_precision=sketch_precision), {}
+    csv_file_offsets[path_customers_csv_file] = \
+        orders_by_time_slot.customer_cohorts.read_customers_csv_file_from_offset(
+            path_customers_csv_file, csv_file_offsets.get(path_customers_csv_file))
+    csv_file_offsets[path_orders_csv_file] = orders_by_time_slot.read_orders_csv_file_from_offset(
+        path_orders_csv_file, csv_file_offsets.get(path_orders_csv_file))
+    cohort_snapshot.save_snapshot(path_snapshot_file, orders_by_time_slot, csv_file_offsets)
+    return orders_by_time_slot
+
+
+def read_partitioned_analysis(memory_budget_mib: int, path_customers_csv_file: str = CUSTOMERS_CSV_FILE,
+                              path_orders_csv_file: str = ORDERS_CSV_FILE,
+                              time_zone: datetime.tzinfo = None, sketch_precision: int = None,
+                              recent_date: datetime.datetime = RECENT_DATE) -> otsa.OrderTimeSpanAggregation:
+    partitioned_analysis = pca.PartitionedCohortAnalysis(
+        recent_date=recent_date, memory_budget_bytes=memory_budget_mib * 2 ** 20, time_zone=time_zone,
+        sketch_precision=sketch_precision)
+    partitioned_analysis.read_csv_files(path_customers_csv_file, path_orders_csv_file)
+    print(partitioned_analysis)
+    return partitioned_analysis.orders_by_time_slot
+
+
+def read_daily_cube_analysis(path_cube_file: str, path_customers_csv_file: str = CUSTOMERS_CSV_FILE,
+                             path_orders_csv_file: str = ORDERS_CSV_FILE, time_zone: datetime.tzinfo = None,
+                             block_index: bool = False,
+                             recent_date: datetime.datetime = RECENT_DATE) -> otsa.OrderTimeSpanAggregation:
+    if os.path.exists(path_cube_file):
+        cube = dcc.load_cube(path_cube_file, time_zone)
+        cube.advance(recent_date)
+    else:
+        cube = dcc.DailyCohortCube(recent_date=recent_date, window_days=7 * 8, time_zone=time_zone)
+    cube.read_csv_files(path_customers_csv_file, path_orders_csv_file, block_index)
+    dcc.save_cube(path_cube_file, cube)
+    return cube.roll_up(days_interval_length=7, number_of_intervals=8)
+
+
+def read_database_analysis(path_database: str, time_zone: datetime.tzinfo = None, sketch_precision: int = None,
+                           recent_date: datetime.datetime = RECENT_DATE) -> otsa.OrderTimeSpanAggregation:
+    customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date, time_zone=time_zone)
+    customers_cohorts.read_customers_database(path_database)
+    orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts,
+                                                        sketch_precision=sketch_precision)
+    orders_by_time_slot.read_orders_database(path_database)
+    return orders_by_time_slot
+
+
+def read_analysis(columnar_cache: bool, profile: bool = False, path_customers_csv_file: str = CUSTOMERS_CSV_FILE,
+                  path_orders_csv_file: str = ORDERS_CSV_FILE,
+                  time_zone: datetime.tzinfo = None, sketch_precision: int = None,
+                  block_index: bool = False, compact_customers: bool = False,
+                  recent_date: datetime.datetime = RECENT_DATE) -> otsa.OrderTimeSpanAggregation:
+    customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date, time_zone=time_zone)
+    if profile:
+        customers_cohorts.metrics.enable_profiling()
+    customers_cohorts.read_customers_csv_file(path_customers_csv_file, columnar_cache=columnar_cache,
+                                              block_index=block_index)
+    if compact_customers:
+        customers_cohorts.compact_customer_index()
+    orders_by_time_slot: otsa = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts,
+                                                              sketch_precision=sketch_precision)
+    orders_by_time_slot.read_orders_csv_file(path_orders_csv_file, columnar_cache=columnar_cache, block_index=block_index)
+    return orders_by_time_slot
+
+
+def write_sweep_analysis(arguments: argparse.Namespace) -> [str]:
+    """:returns paths of the files written for the --sweep configurations, see CohortSweep"""
+
+    sweep = cohort_sweep.CohortSweep(arguments.sweep, arguments.time_zone, arguments.sketch_precision)
+    if arguments.profile:
+        sweep.metrics.enable_profiling()
+    sweep.read_csv_files(arguments.customers, arguments.orders)
+    print(sweep)
+    output_file_paths = sweep.write_orders_count_by_cohorts_files(OUTPUT_FILES[arguments.output_format],
+                                                                  arguments.output_format)
+    if arguments.metrics or arguments.profile:
+        print(sweep.metrics)
+        print(sweep.metrics.get_profile_summary(), end='')
+    return output_file_paths
+
+
+def main(arguments: argparse.Namespace):
+    """:param arguments: from parse_arguments, which rejects the conflicting options"""
+
+    recent_date = arguments.recent_date or RECENT_DATE
+    if arguments.serve is not None:
+        service = cqs.CohortQueryService(
+            lambda: read_analysis(arguments.columnar_cache, False, arguments.customers, arguments.orders,
+                                  arguments.time_zone, arguments.sketch_precision, arguments.block_index,
+                                  compact_customers=arguments.compact_customers, recent_date=recent_date),
+            [arguments.customers, arguments.orders], arguments.reload_interval)
+        cqs.serve_forever(service, arguments.serve)
+        return
+    if arguments.sweep is not None:
+        write_sweep_analysis(arguments)
+        return
+    if arguments.memory_budget is not None:
+        orders_by_time_slot = read_partitioned_analysis(arguments.memory_budget, arguments.customers, arguments.orders,
+                                                        arguments.time_zone, arguments.sketch_precision, recent_date)
+    elif arguments.database is not None:
+        orders_by_time_slot = read_database_analysis(arguments.database, arguments.time_zone,
+                                                     arguments.sketch_precision, recent_date)
+    elif arguments.daily_cube is not None:
+        orders_by_time_slot = read_daily_cube_analysis(arguments.daily_cube, arguments.customers, arguments.orders,
+                                                       arguments.time_zone, arguments.block_index, recent_date)
+    elif arguments.snapshot is not None:
+        orders_by_time_slot = read_snapshot_analysis(arguments.snapshot, arguments.customers, arguments.orders,
+                                                     arguments.time_zone, arguments.sketch_precision,
+                                                     arguments.recent_date)
+    else:
+        orders_by_time_slot = read_analysis(arguments.columnar_cache, arguments.profile, arguments.customers,
+                                            arguments.orders, arguments.time_zone, arguments.sketch_precision,
+                                            arguments.block_index, arguments.compact_customers, recent_date)
+    orders_by_time_slot.write_orders_count_by_cohorts_file(OUTPUT_FILES[arguments.output_format],
+                                                           arguments.output_format)
+    if arguments.metrics or arguments.profile:
+        print(orders_by_time_slot.metrics)
+        print(orders_by_time_slot.metrics.get_profile_summary(), end='')
+
 
 if __name__ == '__main__':
-    customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=datetime.datetime(2015, 7, 7, 23, 00, 00))
-    customers_cohorts.read_customers_csv_file()
-    orders_by_time_slot: otsa = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
-    orders_by_time_slot.read_orders_csv_file()
-    orders_by_time_slot.write_orders_count_by_cohorts_csv_file('./ordercounts.csv')
+    main(parse_arguments())
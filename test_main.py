@@ -1,13 +1,20 @@
 from tests import test_customer_time_span_cohorts, test_order_time_span_aggregation
+from tests import test_cohort_snapshot, test_partitioned_cohort_analysis, test_columnar_cache
+from tests import test_cohort_sweep, test_bench_stages, test_pipeline_metrics, test_cohort_query_service
+from tests import test_cohort_writers, test_csv_input, test_customer_registry, test_block_index
+from tests import test_daily_cohort_cube, test_sqlite_input, test_concurrent_ingestion
 
 
 def test_customer_read():
     test_cohort = test_customer_time_span_cohorts.TestCustomerTimeSpanCohorts()
     test_cohort.test_date_utc_conversion()
     test_cohort.test_date_local_conversion()
+    test_cohort.test_fast_date_parsing()
+    test_cohort.test_daylight_saving_time_zone()
     test_cohort.test_cohort_id()
     test_cohort.test_utc_full_customer_file()
     test_cohort.test_pst_full_customer_file()
+    test_cohort.test_batched_full_customer_file()
     test_cohort.test_silly_cohorts()
 
 
@@ -15,9 +22,101 @@ def test_order_read():
     test_summary = test_order_time_span_aggregation.TestOrderTimeSpanAggregation()
     test_summary.test_pst_read_all_order_entries()
     test_summary.test_utc_full_customer_and_order_file()
+    test_summary.test_parallel_full_customer_and_order_file()
+    test_summary.test_approximate_counts()
     test_summary.test_silly_analysis()
 
 
+def test_snapshot():
+    test_snapshot_read = test_cohort_snapshot.TestCohortSnapshot()
+    test_snapshot_read.test_incremental_customer_and_order_files()
+
+
+def test_partitioned_read():
+    test_partitioned = test_partitioned_cohort_analysis.TestPartitionedCohortAnalysis()
+    test_partitioned.test_partitioned_customer_and_order_file()
+
+
+def test_columnar_cache_read():
+    test_cache = test_columnar_cache.TestColumnarCache()
+    test_cache.test_cached_customer_and_order_files()
+
+
+def test_sweep_read():
+    test_sweep = test_cohort_sweep.TestCohortSweep()
+    test_sweep.test_sweep_customer_and_order_file()
+
+
+def test_benchmark_suite():
+    test_bench = test_bench_stages.TestBenchStages()
+    test_bench.test_generated_data()
+
+
+def test_metrics():
+    test_pipeline = test_pipeline_metrics.TestPipelineMetrics()
+    test_pipeline.test_rejection_reasons()
+    test_pipeline.test_same_metrics_for_all_readers()
+    test_pipeline.test_profiling()
+
+
+def test_query_service():
+    test_service = test_cohort_query_service.TestCohortQueryService()
+    test_service.test_queries_and_reload()
+
+
+def test_writers():
+    test_writer = test_cohort_writers.TestCohortWriters()
+    test_writer.test_all_formats()
+
+
+def test_compressed_input():
+    test_input = test_csv_input.TestCsvInput()
+    test_input.test_compressed_and_piped_input()
+
+
+def test_registry():
+    test_customer = test_customer_registry.TestCustomerRegistry()
+    test_customer.test_same_as_dict()
+
+
+def test_block_index_read():
+    test_index = test_block_index.TestBlockIndex()
+    test_index.test_skip_blocks_out_of_range()
+
+
+def test_daily_cube():
+    test_cube = test_daily_cohort_cube.TestDailyCohortCube()
+    test_cube.test_advance_same_as_full_read()
+    test_cube.test_duplicate_customer_ids_same_as_full_read()
+    test_cube.test_orders_before_customer_same_as_full_read()
+
+
+def test_sqlite_read():
+    test_sqlite = test_sqlite_input.TestSqliteInput()
+    test_sqlite.test_same_as_csv_input()
+    test_sqlite.test_normalize_date()
+
+
+def test_concurrent_read():
+    test_ingestion = test_concurrent_ingestion.TestConcurrentIngestion()
+    test_ingestion.test_same_as_sequential_read()
+    test_ingestion.test_parse_and_track_order_columns()
+
+
 if __name__ == '__main__':
     test_customer_read()
     test_order_read()
+    test_snapshot()
+    test_partitioned_read()
+    test_columnar_cache_read()
+    test_sweep_read()
+    test_benchmark_suite()
+    test_metrics()
+    test_query_service()
+    test_writers()
+    test_compressed_input()
+    test_registry()
+    test_block_index_read()
+    test_daily_cube()
+    test_sqlite_read()
+    test_concurrent_read()
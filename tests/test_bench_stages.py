@@ -0,0 +1,34 @@
+import os
+import tempfile
+from benchmarks import bench_stages, generate_cohort_data as gcd
+
+
+class TestBenchStages:
+    def test_generated_data(self):
+        generator = gcd.CohortDataGenerator(customers=2000, shuffle_block=500, seed=7)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ('c1.csv', 'o1.csv', 'c2.csv', 'o2.csv')]
+            customers, orders = generator.write_csv_files(paths[0], paths[1])
+            assert generator.write_csv_files(paths[2], paths[3]) == (customers, orders)
+            for first_path, second_path in [(paths[0], paths[2]), (paths[1], paths[3])]:
+                with open(first_path) as first_file, open(second_path) as second_file:
+                    assert first_file.read() == second_file.read()
+            assert bench_stages.count_lines(paths[0]) == customers + 1
+            assert bench_stages.count_lines(paths[1]) == orders + 1
+            stage_paths = {'customer_read': paths[0], 'order_read': paths[1],
+                           'csv_write': os.path.join(directory, 'ordercounts.csv')}
+            host_speed = bench_stages.measure_host_speed(rows=1000, repeat=1)
+            assert host_speed > 0
+            results = {engine: bench_stages.run_stages(engine, stage_paths, generator.window_days, False, host_speed)
+                       for engine in ('rows', 'batched')}
+            assert [measures['rows'] for measures in results['rows'].values()] == [customers, orders, 16]
+            with open(stage_paths['csv_write']) as output_file:
+                assert output_file.readline().startswith('Cohort,Customers,0-6 days,')
+        assert bench_stages.check_against_baseline(results, results, 0.3, 0) == []
+        slower = {'rows': {'order_read': dict(results['rows']['order_read'], seconds=1.0, relative_speed=0.0)}}
+        assert len(bench_stages.check_against_baseline(slower, results, 0.3, 0)) == 1
+        assert bench_stages.check_against_baseline(slower, results, 0.3, 1000) == []
+        # same relative speeds measured on a host twice slower
+        slower_host = {'rows': {'order_read': dict(results['rows']['order_read'],
+                                                   rows_per_second=results['rows']['order_read']['rows_per_second'] / 2)}}
+        assert bench_stages.check_against_baseline(slower_host, results, 0.3, 0) == []
@@ -0,0 +1,71 @@
+import datetime
+import os
+import shutil
+import tempfile
+from customer_order_cohort import block_index as bi
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+
+
+class TestBlockIndex:
+    @staticmethod
+    def read_counts(path_customers: str, path_orders: str, block_index: bool, workers: int = None) -> (dict, dict):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone), number_of_intervals=4)
+        customers_cohorts.read_customers_csv_file(path_customers, block_index=block_index)
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        orders_by_time_slot.read_orders_csv_file(path_orders, workers=workers, block_index=block_index)
+        return {cohort_key: orders_by_time_slot.get_counts_for_cohort(cohort_key)
+                for cohort_key in orders_by_time_slot.customer_group_to_order_accumulated}, orders_by_time_slot.metrics
+
+    @staticmethod
+    def copy_sorted_by_date(path_csv_file: str, date_index: int, directory: str) -> str:
+        """:returns path of a copy of a csv file with its entries sorted by date, like an append only log"""
+
+        with open(path_csv_file) as csv_file:
+            header, *lines = csv_file.readlines()
+        path_sorted_file = os.path.join(directory, os.path.basename(path_csv_file))
+        with open(path_sorted_file, mode='w') as sorted_file:
+            sorted_file.write(header)
+            sorted_file.writelines(sorted(lines, key=lambda line: line.rstrip('\n').split(',')[date_index]))
+        return path_sorted_file
+
+    def test_skip_blocks_out_of_range(self):
+        block_bytes = bi.BLOCK_BYTES
+        bi.BLOCK_BYTES = 1 << 12
+        try:
+            expected, expected_metrics = self.read_counts('./data/customers.csv', './data/orders.csv', False)
+            with tempfile.TemporaryDirectory() as directory:
+                path_customers = self.copy_sorted_by_date('./data/customers.csv', 1, directory)
+                path_orders = self.copy_sorted_by_date('./data/orders.csv', 3, directory)
+                # first read writes the sidecar files, second read maps them
+                for _ in range(2):
+                    counts, metrics = self.read_counts(path_customers, path_orders, True)
+                    assert counts == expected
+                    assert os.path.exists(path_customers + '.blocks') and os.path.exists(path_orders + '.blocks')
+                    assert metrics.stages['order_read'].rows == expected_metrics.stages['order_read'].rows
+                    assert metrics.rejected_customers == expected_metrics.rejected_customers
+                    assert sum(metrics.rejected_orders.values()) == sum(expected_metrics.rejected_orders.values())
+                assert self.read_counts(path_customers, path_orders, True, workers=2)[0] == expected
+                parse_date = ctsc.CustomerTimeSpanCohorts.parse_date_to_cacheable_seconds
+                index = bi.read_block_index(path_orders, (3, parse_date))
+                assert isinstance(index[0], memoryview) and sum(index[2]) == 27575
+                min_seconds, max_seconds = ctsc.CustomerTimeSpanCohorts(
+                    recent_date=datetime.datetime(2015, 7, 7), number_of_intervals=4).get_utc_seconds_range()
+                byte_ranges, skipped_rows, skipped_invalid_rows = bi.select_byte_ranges(index, min_seconds, max_seconds)
+                assert len(byte_ranges) == 1 and skipped_rows > 0 and skipped_invalid_rows == 0
+                assert sum(end - start for start, end in byte_ranges) < os.path.getsize(path_orders) / 4
+                # a changed file is indexed again
+                with open(path_orders, mode='a') as orders_file:
+                    orders_file.write('99999,1,35410,2015-07-06 10:10:10\n1,2,35410,not a date\n')
+                counts, metrics = self.read_counts(path_customers, path_orders, True)
+                assert counts['2015/07/01-2015/07/07'][0][0] == expected['2015/07/01-2015/07/07'][0][0] + 1
+                assert sum(bi.read_block_index(path_orders, (3, parse_date))[2]) == 27577
+                assert metrics.rejected_orders['invalid_date'] == 1
+                # unsorted files have dates of the whole range in each block: same counts, nothing skipped
+                path_customers = shutil.copy('./data/customers.csv', path_customers)
+                path_orders = shutil.copy('./data/orders.csv', path_orders)
+                assert self.read_counts(path_customers, path_orders, True)[0] == expected
+        finally:
+            bi.BLOCK_BYTES = block_bytes
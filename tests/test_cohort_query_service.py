@@ -0,0 +1,99 @@
+import pytest
+import asyncio
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from benchmarks import load_test_query_service
+from customer_order_cohort import cohort_query_service as cqs
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+
+
+class TestCohortQueryService:
+    def test_queries_and_reload(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path_customers_csv_file = shutil.copy('./data/customers.csv', directory)
+            path_orders_csv_file = shutil.copy('./data/orders.csv', directory)
+
+            def load_analysis():
+                customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+                    recent_date=datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone))
+                customers_cohorts.read_customers_csv_file(path_customers_csv_file)
+                orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+                orders_by_time_slot.read_orders_csv_file(path_orders_csv_file)
+                return orders_by_time_slot
+
+            expected_csv_file_path = os.path.join(directory, 'expected.csv')
+            load_analysis().write_orders_count_by_cohorts_csv_file(expected_csv_file_path)
+            with open(expected_csv_file_path, mode='rb') as expected_file:
+                expected_table = expected_file.read()
+
+            async def query_and_reload(address):
+                service = cqs.CohortQueryService(load_analysis, [path_customers_csv_file, path_orders_csv_file],
+                                                 reload_interval_seconds=0.05)
+                assert service.answer('GET', '/table')[0] == 503
+                await service.start(address)
+                try:
+                    reader, writer = await cqs.open_service_connection(service.get_address())
+                    assert await cqs.query_service(reader, writer, '/table') == (200, expected_table)
+                    status, body = await cqs.query_service(reader, writer, '/cohorts')
+                    cohorts = json.loads(body.decode())
+                    assert [cohort['cohort'] for cohort in cohorts] == \
+                        [line.split(',')[0] for line in expected_table.decode().splitlines()[1::2]]
+                    status, body = await cqs.query_service(reader, writer, '/cohort?id=2015%2F07%2F01-2015%2F07%2F07')
+                    assert status == 200
+                    assert json.loads(body.decode()) == {'cohort': '2015/07/01-2015/07/07', 'customers': 1044,
+                                                         'orders': [146], 'first_orders': [146]}
+                    status, body = await cqs.query_service(reader, writer, '/period/1')
+                    assert [period['orders'] for period in json.loads(body.decode())] == \
+                        [cohort['orders'][1] for cohort in cohorts[1:]]
+                    assert (await cqs.query_service(reader, writer, '/period/8'))[0] == 404
+                    assert (await cqs.query_service(reader, writer, '/cohort?id=2015/07/02-2015/07/08'))[0] == 404
+                    assert (await cqs.query_service(reader, writer, '/table', 'DELETE'))[0] == 405
+                    assert (await cqs.query_service(reader, writer, '/reload'))[0] == 405
+                    status, body = await cqs.query_service(reader, writer, '/status')
+                    assert json.loads(body.decode())['generation'] == 1
+                    for request, expected_status in [(b'GET /' + b'x' * (1 << 17) + b' HTTP/1.1\r\n\r\n', 400),
+                                                     (b'GET /table HTTP/1.1\r\nX: ' + b'x' * (1 << 17) + b'\r\n\r\n', 431)]:
+                        long_reader, long_writer = await cqs.open_service_connection(service.get_address())
+                        long_writer.write(request)
+                        assert int((await long_reader.readline()).split()[1]) == expected_status
+                        long_writer.close()
+                    result = await load_test_query_service.run_load_test(service.get_address(), 8, 20, 50)
+                    assert result['queries'] == 160
+                    assert result['errors'] == 0
+                    await service.request_reload()
+                    generation = service.cube.generation
+                    with open(path_customers_csv_file, mode='a') as customers_file:
+                        customers_file.write('9999999,2015-07-07 10:00:00\n')
+                    with open(path_orders_csv_file, mode='a') as orders_file:
+                        orders_file.write('9999999,1,9999999,2015-07-07 11:00:00\n')
+                    for _ in range(200):  # until reloaded with both appended entries
+                        if service.cube.generation > generation and \
+                                service.cube.fingerprints == service.get_fingerprints():
+                            break
+                        await asyncio.sleep(0.05)
+                    status, body = await cqs.query_service(reader, writer, '/cohort?id=2015/07/01-2015/07/07')
+                    assert json.loads(body.decode())['customers'] == 1045
+                    assert json.loads(body.decode())['orders'] == [147]
+                    writer.close()
+                finally:
+                    await service.close()
+
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(query_and_reload('127.0.0.1:0'))
+                shutil.copy('./data/customers.csv', directory)
+                shutil.copy('./data/orders.csv', directory)
+                loop.run_until_complete(query_and_reload(os.path.join(directory, 'cohorts.sock')))
+            finally:
+                loop.close()
+        assert cqs.parse_address('localhost:8765') == ('localhost', 8765, None)
+        assert cqs.parse_address('/tmp/cohorts.sock') == (None, None, '/tmp/cohorts.sock')
+        with pytest.raises(TypeError) as e:
+            cqs.CohortQueryService(None)
+        assert str(e.value).startswith('load_analysis must be callable')
@@ -0,0 +1,64 @@
+import pytest
+import datetime
+import os
+import tempfile
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+from customer_order_cohort import cohort_snapshot
+
+
+class TestCohortSnapshot:
+    def test_incremental_customer_and_order_files(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone))
+        customers_cohorts.read_customers_csv_file()
+        expected = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        expected.read_orders_csv_file()
+        with open('./data/customers.csv', mode='rb') as customers_file:
+            customers = customers_file.read()
+        with open('./data/orders.csv', mode='rb') as orders_file:
+            orders = orders_file.read()
+        with tempfile.TemporaryDirectory() as directory:
+            path_customers = os.path.join(directory, 'customers.csv')
+            path_orders = os.path.join(directory, 'orders.csv')
+            path_snapshot = os.path.join(directory, 'analysis.snapshot')
+            orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=ctsc.CustomerTimeSpanCohorts(
+                recent_date=datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone)))
+            offsets = {}
+            # customers first half, then the other half with orders first half ending on a partial line
+            for customers_end, orders_end in [(len(customers) // 2, 0),
+                                              (len(customers), len(orders) // 2), (len(customers), len(orders))]:
+                with open(path_customers, mode='wb') as customers_file:
+                    customers_file.write(customers[:customers_end])
+                with open(path_orders, mode='wb') as orders_file:
+                    orders_file.write(orders[:orders_end] if orders_end else orders[:orders.index(b'\n') + 1])
+                if offsets:
+                    orders_by_time_slot, offsets = cohort_snapshot.load_snapshot(path_snapshot)
+                offsets['customers'] = orders_by_time_slot.customer_cohorts.read_customers_csv_file_from_offset(
+                    path_customers, offsets.get('customers'))
+                offsets['orders'] = orders_by_time_slot.read_orders_csv_file_from_offset(
+                    path_orders, offsets.get('orders'))
+                assert cohort_snapshot.save_snapshot(path_snapshot, orders_by_time_slot, offsets) > 0
+            assert offsets == {'customers': len(customers), 'orders': len(orders)}
+            assert orders_by_time_slot.customer_cohorts.cohort_cardinality == customers_cohorts.cohort_cardinality
+            assert orders_by_time_slot.customer_cohorts.oldest_date == customers_cohorts.oldest_date
+            assert sorted(orders_by_time_slot.customer_group_to_order_accumulated) ==\
+                   sorted(expected.customer_group_to_order_accumulated)
+            for cohort_key in expected.customer_group_to_order_accumulated:
+                assert orders_by_time_slot.get_customer_ids_for_cohort(cohort_key) ==\
+                       expected.get_customer_ids_for_cohort(cohort_key)
+            with open(path_orders, mode='wb') as orders_file:
+                orders_file.write(orders[:100])
+            with pytest.raises(ValueError) as e:
+                orders_by_time_slot.read_orders_csv_file_from_offset(path_orders, offsets['orders'])
+            assert str(e.value).startswith('csv file is shorter than offset')
+            # last new line searched backward over several blocks, a partial line is left for the next read
+            with open(path_orders, mode='rb') as orders_file:
+                assert ctsc.find_complete_lines_end(orders_file, 0, 100, block_bytes=7) == orders.rindex(b'\n', 0, 100) + 1
+                assert ctsc.find_complete_lines_end(orders_file, 50, 60, block_bytes=3) == 50
+            assert list(ctsc.iterate_decoded_lines(path_orders, 0, orders.index(b'\n') + 1)) == [
+                orders[:orders.index(b'\n') + 1].decode()]
+            with pytest.raises(ValueError) as e:
+                cohort_snapshot.load_snapshot(path_orders)
+            assert str(e.value).startswith('not a cohort analysis snapshot')
@@ -0,0 +1,64 @@
+import pytest
+import datetime
+import os
+import tempfile
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+from customer_order_cohort import cohort_sweep
+
+
+class TestCohortSweep:
+    def test_sweep_customer_and_order_file(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        utc_time_zone = datetime.timezone(datetime.timedelta(), name="GMT")
+        configurations = [(datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone), 7, 8),
+                          (datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone), 14, 4),
+                          (datetime.datetime(2015, 5, 1, 10, 0, 0, tzinfo=utc_time_zone), 1, 30),
+                          (datetime.datetime(2014, 1, 1, 10, 0, 0, tzinfo=utc_time_zone), 7, 2)]
+        sweep = cohort_sweep.CohortSweep(configurations)
+        assert sweep.read_csv_files() == 3
+        with tempfile.TemporaryDirectory() as directory:
+            output_csv_file_paths = sweep.write_orders_count_by_cohorts_csv_files(
+                os.path.join(directory, 'ordercounts.csv'))
+            assert [os.path.basename(path) for path in output_csv_file_paths] == [
+                'ordercounts-2015-07-07T234713-0700-7x8.csv', 'ordercounts-2015-07-07T234713-0700-14x4.csv',
+                'ordercounts-2015-05-01T100000+0000-1x30.csv', 'ordercounts-2014-01-01T100000+0000-7x2.csv']
+            for (recent_date, days_interval_length, number_of_intervals), output_csv_file_path in zip(
+                    configurations, output_csv_file_paths):
+                customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+                    recent_date=recent_date, days_interval_length=days_interval_length,
+                    number_of_intervals=number_of_intervals)
+                customers_cohorts.read_customers_csv_file()
+                orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+                if len(customers_cohorts.cohort_cardinality) > 0:
+                    orders_by_time_slot.read_orders_csv_file()
+                expected_csv_file_path = os.path.join(directory, 'expected.csv')
+                orders_by_time_slot.write_orders_count_by_cohorts_csv_file(expected_csv_file_path)
+                with open(expected_csv_file_path) as expected_file, open(output_csv_file_path) as output_file:
+                    assert output_file.read() == expected_file.read()
+        assert sweep.metrics.stages['customer_read'].rows == 25716
+        assert sweep.metrics.stages['order_read'].rows == 27575
+        assert sweep.metrics.stages['csv_write'].rows > 0
+        assert dict(sweep.metrics.rejected_customers) == {'date_out_of_range': 14411}
+        assert dict(sweep.metrics.rejected_orders) == {'date_out_of_range': 14801, 'unknown_customer_id': 9738}
+        # same day and intervals, in another time zone or at another time: distinct output files
+        other_sweep = cohort_sweep.CohortSweep([configurations[0], (configurations[0][0].astimezone(utc_time_zone), 7, 8),
+                                                (configurations[0][0].replace(hour=10), 7, 8)])
+        assert [other_sweep.get_output_csv_file_path('ordercounts.csv', index) for index in range(3)] == [
+            'ordercounts-2015-07-07T234713-0700-7x8.csv', 'ordercounts-2015-07-08T064713+0000-7x8.csv',
+            'ordercounts-2015-07-07T104713-0700-7x8.csv']
+        assert other_sweep.track_customer('a', '2015-07-01 10:00:00') == 3
+        assert other_sweep.track_customer('a', '2015-07-01 10:00:00') == 0
+        assert other_sweep.track_customer(None, '2015-07-01 10:00:00') == 0
+        assert other_sweep.track_customer('b', '2015-07-01 1²:00:00') == 0
+        assert other_sweep.track_order('c', '2015-07-01 11:00:00', '1') == 0
+        assert dict(other_sweep.metrics.rejected_customers) == {
+            'duplicate_customer_id': 1, 'missing_customer_id': 1, 'invalid_date': 1}
+        assert dict(other_sweep.metrics.rejected_orders) == {'unknown_customer_id': 1}
+        with pytest.raises(ValueError) as e:
+            cohort_sweep.CohortSweep([configurations[0], configurations[0]])
+        assert str(e.value).startswith('configurations must be distinct')
+        assert cohort_sweep.parse_configuration('2015-07-07:14:4') == (datetime.datetime(2015, 7, 7), 14, 4)
+        with pytest.raises(TypeError) as e:
+            cohort_sweep.CohortSweep([])
+        assert str(e.value).startswith('configurations must be a non empty list')
@@ -0,0 +1,53 @@
+import pytest
+import csv
+import datetime
+import json
+import os
+import tempfile
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+from customer_order_cohort import cohort_writers
+
+
+class TestCohortWriters:
+    def test_all_formats(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 23, 0, 0, tzinfo=pst_time_zone))
+        customers_cohorts.read_customers_csv_file()
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        orders_by_time_slot.read_orders_csv_file()
+        expected = [(cohort_key, customers_cohorts.cohort_cardinality[cohort_key],
+                     orders_by_time_slot.get_counts_for_cohort(cohort_key))
+                    for cohort_key in reversed(sorted(orders_by_time_slot.customer_group_to_order_accumulated))]
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {output_format: os.path.join(directory, f'ordercounts.{output_format}')
+                     for output_format in cohort_writers.OUTPUT_FORMATS}
+            for output_format, path in paths.items():
+                lines = orders_by_time_slot.write_orders_count_by_cohorts_file(path, output_format)
+                assert lines == len(expected) * (2 if output_format == 'human' else 1)
+            # today's output, generated on PST
+            with open(paths['human'], mode='rb') as human_file, open('./ordercounts.csv', mode='rb') as expected_file:
+                assert human_file.read() == expected_file.read()
+            with open(paths['csv']) as counts_file:
+                rows = list(csv.DictReader(counts_file))
+            assert [(row['cohort'], int(row['customers']),
+                     [[int(row[f'orders_{i}']), int(row[f'first_orders_{i}'])]
+                      for i in range(8) if row[f'orders_{i}'] != '']) for row in rows] == expected
+            with open(paths['jsonl']) as json_lines_file:
+                cohorts = [json.loads(line) for line in json_lines_file]
+            assert [(cohort['cohort'], cohort['customers'], [list(count) for count in zip(
+                cohort['orders'], cohort['first_orders'])]) for cohort in cohorts] == expected
+            with open(paths['binary'], mode='rb') as binary_file:
+                header, records = cohort_writers.read_binary(binary_file)
+            assert header['number_of_intervals'] == 8
+            assert header['days_interval_length'] == 7
+            assert [(customers_cohorts.cohort_table[record[0]].id, record[1],
+                     [[record[2 + i], record[10 + i]] for i in range(8) if record[2 + i] >= 0])
+                    for record in records] == expected
+            with pytest.raises(ValueError) as e:
+                orders_by_time_slot.write_orders_count_by_cohorts_file(paths['human'], 'xml')
+            assert str(e.value).startswith('output_format must be one of')
+            with open(paths['human'], mode='rb') as human_file, pytest.raises(ValueError) as e:
+                cohort_writers.read_binary(human_file)
+            assert str(e.value).startswith('not a binary cohort counts file')
@@ -0,0 +1,64 @@
+import datetime
+import os
+import shutil
+import tempfile
+from customer_order_cohort import columnar_cache as cc
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+
+
+class TestColumnarCache:
+    @staticmethod
+    def read_customer_and_order_files(path_customers: str, path_orders: str, columnar_cache: bool) -> (dict, dict):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone), number_of_intervals=12)
+        customers_cohorts.read_customers_csv_file(path_customers, columnar_cache=columnar_cache)
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        orders_by_time_slot.read_orders_csv_file(path_orders, columnar_cache=columnar_cache)
+        return {customer_id: cohort.id for customer_id, cohort in
+                customers_cohorts.customers_and_matching_cohort.items()}, {
+            cohort_key: orders_by_time_slot.get_customer_ids_for_cohort(cohort_key)
+            for cohort_key in orders_by_time_slot.customer_group_to_order_accumulated}
+
+    def test_cached_customer_and_order_files(self):
+        expected = self.read_customer_and_order_files('./data/customers.csv', './data/orders.csv', False)
+        with tempfile.TemporaryDirectory() as directory:
+            path_customers = shutil.copy('./data/customers.csv', directory)
+            path_orders = shutil.copy('./data/orders.csv', directory)
+            # first read writes the sidecar files, second read maps them
+            assert self.read_customer_and_order_files(path_customers, path_orders, True) == expected
+            assert os.path.exists(path_customers + '.columns') and os.path.exists(path_orders + '.columns')
+            customer_columns = cc.read_csv_columns(
+                path_customers, ctsc.CustomerTimeSpanCohorts.COLUMNAR_CACHE_LAYOUT,
+                [(0, int), (1, int)], ctsc.skip_csv_header)
+            assert isinstance(customer_columns[0], memoryview) and len(customer_columns[0]) == 25716
+            assert self.read_customer_and_order_files(path_customers, path_orders, True) == expected
+            # a changed file is parsed again
+            with open(path_customers, mode='a') as customers_file:
+                customers_file.write('qazaq,2015-07-01 10:10:10\n')
+            customers, orders = self.read_customer_and_order_files(path_customers, path_orders, True)
+            assert 'qazaq' in customers and len(customers) == len(expected[0]) + 1
+            assert orders == expected[1]
+            with open(path_orders, mode='a') as orders_file:
+                orders_file.write('99999,1,35410,2015-07-06 10:10:10\n')
+            customers, orders = self.read_customer_and_order_files(path_customers, path_orders, True)
+            assert orders['2015/07/01-2015/07/07'][0][0] == expected[1]['2015/07/01-2015/07/07'][0][0] | {'35410'}
+            # a file that cannot be cached is marked so, and not parsed again until it changes
+            parsed_ids = []
+
+            def parse_id_to_int(id_representation):
+                parsed_ids.append(id_representation)
+                return ctsc.CustomerTimeSpanCohorts.parse_id_to_int(id_representation)
+
+            for parsed_count in (25717, 0):  # qazaq is the last customer
+                parsed_ids.clear()
+                assert cc.read_csv_columns(path_customers, ctsc.CustomerTimeSpanCohorts.COLUMNAR_CACHE_LAYOUT,
+                                           [(0, parse_id_to_int)], ctsc.skip_csv_header) is None
+                assert len(parsed_ids) == parsed_count
+            assert cc.map_cache_file(path_customers + '.columns', {}) is cc.NOT_CACHEABLE
+            with open(path_customers, mode='a') as customers_file:
+                customers_file.write('35410,2015-07-01 10:10:10\n')
+            assert cc.read_csv_columns(path_customers, ctsc.CustomerTimeSpanCohorts.COLUMNAR_CACHE_LAYOUT,
+                                       [(0, parse_id_to_int)], ctsc.skip_csv_header) is None
+            assert len(parsed_ids) == 25717
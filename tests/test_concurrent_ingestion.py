@@ -0,0 +1,79 @@
+import pytest
+import datetime
+import gzip
+import os
+import shutil
+import tempfile
+from array import array
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+from customer_order_cohort import concurrent_ingestion as cin
+from customer_order_cohort.pipeline_metrics import PipelineMetrics
+
+
+class TestConcurrentIngestion:
+    def test_same_as_sequential_read(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        recent_date = datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone)
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date)
+        customers_cohorts.read_customers_csv_file('./data/customers.csv')
+        expected = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        expected.read_orders_csv_file('./data/orders.csv')
+
+        def read_concurrently(path_customers_csv_file, path_orders_csv_file, workers=2, ranges_per_worker=4):
+            orders_by_time_slot = otsa.OrderTimeSpanAggregation(
+                customer_cohorts=ctsc.CustomerTimeSpanCohorts(recent_date=recent_date))
+            ingestion = cin.ConcurrentIngestion(orders_by_time_slot, workers, ranges_per_worker)
+            assert ingestion.read_csv_files(path_customers_csv_file, path_orders_csv_file) == 8
+            # same cohorts, customer ordinals, bitmaps and rejected entries as reading one file after the other
+            assert orders_by_time_slot.snapshot_state() == expected.snapshot_state()
+            assert orders_by_time_slot.metrics.rejected_customers == expected.metrics.rejected_customers
+            assert orders_by_time_slot.metrics.rejected_orders == expected.metrics.rejected_orders
+            assert orders_by_time_slot.metrics.stages['customer_read'].rows == 25716
+            assert orders_by_time_slot.metrics.stages['order_read'].rows == 27575
+            return ingestion
+
+        assert read_concurrently('./data/customers.csv', './data/orders.csv', 1, 1).byte_ranges == 1
+        assert read_concurrently('./data/customers.csv', './data/orders.csv').byte_ranges == 8
+        with tempfile.TemporaryDirectory() as directory:
+            path_orders_csv_file = os.path.join(directory, 'orders.csv.gz')
+            with open('./data/orders.csv', mode='rb') as input_file, \
+                    gzip.open(path_orders_csv_file, mode='wb') as output_file:
+                shutil.copyfileobj(input_file, output_file)
+            # compressed files are parsed whole by one process
+            assert read_concurrently('./data/customers.csv', path_orders_csv_file).byte_ranges == 1
+            with pytest.raises(IOError):
+                read_concurrently('./data/customers.csv', os.path.join(directory, 'missing.csv'))
+            with pytest.raises(IOError):
+                read_concurrently(os.path.join(directory, 'missing.csv'), './data/orders.csv')
+        with pytest.raises(ValueError):
+            read_concurrently('./data/customers.csv', '-')
+        with pytest.raises(TypeError):
+            cin.ConcurrentIngestion(None)
+        with pytest.raises(ValueError):
+            cin.ConcurrentIngestion(expected, workers=0)
+
+    def test_parse_and_track_order_columns(self):
+        recent_date = datetime.datetime(2015, 7, 7, 23, 0, 0, tzinfo=datetime.timezone.utc)
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date)
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        otsa.init_order_worker(customers_cohorts)  # as in a worker process
+        try:
+            # order ID, order number, customer ID, order date
+            customer_ids, encoded_orders = cin.parse_order_entries([['1', '1', '10', '2015-07-06 10:00:00'],
+                                                                    ['2', '2', '10', '2015-07-06 11:00:00'],
+                                                                    ['3', '1', '11', '2014-07-01 10:00:00'],
+                                                                    ['4', '1', '12', 'not a date']])
+        finally:
+            otsa.init_order_worker(None)
+        assert customer_ids == '10\n10\n11\n12'
+        order_seconds = customers_cohorts.seconds_from_oldest('2015-07-06 10:00:00')
+        assert encoded_orders == array('q', [2 * order_seconds + 1, 2 * order_seconds + 2 * 3600, -2, -1])
+        customers_cohorts.track_customer_batch(['10', '11'], ['2015-07-05 10:00:00', '2015-07-05 11:00:00'])
+        ingestion = cin.ConcurrentIngestion(orders_by_time_slot)
+        # date rejections of known customers, unknown customers first, as track_order
+        assert ingestion.track_order_columns(customer_ids.split('\n'), encoded_orders) == 2
+        assert orders_by_time_slot.metrics.rejected_orders == {PipelineMetrics.DATE_OUT_OF_RANGE: 1,
+                                                               PipelineMetrics.UNKNOWN_CUSTOMER_ID: 1}
+        assert orders_by_time_slot.get_customer_ids_for_cohort('2015/07/01-2015/07/07') == [[{'10'}, {'10'}]]
+        assert orders_by_time_slot.metrics.stages['order_read'].rows == 4
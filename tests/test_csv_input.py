@@ -0,0 +1,72 @@
+import pytest
+import datetime
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+from customer_order_cohort import csv_input
+
+
+class TestCsvInput:
+    def test_compressed_and_piped_input(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+
+        def read_counts(path_customers_csv_file, path_orders_csv_file, workers=None):
+            customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+                recent_date=datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone))
+            customers_cohorts.read_customers_csv_file(path_customers_csv_file)
+            orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+            orders_by_time_slot.read_orders_csv_file(path_orders_csv_file, workers=workers)
+            return {cohort_key: orders_by_time_slot.get_counts_for_cohort(cohort_key)
+                    for cohort_key in orders_by_time_slot.customer_group_to_order_accumulated}
+
+        expected = read_counts('./data/customers.csv', './data/orders.csv')
+        threads = threading.active_count()
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {}
+            for compression, (extensions, _, open_function) in csv_input.COMPRESSIONS.items():
+                for name in ('customers', 'orders'):
+                    paths[compression, name] = os.path.join(directory, name + extensions[0])
+                    with open(f'./data/{name}.csv', mode='rb') as input_file, \
+                            open_function(paths[compression, name], mode='wb') as output_file:
+                        shutil.copyfileobj(input_file, output_file)
+                assert csv_input.detect_compression(paths[compression, 'orders']) == compression
+                assert not csv_input.is_plain_csv_file(paths[compression, 'orders'])
+                assert read_counts(paths[compression, 'customers'], paths[compression, 'orders'], workers=2) == expected
+            # compression detected from magic bytes only
+            path_no_extension = os.path.join(directory, 'orders')
+            shutil.copy(paths['xz', 'orders'], path_no_extension)
+            assert not csv_input.is_plain_csv_file(path_no_extension)
+            assert read_counts(paths['bzip2', 'customers'], path_no_extension) == expected
+            # open files, compressed or not, text or binary, are left open
+            with open(paths['gzip', 'customers'], mode='rb') as customers_file, \
+                    open('./data/orders.csv', mode='r') as orders_file:
+                assert read_counts(customers_file, orders_file) == expected
+                assert not customers_file.closed and not orders_file.closed
+            # standard input
+            standard_input = sys.stdin
+            try:
+                with open(paths['gzip', 'orders'], mode='rb') as orders_file:
+                    sys.stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(orders_file.read())))
+                assert read_counts('./data/customers.csv', csv_input.STDIN_PATH) == expected
+            finally:
+                sys.stdin = standard_input
+            # decompression errors are raised in the reading thread
+            with open(paths['gzip', 'orders'], mode='rb') as orders_file:
+                truncated = orders_file.read()[:-1000]
+            with pytest.raises(EOFError):
+                with csv_input.open_csv_input(io.BytesIO(truncated)) as csv_file:
+                    csv_file.read()
+            with csv_input.open_csv_input(io.BytesIO(gzip.compress(b'id,created\n1,2\n'))) as csv_file:
+                assert csv_file.readline() == 'id,created\n'  # closed before its end
+        assert threading.active_count() == threads
+        assert csv_input.is_plain_csv_file('./data/orders.csv')
+        assert not csv_input.is_plain_csv_file(csv_input.STDIN_PATH)
+        with pytest.raises(TypeError) as e:
+            ctsc.CustomerTimeSpanCohorts().read_customers_csv_file(42)
+        assert str(e.value).startswith('path_csv_file must be a string or a file object')
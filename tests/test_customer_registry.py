@@ -0,0 +1,34 @@
+import pytest
+import random
+from customer_order_cohort.customer_registry import CustomerRegistry
+
+
+class TestCustomerRegistry:
+    def test_same_as_dict(self):
+        randomizer = random.Random(17)
+        dense_ids = [str(customer_id) for customer_id in randomizer.sample(range(1, 300000), 100000)]
+        sparse_ids = [str(randomizer.randrange(10 ** 17)) for _ in range(20000)]
+        other_ids = ['abc', '007', '00', '١٢', '99999999999999999999', '', ' 12', '-5', '1.0']
+        for customer_ids, direct in ((dense_ids, True), (sparse_ids, False), (dense_ids[:5000] + sparse_ids[:1], False),
+                                     ([str(customer_id) for customer_id in range(1, 1001)] + other_ids, True)):
+            registry, expected = CustomerRegistry(), {}
+            for position, customer_id in enumerate(customer_ids):
+                registry[customer_id] = expected[customer_id] = 8 * position + position % 8
+            assert (registry.slot_keys is None) == direct
+            assert len(registry) == len(expected) and dict(registry.items()) == expected
+            for customer_id in other_ids + [str(customer_id) for customer_id in range(0, 400000, 7)]:
+                assert registry.get(customer_id) == expected.get(customer_id)
+                assert (customer_id in registry) == (customer_id in expected)
+            with pytest.raises(KeyError):
+                registry['300001']
+            assert CustomerRegistry.from_state(registry.snapshot_state()) == expected
+            compacted = CustomerRegistry.from_mapping(expected)
+            assert compacted == expected and compacted.to_dict() == expected
+            assert CustomerRegistry.from_mapping(dict(reversed(list(expected.items())))).snapshot_state() == \
+                compacted.snapshot_state()
+            registry[customer_ids[0]] = 2 ** 40
+            assert registry[customer_ids[0]] == 2 ** 40 and registry.slot_values.typecode == 'q'
+            assert dict(CustomerRegistry.from_state(registry.snapshot_state()).items()) == registry
+        assert registry.other_ids == {customer_id: expected[customer_id] for customer_id in other_ids}
+        with pytest.raises(ValueError):
+            registry['1'] = -1
@@ -3,6 +3,45 @@ import datetime
 from customer_order_cohort import customer_time_span_cohorts as ctsc
 
 
+class PacificTimeZone(datetime.tzinfo):
+    """America/Los_Angeles with its daylight saving time rules since 2007, without zoneinfo, before python 3.9"""
+
+    STANDARD = datetime.timedelta(hours=-8)
+    DAYLIGHT = datetime.timedelta(hours=-7)
+
+    @staticmethod
+    def get_daylight_range(year: int) -> (datetime.datetime, datetime.datetime):
+        """:returns start and end of daylight saving time in standard time: second sunday of March, 2:00,
+        and first sunday of November, 1:00"""
+
+        march_first, november_first = datetime.datetime(year, 3, 1, 2), datetime.datetime(year, 11, 1, 1)
+        return march_first + datetime.timedelta(days=(6 - march_first.weekday()) % 7 + 7), \
+            november_first + datetime.timedelta(days=(6 - november_first.weekday()) % 7)
+
+    def utcoffset(self, local_date):
+        if local_date is None:
+            return self.STANDARD
+        start, end = self.get_daylight_range(local_date.year)
+        # repeated hour at the end of daylight saving time: first in daylight time, then fold 1 in standard time
+        end += datetime.timedelta(hours=1) if local_date.fold == 0 else datetime.timedelta()
+        return self.DAYLIGHT if start <= local_date.replace(tzinfo=None) < end else self.STANDARD
+
+    def dst(self, local_date):
+        return self.utcoffset(local_date) - self.STANDARD
+
+    def tzname(self, local_date):
+        return 'PDT' if self.dst(local_date) else 'PST'
+
+    def fromutc(self, utc_date):
+        standard_date = utc_date.replace(tzinfo=None) + self.STANDARD
+        start, end = self.get_daylight_range(standard_date.year)
+        if start <= standard_date < end:
+            return (standard_date + self.DAYLIGHT - self.STANDARD).replace(tzinfo=self)
+        # first hour of standard time is the repeated hour
+        fold = 1 if end <= standard_date < end + datetime.timedelta(hours=1) else 0
+        return standard_date.replace(tzinfo=self, fold=fold)
+
+
 class TestCustomerTimeSpanCohorts:
     def test_date_utc_conversion(self):
         utc_time_zone = datetime.timezone(datetime.timedelta(), name="GMT")
@@ -38,6 +77,78 @@ class TestCustomerTimeSpanCohorts:
         assert customers_cohorts.convert_date_in_range('2017-07-09  09:51:10') is None
         assert customers_cohorts.convert_date_in_range('2017-04-07  21:21:12') is None
 
+    def test_fast_date_parsing(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone), number_of_intervals=2)
+        for date_representation in [
+                '2015-07-08 06:59:59', '2015-07-08 07:00:00', '2015-06-24 07:00:00', '2015-06-24 06:59:59',
+                '2015-06-23 12:00:00', '2015-07-09 01:00:00', '2015-06-30  12:00:00', '2015-6-30 12:00:00',
+                '2015-06-31 12:00:00', '2015-06-30 24:00:00', '2015-06-30 12:60:00', '2015-06-30 1:02:003',
+                '2015-06-30T12:00:00', '2015-06-30 12:00:0x', '2015-06-30 +1:00:00', '2015-06-3  12:00:00',
+                '2015-07-1   1:02:03', '2015-07-01 1\u00b2:00:00', '2015-07-0\u00b9 12:00:00', '', None]:
+            parsed = ctsc.CustomerTimeSpanCohorts.parse_date(date_representation)
+            if parsed is not None:
+                parsed += customers_cohorts.delta_time_zone
+                if not customers_cohorts.oldest_date <= parsed < customers_cohorts.recent_date:
+                    parsed = None
+            # twice, with and without memoized day and time of day
+            assert customers_cohorts.convert_date_in_range(date_representation) == parsed, date_representation
+            assert customers_cohorts.convert_date_in_range(date_representation) == parsed, date_representation
+        assert '2015-05-01' not in customers_cohorts.day_seconds_memo
+        assert customers_cohorts.seconds_from_oldest('2015-05-01 10:00:00') is None
+        assert customers_cohorts.day_seconds_memo['2015-05-01'] is None
+        assert customers_cohorts.seconds_from_oldest('2015-06-24 07:00:01') == 1
+        # non ASCII digits are rejected like strptime does, not raised by int()
+        assert customers_cohorts.track_customer('x', '2015-07-01 1\u00b2:00:00') is None
+        assert ctsc.CustomerTimeSpanCohorts.parse_date_to_seconds('2015-07-01 1\u00b2:00:00') is None
+        assert ctsc.CustomerTimeSpanCohorts.parse_date_to_cacheable_seconds('\u00b2015-07-01 12:00:00') == -1
+
+    def test_daylight_saving_time_zone(self):
+        pacific_time_zone = PacificTimeZone()
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 11, 7, 23, 47, 13), number_of_intervals=40, time_zone=pacific_time_zone)
+        assert customers_cohorts.oldest_date == datetime.datetime(2015, 2, 1, 0, 0, 0)
+        assert customers_cohorts.delta_time_zone == datetime.timedelta(hours=-8)
+        # start and end of daylight saving time, in GMT
+        assert customers_cohorts.utc_transitions[1:] == [
+            ctsc.CustomerTimeSpanCohorts.to_seconds(datetime.datetime(2015, 3, 8, 10, 0, 0)),
+            ctsc.CustomerTimeSpanCohorts.to_seconds(datetime.datetime(2015, 11, 1, 9, 0, 0))]
+        assert customers_cohorts.utc_offsets == [-8 * 3600, -7 * 3600, -8 * 3600]
+        utc_dates = [datetime.datetime(2015, 1, 31, 0, 0, 0) + datetime.timedelta(minutes=29 * i) for i in range(14000)]
+        utc_dates += [datetime.datetime(2015, 3, 8, 9, 59, 59), datetime.datetime(2015, 3, 8, 10, 0, 0),
+                      datetime.datetime(2015, 11, 1, 8, 59, 59), datetime.datetime(2015, 11, 1, 9, 0, 0)]
+        for utc_date in utc_dates:
+            local_date = utc_date.replace(tzinfo=datetime.timezone.utc).astimezone(pacific_time_zone).replace(tzinfo=None)
+            if not customers_cohorts.oldest_date <= local_date < customers_cohorts.recent_date:
+                local_date = None
+            assert customers_cohorts.convert_date_in_range(utc_date.strftime('%Y-%m-%d %H:%M:%S')) == local_date, utc_date
+        assert customers_cohorts.day_seconds_memo['2015-03-08'] is ctsc._TRANSITION_DAY
+        assert isinstance(customers_cohorts.day_seconds_memo['2015-03-09'], int)
+        # cohorts start on sundays: saturday evening before daylight saving time, sunday morning after
+        assert customers_cohorts.track_customer('1', '2015-03-08 07:30:00') == '2015/03/01-2015/03/07'
+        assert customers_cohorts.track_customer('2', '2015-03-15 07:30:00') == '2015/03/15-2015/03/21'
+        assert customers_cohorts.track_customer('3', '2015-11-01 08:30:00') == '2015/11/01-2015/11/07'
+        assert customers_cohorts.track_customer_columns(
+            [4, 5], [ctsc.CustomerTimeSpanCohorts.to_seconds(datetime.datetime(2015, 3, 8, 7, 30, 0)),
+                     ctsc.CustomerTimeSpanCohorts.to_seconds(datetime.datetime(2015, 3, 15, 6, 30, 0))]) == 2
+        assert customers_cohorts.customers_and_matching_cohort['4'].id == '2015/03/01-2015/03/07'
+        assert customers_cohorts.customers_and_matching_cohort['5'].id == '2015/03/08-2015/03/14'
+        restored_cohorts = ctsc.CustomerTimeSpanCohorts.from_state(customers_cohorts.snapshot_state())
+        assert restored_cohorts.utc_offsets == customers_cohorts.utc_offsets
+        assert restored_cohorts.seconds_from_oldest('2015-07-04 12:00:00') == \
+            customers_cohorts.seconds_from_oldest('2015-07-04 12:00:00')
+        with pytest.raises(TypeError):
+            ctsc.CustomerTimeSpanCohorts(time_zone='America/Los_Angeles')
+        try:
+            import zoneinfo
+        except ImportError:  # before python 3.9
+            return
+        oldest_utc_seconds, recent_utc_seconds = customers_cohorts.get_utc_seconds_range()
+        assert ctsc.CustomerTimeSpanCohorts.build_utc_offset_table(
+            zoneinfo.ZoneInfo('America/Los_Angeles'), oldest_utc_seconds, recent_utc_seconds) == \
+            ctsc.CustomerTimeSpanCohorts.build_utc_offset_table(pacific_time_zone, oldest_utc_seconds, recent_utc_seconds)
+
     def test_cohort_id(self):
         pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
         customers_cohorts = ctsc.CustomerTimeSpanCohorts(
@@ -61,6 +172,11 @@ class TestCustomerTimeSpanCohorts:
         assert 'plokijuh' in customers_cohorts.customers_and_matching_cohort
         assert customers_cohorts.customers_and_matching_cohort['plokijuh'].id ==\
                customers_cohorts.customers_and_matching_cohort['qazaq'].id
+        # cohorts are shared, from the table built with the analysis
+        assert len(customers_cohorts.cohort_table) == 8
+        assert customers_cohorts.customers_and_matching_cohort['plokijuh'] is customers_cohorts.cohort_table[7]
+        assert customers_cohorts.locate_customer('plokijuh') == (7, 2)
+        assert customers_cohorts.locate_customer('tressert') is None
         assert 'hujikolp' in customers_cohorts.customers_and_matching_cohort
         assert customers_cohorts.customers_and_matching_cohort['hujikolp'].id == '2015/05/20-2015/05/26'
         assert 'tressert' not in customers_cohorts.customers_and_matching_cohort
@@ -90,6 +206,38 @@ class TestCustomerTimeSpanCohorts:
         assert len(customers_cohorts.cohort_cardinality) == 8
         assert len(customers_cohorts.customers_and_matching_cohort) == 7246
 
+    def test_batched_full_customer_file(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        for recent_date, days_interval_length in [
+                (datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone), 7),
+                (datetime.datetime(2015, 6, 2, 1, 2, 3), 3)]:
+            customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+                recent_date=recent_date, days_interval_length=days_interval_length, number_of_intervals=9)
+            customers_cohorts.read_customers_csv_file()
+            batched_cohorts = ctsc.CustomerTimeSpanCohorts(
+                recent_date=recent_date, days_interval_length=days_interval_length, number_of_intervals=9)
+            batched_cohorts.read_customers_csv_file(batch_size=1000)
+            assert batched_cohorts.cohort_cardinality == customers_cohorts.cohort_cardinality
+            assert {customer_id: cohort.immutable for customer_id, cohort in
+                    batched_cohorts.customers_and_matching_cohort.items()} ==\
+                   {customer_id: cohort.immutable for customer_id, cohort in
+                    customers_cohorts.customers_and_matching_cohort.items()}
+        batched_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone))
+        batched_cohorts.read_all_customer_entries_in_batches([
+            ['qazaq', '2015-07-07  06:21:42'], ['qazaq', '2015-07-06 07:47:27'], [None, '2015-07-06 07:47:27'],
+            ['plokijuhyg', '2015-07-01 07:00:00'], ['hujikolp', '2015-05-23 21:08:56'],
+            ['tressert', '2015-03-21 19:43:27'], ['wassaw', '2015-07-09 00:00:00'], ['ploki', '2015-02-30 01:00:00'],
+            ['juh', '']], 0, 1, batch_size=2)
+        assert batched_cohorts.cohort_cardinality == {'2015/07/01-2015/07/07': 2, '2015/05/20-2015/05/26': 1}
+        assert sorted(batched_cohorts.customers_and_matching_cohort) == ['hujikolp', 'plokijuhyg', 'qazaq']
+        # memoized day and time of day of a date too long, and a missing date, are rejected as invalid
+        assert batched_cohorts.track_customer_batch(['longer', 'missing', 'again'], [
+            '2015-07-06 07:47:27x', None, '2015-07-06 07:47:27']) == 1
+        assert batched_cohorts.track_customer_batch(['longer'], ['2015-07-06 07:47:27x']) == 0
+        assert batched_cohorts.cohort_cardinality['2015/07/01-2015/07/07'] == 3
+        assert batched_cohorts.metrics.rejected_customers['invalid_date'] == 5
+
     def test_silly_cohorts(self):
         with pytest.raises(TypeError) as e:
             assert ctsc.CustomerTimeSpanCohorts(
@@ -0,0 +1,145 @@
+import pytest
+import datetime
+import os
+import shutil
+import tempfile
+from customer_order_cohort import daily_cohort_cube as dcc
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+
+
+class TestDailyCohortCube:
+    @staticmethod
+    def summarize(orders_by_time_slot: otsa.OrderTimeSpanAggregation) -> (dict, dict, dict):
+        """:returns counts, cohort cardinality and customer IDs per cohort, independent of customer ordinals"""
+
+        return {cohort_key: orders_by_time_slot.get_counts_for_cohort(cohort_key)
+                for cohort_key in orders_by_time_slot.customer_group_to_order_accumulated}, \
+            dict(orders_by_time_slot.customer_cohorts.cohort_cardinality), \
+            {cohort_key: orders_by_time_slot.get_customer_ids_for_cohort(cohort_key)
+             for cohort_key in orders_by_time_slot.customer_group_to_order_accumulated}
+
+    @staticmethod
+    def read_analysis(recent_date: datetime.datetime, days_interval_length: int, number_of_intervals: int,
+                      path_customers: str = './data/customers.csv',
+                      path_orders: str = './data/orders.csv') -> otsa.OrderTimeSpanAggregation:
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date,
+                                                         days_interval_length=days_interval_length,
+                                                         number_of_intervals=number_of_intervals)
+        customers_cohorts.read_customers_csv_file(path_customers)
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        orders_by_time_slot.read_orders_csv_file(path_orders)
+        return orders_by_time_slot
+
+    def test_advance_same_as_full_read(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        first_recent_date = datetime.datetime(2015, 6, 29, 23, 47, 13, tzinfo=pst_time_zone)
+        with tempfile.TemporaryDirectory() as directory:
+            path_customers = shutil.copy('./data/customers.csv', directory)
+            path_orders = shutil.copy('./data/orders.csv', directory)
+            cube = dcc.DailyCohortCube(first_recent_date, window_days=56)
+            assert cube.read_csv_files(path_customers, path_orders) == 56
+            for day in range(10):
+                recent_date = first_recent_date + datetime.timedelta(days=day)
+                if day > 0:
+                    assert cube.advance(recent_date) <= 1
+                    assert cube.read_csv_files(path_customers, path_orders, block_index=day % 2 == 0) == 1
+                for days_interval_length, number_of_intervals in ((7, 8), (14, 4), (3, 5)):
+                    assert self.summarize(cube.roll_up(days_interval_length, number_of_intervals)) == self.summarize(
+                        self.read_analysis(recent_date, days_interval_length, number_of_intervals))
+            earlier_date = recent_date - datetime.timedelta(days=3)
+            assert self.summarize(cube.roll_up(7, 4, earlier_date)) == self.summarize(
+                self.read_analysis(earlier_date, 7, 4))
+            # days out of the window, or not read yet
+            with pytest.raises(ValueError):
+                cube.roll_up(7, 9)
+            with pytest.raises(ValueError):
+                cube.roll_up(7, 8, recent_date + datetime.timedelta(days=1))
+            with pytest.raises(ValueError):
+                cube.advance(earlier_date)
+            assert cube.recent_date == recent_date  # unchanged by the rejected advance
+            with pytest.raises(TypeError):
+                cube.advance('2015-07-08')
+            # saved and loaded, then moved forward
+            path_cube_file = os.path.join(directory, 'cube.pickle')
+            assert dcc.save_cube(path_cube_file, cube) > 0
+            loaded_cube = dcc.load_cube(path_cube_file)
+            assert self.summarize(loaded_cube.roll_up()) == self.summarize(cube.roll_up())
+            recent_date += datetime.timedelta(days=1)
+            loaded_cube.advance(recent_date)
+            loaded_cube.read_csv_files(path_customers, path_orders)
+            assert self.summarize(loaded_cube.roll_up()) == self.summarize(self.read_analysis(recent_date, 7, 8))
+            with pytest.raises(ValueError):
+                dcc.load_cube(path_customers)
+            # window up to the current day: read, but not marked as read until it ends
+            current_cube = dcc.DailyCohortCube(recent_date, window_days=56)
+            current_day = current_cube.recent_day - 3
+            current_cube.get_current_day = lambda: current_day
+            assert current_cube.read_csv_files(path_customers, path_orders) == 53
+            assert current_cube.loaded_day == current_day
+            expected = self.summarize(self.read_analysis(recent_date, 7, 8))
+            assert self.summarize(current_cube.roll_up()) == expected
+            assert current_cube.read_csv_files(path_customers, path_orders) == 0
+            assert self.summarize(current_cube.roll_up()) == expected
+            current_day += 5
+            assert current_cube.read_csv_files(path_customers, path_orders) == 3
+            assert current_cube.loaded_day == current_cube.recent_day
+            assert self.summarize(current_cube.roll_up()) == expected
+        with pytest.raises(TypeError):
+            dcc.DailyCohortCube(first_recent_date, window_days='56')
+
+    @staticmethod
+    def write_csv_files(directory: str, customer_entries: [str], order_entries: [str]) -> (str, str):
+        """:returns paths of the customers and orders csv files of these entries, in directory"""
+
+        path_customers = os.path.join(directory, 'customers.csv')
+        path_orders = os.path.join(directory, 'orders.csv')
+        with open(path_customers, mode='w') as customers_file:
+            customers_file.write('\n'.join(['id,created'] + customer_entries) + '\n')
+        with open(path_orders, mode='w') as orders_file:
+            orders_file.write('\n'.join(['id,order_number,user_id,created'] + order_entries) + '\n')
+        return path_customers, path_orders
+
+    def check_advance(self, customer_entries: [str], order_entries: [str], block_index: bool,
+                      days_interval_length: int, number_of_intervals: int) -> dcc.DailyCohortCube:
+        """:returns cube of 7 days read on 2015-07-07, then moved forward and read day by day to 2015-07-10"""
+
+        recent_date = datetime.datetime(2015, 7, 7, 23, 0, 0, tzinfo=datetime.timezone.utc)
+        with tempfile.TemporaryDirectory() as directory:
+            path_customers, path_orders = self.write_csv_files(directory, customer_entries, order_entries)
+            cube = dcc.DailyCohortCube(recent_date, window_days=7)
+            for day in range(4):
+                if day > 0:
+                    recent_date += datetime.timedelta(days=1)
+                    cube.advance(recent_date)
+                cube.read_csv_files(path_customers, path_orders, block_index)
+                assert self.summarize(cube.roll_up(days_interval_length, number_of_intervals)) == self.summarize(
+                    self.read_analysis(recent_date, days_interval_length, number_of_intervals, path_customers,
+                                       path_orders))
+        return cube
+
+    def test_duplicate_customer_ids_same_as_full_read(self):
+        for block_index in (False, True):
+            # entry of a new day first in the file: tracked on 2015-07-08 by a full read of the next window
+            cube = self.check_advance(['10,2015-07-08 10:00:00', '10,2015-07-03 10:00:00', '11,2015-07-02 10:00:00',
+                                       # tracked on 2015-07-06 once 2015-07-03 is dropped
+                                       '12,2015-07-03 12:00:00', '12,2015-07-06 12:00:00',
+                                       # both in the last window, the first in the file is tracked
+                                       '13,2015-07-09 10:00:00', '13,2015-07-08 10:00:00'],
+                                      ['1,1,10,2015-07-08 11:00:00', '2,2,10,2015-07-09 11:00:00',
+                                       '3,1,11,2015-07-05 10:00:00', '4,1,12,2015-07-07 10:00:00',
+                                       '5,1,13,2015-07-09 12:00:00'], block_index, 1, 7)
+            # 10 and 12 have a single entry in the last window, read again
+            assert cube.duplicate_ids == {'13'}
+            assert not cube.full_read_needed
+            # other windows of a full read may track other entries of these IDs
+            with pytest.raises(ValueError):
+                cube.roll_up(1, 6)
+
+    def test_orders_before_customer_same_as_full_read(self):
+        for block_index in (False, True):
+            # orders of days read, dated before the creation of their customer on a new day, in the same cohort
+            cube = self.check_advance(['10,2015-07-09 10:00:00', '11,2015-07-02 10:00:00'],
+                                      ['1,1,10,2015-07-06 11:00:00', '2,2,10,2015-07-09 11:00:00',
+                                       '3,1,11,2015-07-05 10:00:00', '4,2,11,2015-07-09 10:00:00'], block_index, 7, 1)
+            assert not cube.duplicate_ids
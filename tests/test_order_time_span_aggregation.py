@@ -18,7 +18,7 @@ class TestOrderTimeSpanAggregation:
         # for 'plokijuh' first oder after customer creation date
         assert orders_by_time_slot.read_all_order_entries(raw_orders, -1, 0, 1, 2) == 3
         assert '2020/09/28-2020/10/04' in orders_by_time_slot.customer_group_to_order_accumulated
-        order_counts_first_cohort = orders_by_time_slot.customer_group_to_order_accumulated['2020/09/28-2020/10/04']
+        order_counts_first_cohort = orders_by_time_slot.get_customer_ids_for_cohort('2020/09/28-2020/10/04')
         # qazaq order none the first week, 2 the second week, and 2 the last week
         assert order_counts_first_cohort == [[{'qazaq'}, set()], [{'qazaq'}, {'qazaq'}], [set(), set()]]
         assert '2020/10/05-2020/10/11' in orders_by_time_slot.customer_group_to_order_accumulated
@@ -26,7 +26,7 @@ class TestOrderTimeSpanAggregation:
         # from this cohort, plokijuh and wassaw only put orders the second week
         assert order_counts_second_cohort == [[2, 2], [0, 0]]
         assert '2020/10/12-2020/10/18' in orders_by_time_slot.customer_group_to_order_accumulated
-        order_counts_recent_cohort = orders_by_time_slot.customer_group_to_order_accumulated['2020/10/12-2020/10/18']
+        order_counts_recent_cohort = orders_by_time_slot.get_customer_ids_for_cohort('2020/10/12-2020/10/18')
         # single order for hujikolp the most recent week
         assert order_counts_recent_cohort == [[{'hujikolp'}, {'hujikolp'}]]
 
@@ -61,6 +61,85 @@ class TestOrderTimeSpanAggregation:
                [[146, 146], [54, 29], [40, 11]]
         assert orders_by_time_slot.get_counts_for_cohort('2015/06/10-2015/06/16') ==\
                [[136, 136], [56, 40], [41, 11], [34, 11]]
+        # same counts with customers compacted after the customer read, and from a snapshot of each
+        compact_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 19, 00, 00, tzinfo=utc_time_zone), number_of_intervals=4)
+        compact_cohorts.read_customers_csv_file()
+        assert 0 < compact_cohorts.compact_customer_index() < 16 * len(compact_cohorts.customers_cohort_index)
+        assert compact_cohorts.customers_cohort_index == customers_cohorts.customers_cohort_index
+        compact_orders: otsa = otsa.OrderTimeSpanAggregation(customer_cohorts=compact_cohorts)
+        compact_orders.read_orders_csv_file()
+        for analysis in (compact_orders, otsa.OrderTimeSpanAggregation.from_state(compact_orders.snapshot_state()),
+                         otsa.OrderTimeSpanAggregation.from_state(orders_by_time_slot.snapshot_state())):
+            for cohort_key in orders_by_time_slot.customer_group_to_order_accumulated:
+                assert analysis.get_counts_for_cohort(cohort_key) == orders_by_time_slot.get_counts_for_cohort(cohort_key)
+        assert compact_orders.snapshot_state()['customer_cohorts']['compact_customers']
+        assert isinstance(otsa.OrderTimeSpanAggregation.from_state(
+            orders_by_time_slot.snapshot_state()).customer_cohorts.customers_cohort_index, dict)
+
+    def test_parallel_full_customer_and_order_file(self):
+        utc_time_zone = datetime.timezone(datetime.timedelta(), name="GMT")
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 19, 00, 00, tzinfo=utc_time_zone), number_of_intervals=12)
+        customers_cohorts.read_customers_csv_file()
+        orders_by_time_slot: otsa = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        orders_by_time_slot.read_orders_csv_file()
+        parallel_orders_by_time_slot: otsa = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        assert parallel_orders_by_time_slot.read_orders_csv_file(workers=2) == 12
+        assert len(parallel_orders_by_time_slot.customer_group_to_order_accumulated) ==\
+               len(orders_by_time_slot.customer_group_to_order_accumulated)
+        for cohort_key in orders_by_time_slot.customer_group_to_order_accumulated:
+            assert parallel_orders_by_time_slot.get_customer_ids_for_cohort(cohort_key) ==\
+                   orders_by_time_slot.get_customer_ids_for_cohort(cohort_key)
+        byte_ranges = otsa.split_csv_file_byte_ranges('./data/orders.csv', 5)
+        assert len(byte_ranges) == 5
+        assert all(byte_ranges[i][1] == byte_ranges[i + 1][0] for i in range(4))
+        with pytest.raises(ValueError) as e:
+            parallel_orders_by_time_slot.read_orders_csv_file(workers=0)
+        assert str(e.value).startswith('value for workers must be a positive integer')
+
+    def test_approximate_counts(self):
+        utc_time_zone = datetime.timezone(datetime.timedelta(), name="GMT")
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 7, 19, 00, 00, tzinfo=utc_time_zone), number_of_intervals=12)
+        customers_cohorts.read_customers_csv_file()
+        orders_by_time_slot: otsa = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        orders_by_time_slot.read_orders_csv_file()
+        for sketch_precision in (6, 8, 12):
+            approximate_orders: otsa = otsa.OrderTimeSpanAggregation(
+                customer_cohorts=customers_cohorts, sketch_precision=sketch_precision)
+            approximate_orders.read_orders_csv_file()
+            # within three standard errors, plus one for small counts rounded to an integer
+            error_bound = 3 * otsa.CustomerSketch.get_standard_error(sketch_precision)
+            for cohort_key in orders_by_time_slot.customer_group_to_order_accumulated:
+                for counts, estimates in zip(orders_by_time_slot.get_counts_for_cohort(cohort_key),
+                                             approximate_orders.get_counts_for_cohort(cohort_key)):
+                    for count, estimate in zip(counts, estimates):
+                        assert abs(estimate - count) <= error_bound * count + 1, (sketch_precision, cohort_key, counts)
+            for periods in approximate_orders.customer_group_to_order_accumulated.values():
+                assert all(len(order_count[0].registers) == 2 ** sketch_precision for order_count in periods)
+            # sketches of parallel reads and snapshots merge to the same registers
+            parallel_orders: otsa = otsa.OrderTimeSpanAggregation(
+                customer_cohorts=customers_cohorts, sketch_precision=sketch_precision)
+            parallel_orders.read_orders_csv_file(workers=2)
+            restored_orders = otsa.OrderTimeSpanAggregation.from_state(approximate_orders.snapshot_state())
+            for cohort_key, periods in approximate_orders.customer_group_to_order_accumulated.items():
+                for other_orders in (parallel_orders, restored_orders):
+                    assert [[bytes(order_count[0]), bytes(order_count[1])] for order_count in periods] == \
+                        [[bytes(order_count[0]), bytes(order_count[1])]
+                         for order_count in other_orders.customer_group_to_order_accumulated[cohort_key]]
+        sketch = otsa.CustomerSketch(10)
+        assert len(sketch) == 0
+        assert sketch.add(7) and not sketch.add(7)
+        assert len(sketch) == 1
+        with pytest.raises(ValueError) as e:
+            sketch.update(otsa.CustomerSketch(11))
+        assert str(e.value).startswith('cannot merge sketches of precision')
+        with pytest.raises(ValueError) as e:
+            otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts, sketch_precision=17)
+        assert str(e.value).startswith('value for precision must be between 4 and 16')
+        with pytest.raises(ValueError):
+            approximate_orders.get_customer_ids_for_cohort('2015/07/01-2015/07/07')
 
     def test_silly_analysis(self):
         orders_by_time_slot: otsa.OrderTimeSpanAggregation = otsa.OrderTimeSpanAggregation(
@@ -0,0 +1,38 @@
+import pytest
+import datetime
+import os
+import tempfile
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+from customer_order_cohort import partitioned_cohort_analysis as pca
+
+
+class TestPartitionedCohortAnalysis:
+    def test_partitioned_customer_and_order_file(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        recent_date = datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone)
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date, number_of_intervals=10)
+        customers_cohorts.read_customers_csv_file()
+        expected = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        expected.read_orders_csv_file()
+        # about 25k customers in the file, budget for about 5k
+        analysis = pca.PartitionedCohortAnalysis(recent_date=recent_date, number_of_intervals=10,
+                                                 memory_budget_bytes=5000 * pca.PartitionedCohortAnalysis.BYTES_PER_CUSTOMER)
+        assert analysis.read_csv_files() == 10
+        assert analysis.partition_count == 6
+        assert analysis.spilled_customers == len(customers_cohorts.customers_and_matching_cohort)
+        assert analysis.customer_cohorts.cohort_cardinality == customers_cohorts.cohort_cardinality
+        for cohort_key in expected.customer_group_to_order_accumulated:
+            assert analysis.orders_by_time_slot.get_counts_for_cohort(cohort_key) ==\
+                   expected.get_counts_for_cohort(cohort_key)
+        with tempfile.TemporaryDirectory() as directory:
+            expected.write_orders_count_by_cohorts_csv_file(os.path.join(directory, 'expected.csv'))
+            analysis.orders_by_time_slot.write_orders_count_by_cohorts_csv_file(os.path.join(directory, 'merged.csv'))
+            with open(os.path.join(directory, 'expected.csv')) as expected_file, \
+                    open(os.path.join(directory, 'merged.csv')) as merged_file:
+                assert merged_file.read() == expected_file.read()
+        if pca.resource is not None:
+            assert analysis.peak_rss_bytes > 0
+        with pytest.raises(ValueError) as e:
+            pca.PartitionedCohortAnalysis(memory_budget_bytes=0)
+        assert str(e.value).startswith('value for memory_budget_bytes must be a positive integer')
@@ -0,0 +1,77 @@
+import datetime
+import os
+import shutil
+import tempfile
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+from customer_order_cohort.pipeline_metrics import PipelineMetrics
+
+
+class TestPipelineMetrics:
+    def test_rejection_reasons(self):
+        utc_time_zone = datetime.timezone(datetime.timedelta(), name="GMT")
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(
+            recent_date=datetime.datetime(2015, 7, 3, 10, 0, 0, tzinfo=utc_time_zone))
+        assert customers_cohorts.track_customer('1', '2015-07-03 09:00:00') is not None
+        assert customers_cohorts.track_customer('1', '2015-07-02 09:00:00') is None
+        assert customers_cohorts.track_customer(None, '2015-07-02 09:00:00') is None
+        assert customers_cohorts.track_customer('2', '2015-02-30 09:00:00') is None
+        assert customers_cohorts.track_customer('3', 'yesterday') is None
+        assert customers_cohorts.track_customer('4', '2014-07-02 09:00:00') is None
+        assert customers_cohorts.track_customer('5', '2014-07-02 09:00:00') is None
+        assert customers_cohorts.track_customer('6', '2015-07-04 09:00:00') is None
+        assert customers_cohorts.track_customer_batch(['7', '1', '8'], ['2015-13-01 00:00:00', '2015-07-01 00:00:00',
+                                                                        '2015-07-01 00:00:00']) == 1
+        assert dict(customers_cohorts.metrics.rejected_customers) == {
+            PipelineMetrics.DUPLICATE_CUSTOMER_ID: 2, PipelineMetrics.MISSING_CUSTOMER_ID: 1,
+            PipelineMetrics.INVALID_DATE: 3, PipelineMetrics.DATE_OUT_OF_RANGE: 3}
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        assert orders_by_time_slot.metrics is customers_cohorts.metrics
+        assert orders_by_time_slot.track_order('1', '2015-07-03 09:30:00', '1') is not None
+        assert orders_by_time_slot.track_order('9', '2015-07-03 09:30:00', '1') is None
+        assert orders_by_time_slot.track_order('1', '2015-07-04 09:30:00', '2') is None
+        assert orders_by_time_slot.track_order('1', '2015-07-03 25:30:00', '2') is None
+        assert dict(orders_by_time_slot.metrics.rejected_orders) == {
+            PipelineMetrics.UNKNOWN_CUSTOMER_ID: 1, PipelineMetrics.DATE_OUT_OF_RANGE: 1,
+            PipelineMetrics.INVALID_DATE: 1}
+        assert str(orders_by_time_slot.metrics).startswith('Pipeline metrics:')
+        assert '2 duplicate_customer_id' in str(orders_by_time_slot.metrics)
+
+    def test_same_metrics_for_all_readers(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        recent_date = datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone)
+        all_metrics = []
+        with tempfile.TemporaryDirectory() as directory:
+            path_customers_csv_file = shutil.copy('./data/customers.csv', directory)
+            path_orders_csv_file = shutil.copy('./data/orders.csv', directory)
+            for batch_size, workers, columnar_cache in [(None, None, False), (1000, 2, False), (None, None, True),
+                                                        (None, None, True)]:
+                customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date)
+                customers_cohorts.read_customers_csv_file(
+                    path_customers_csv_file, batch_size=batch_size, columnar_cache=columnar_cache)
+                orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+                orders_by_time_slot.read_orders_csv_file(
+                    path_orders_csv_file, workers=workers, columnar_cache=columnar_cache)
+                orders_by_time_slot.write_orders_count_by_cohorts_csv_file(os.path.join(directory, 'ordercounts.csv'))
+                all_metrics.append(orders_by_time_slot.metrics.as_dict())
+        for metrics in all_metrics:
+            assert metrics['rejected_customers'] == all_metrics[0]['rejected_customers']
+            assert metrics['rejected_orders'] == all_metrics[0]['rejected_orders']
+            assert metrics['stages']['customer_read']['rows'] == 25716
+            assert metrics['stages']['order_read']['rows'] == 27575
+            assert metrics['stages']['csv_write']['rows'] == 16
+            assert metrics['stages']['customer_read']['runs'] == 1
+        assert sum(all_metrics[0]['rejected_customers'].values()) == 25716 - 7246
+        assert all_metrics[0]['rejected_orders'][PipelineMetrics.UNKNOWN_CUSTOMER_ID] > 0
+
+    def test_profiling(self):
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=datetime.datetime(2015, 7, 7, 23, 0, 0))
+        assert customers_cohorts.metrics.get_profile_summary() == ''
+        customers_cohorts.metrics.enable_profiling()
+        customers_cohorts.read_customers_csv_file()
+        assert 'track_customer' in customers_cohorts.metrics.get_profile_summary()
+        stages = []
+        customers_cohorts.metrics.stage_hook = lambda stage: stages.append(stage)
+        customers_cohorts.read_customers_csv_file()
+        assert stages == ['customer_read']
+        assert customers_cohorts.metrics.stages['customer_read'].runs == 2
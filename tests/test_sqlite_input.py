@@ -0,0 +1,89 @@
+import pytest
+import datetime
+import os
+import sqlite3
+import tempfile
+from customer_order_cohort import sqlite_input as si
+from customer_order_cohort import customer_time_span_cohorts as ctsc
+from customer_order_cohort import order_time_span_aggregation as otsa
+
+
+class TestSqliteInput:
+    def test_same_as_csv_input(self):
+        pst_time_zone = datetime.timezone(datetime.timedelta(days=-1, seconds=61200), name="PST")
+        recent_date = datetime.datetime(2015, 7, 7, 23, 47, 13, tzinfo=pst_time_zone)
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date)
+        customers_cohorts.read_customers_csv_file('./data/customers.csv')
+        expected = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        expected.read_orders_csv_file('./data/orders.csv')
+        with tempfile.TemporaryDirectory() as directory:
+            path_database = os.path.join(directory, 'cohorts.sqlite')
+            assert si.import_csv_files(path_database, './data/customers.csv', './data/orders.csv') == (25716, 27575)
+            with pytest.raises(sqlite3.Error):
+                si.import_csv_files(path_database, './data/customers.csv', './data/orders.csv')
+            for batch_size in (None, 1000):
+                customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date)
+                customers_cohorts.read_customers_database(path_database, batch_size)
+                orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+                orders_by_time_slot.read_orders_database(path_database)
+                # same customer ordinals, customers are fetched in csv order
+                assert orders_by_time_slot.snapshot_state() == expected.snapshot_state()
+                # only the rows in the date range are fetched
+                assert orders_by_time_slot.metrics.stages['customer_read'].rows == 7246
+                assert orders_by_time_slot.metrics.stages['order_read'].rows < 27575 / 10
+            # dates not zero padded are accepted by the csv readers, and stored in the fixed layout
+            path_customers = os.path.join(directory, 'customers.csv')
+            path_orders = os.path.join(directory, 'orders.csv')
+            with open(path_customers, mode='w') as customers_file:
+                customers_file.write('id,created\n1,2015-7-1 10:00:00\n2,2015-07-02 10:00:00\n')
+            with open(path_orders, mode='w') as orders_file:
+                orders_file.write('id,order_number,user_id,created\n1,1,1,2015-7-3 9:00:00\n2,1,2,not a date\n')
+            connection = sqlite3.connect(':memory:')
+            assert si.import_csv_files(connection, path_customers, path_orders) == (2, 2)
+            assert connection.execute('SELECT created FROM customers').fetchall() == [
+                ('2015-07-01 10:00:00',), ('2015-07-02 10:00:00',)]
+            assert connection.execute('SELECT created FROM orders').fetchall() == [('2015-07-03 09:00:00',), ('not a date',)]
+            connection.close()
+        # integer columns of a relational store, fetched as text like csv values
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE TABLE customers (id INTEGER PRIMARY KEY, created TEXT)')
+        connection.execute('CREATE TABLE orders (id INTEGER, order_number INTEGER, user_id INTEGER, created TEXT)')
+        connection.executemany('INSERT INTO customers VALUES (?, ?)',
+                               [(1, '2015-07-01 10:00:00'), (2, '2015-07-02 10:00:00'), (3, '2014-07-02 10:00:00')])
+        connection.executemany('INSERT INTO orders VALUES (?, ?, ?, ?)',
+                               [(1, 1, 1, '2015-07-03 10:00:00'), (2, 2, 1, '2015-07-04 10:00:00'),
+                                (3, 1, 3, '2015-07-04 10:00:00'), (4, 1, 2, '2014-07-04 10:00:00')])
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date)
+        assert customers_cohorts.read_customers_database(connection) == 1
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        orders_by_time_slot.read_orders_database(connection)
+        assert orders_by_time_slot.get_customer_ids_for_cohort('2015/07/01-2015/07/07') == [[{'1'}, {'1'}]]
+        assert orders_by_time_slot.metrics.stages['order_read'].rows == 2
+        connection.close()
+        # duplicate customer IDs, as in csv files: the orders of a customer are fetched once
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE TABLE customers (id TEXT, created TEXT)')
+        connection.execute('CREATE TABLE orders (id TEXT, order_number TEXT, user_id TEXT, created TEXT)')
+        connection.executemany('INSERT INTO customers VALUES (?, ?)',
+                               [('1', '2015-07-01 10:00:00'), ('1', '2015-07-02 10:00:00'), ('1', '2014-07-02 10:00:00')])
+        connection.executemany('INSERT INTO orders VALUES (?, ?, ?, ?)',
+                               [('1', '1', '1', '2015-07-03 10:00:00'), ('2', '2', '1', '2015-07-04 10:00:00')])
+        customers_cohorts = ctsc.CustomerTimeSpanCohorts(recent_date=recent_date)
+        assert customers_cohorts.read_customers_database(connection) == 1
+        orders_by_time_slot = otsa.OrderTimeSpanAggregation(customer_cohorts=customers_cohorts)
+        orders_by_time_slot.read_orders_database(connection)
+        assert orders_by_time_slot.metrics.stages['order_read'].rows == 2
+        assert dict(customers_cohorts.metrics.rejected_customers) == {'duplicate_customer_id': 1}
+        connection.close()
+        with pytest.raises(TypeError):
+            customers_cohorts.read_customers_database(None)
+
+    def test_normalize_date(self):
+        assert si.normalize_date('2015-07-01 09:00:00') == '2015-07-01 09:00:00'
+        assert si.normalize_date('2015-7-1 9:00:00') == '2015-07-01 09:00:00'
+        # same length as the fixed layout, but sorted as text below '2015-07-01 00:00:00'
+        assert si.normalize_date('2015-07-01  9:00:00') == '2015-07-01 09:00:00'
+        assert si.normalize_date('2015-07-01T09:00:00') == '2015-07-01T09:00:00'
+        # invalid dates are left to the readers
+        assert si.normalize_date('2015-07-01 1\u00b2:00:00') == '2015-07-01 1\u00b2:00:00'
+        assert si.normalize_date('not a date') == 'not a date'